@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+# run from parent directory
+import os
+import sys
+import tripkit_config_itinerum as cfg
+
+sys.path[0] = os.path.abspath(os.path.pardir)
+os.chdir(os.path.pardir)
+# begin
+import logging
+from tripkit import TripKit
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger('itinerum-tripkit').setLevel(level=logging.DEBUG)
+
+
+# guard is required for worker processes to be spawned on Windows
+if __name__ == '__main__':
+    # Edit ./tripkit_config.py first!
+    tripkit = TripKit(config=cfg)
+    tripkit.setup(force=False)
+
+    # -- Detect trips and complete days for all users using every available CPU
+    processed_uuids = tripkit.run_pipeline(['trips', 'complete_days'])
+    print(f"Processed {len(processed_uuids)} users.")
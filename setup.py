@@ -20,8 +20,11 @@ setuptools.setup(
         'pytz>=2019.2',
         'requests>=2.22.0', 
         'scipy>=1.3.1',
-        'utm>=0.5.0',
+        'utm>=0.7.0',
     ],
+    extras_require={
+        'columnar': ['pyarrow'],
+    },
     long_description=long_description,
     long_description_content_type='text/markdown',
     url='https://github.com/TRIP-Lab/itinerum-tripkit',
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Fixtures writing the synthetic survey of `tripkit.benchmarks.synthetic` as Itinerum exports and
+# creating TripKit instances with their cache databases in a temporary directory.
+import csv
+from datetime import datetime, timedelta
+import os
+import types
+import uuid
+
+import pytest
+
+from tripkit import TripKit
+from tripkit.benchmarks.synthetic import generate_survey
+from tripkit.database import DetectedTripCoordinate
+
+
+SURVEY_START = datetime(2019, 3, 25)
+SURVEY_DAYS = 4
+
+COORDINATES_HEADERS = [
+    'uuid',
+    'latitude',
+    'longitude',
+    'altitude',
+    'speed',
+    'direction',
+    'h_accuracy',
+    'v_accuracy',
+    'acceleration_x',
+    'acceleration_y',
+    'acceleration_z',
+    'mode_detected',
+    'point_type',
+    'timestamp_UTC',
+    'timestamp_epoch',
+]
+SURVEY_RESPONSES_HEADERS = [
+    'uuid',
+    'created_at_UTC',
+    'modified_at_UTC',
+    'itinerum_version',
+    'location_home_lat',
+    'location_home_lon',
+    'location_study_lat',
+    'location_study_lon',
+    'location_work_lat',
+    'location_work_lon',
+    'member_type',
+    'model',
+    'os',
+    'os_version',
+    'travel_mode_work',
+    'travel_mode_alt_work',
+    'travel_mode_study',
+    'travel_mode_alt_study',
+]
+PROMPT_RESPONSES_HEADERS = [
+    'uuid',
+    'prompt_uuid',
+    'prompt_num',
+    'response',
+    'latitude',
+    'longitude',
+    'displayed_at_UTC',
+    'displayed_at_epoch',
+    'recorded_at_UTC',
+    'recorded_at_epoch',
+    'edited_at_UTC',
+    'edited_at_epoch',
+]
+CANCELLED_PROMPTS_HEADERS = [
+    'uuid',
+    'prompt_uuid',
+    'latitude',
+    'longitude',
+    'displayed_at_UTC',
+    'displayed_at_epoch',
+    'cancelled_at_UTC',
+    'cancelled_at_epoch',
+    'is_travelling',
+]
+
+
+def _timestamp(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _write_csv(fp, headers, rows):
+    with open(fp, 'w', newline='') as csv_f:
+        writer = csv.writer(csv_f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+
+
+def write_itinerum_export(survey, input_dir, end=None):
+    '''
+    Writes a synthetic survey as the .csv files of an Itinerum export with the survey's subway station
+    entrances, including only the coordinates and prompts before `end` when supplied.
+    '''
+    os.makedirs(input_dir, exist_ok=True)
+    survey_responses_rows, coordinates_rows, prompts_rows, cancelled_prompts_rows = [], [], [], []
+    for user in survey.users:
+        home, work = user.activity_locations[0], user.activity_locations[1]
+        created_at = _timestamp(SURVEY_START - timedelta(days=1))
+        survey_responses_rows.append(
+            [user.uuid, created_at, created_at, '99', home.latitude, home.longitude, '', '']
+            + [work.latitude, work.longitude, 'worker', 'synthetic', 'ios', '12', 'car', '', '', '']
+        )
+        for c in user.coordinates:
+            if end and c.timestamp_UTC >= end:
+                continue
+            coordinates_rows.append(
+                [user.uuid, repr(c.latitude), repr(c.longitude), c.altitude, c.speed, '', c.h_accuracy]
+                + [c.v_accuracy, '', '', '', '', '', _timestamp(c.timestamp_UTC), c.timestamp_epoch]
+            )
+
+        # a prompt at each user's first recorded point of each day and a cancelled prompt at their last
+        by_date = {}
+        for c in user.coordinates:
+            if end and c.timestamp_UTC >= end:
+                continue
+            by_date.setdefault(c.timestamp_UTC.date(), []).append(c)
+        for date, coordinates in sorted(by_date.items()):
+            first, last = coordinates[0], coordinates[-1]
+            prompt_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, f'{user.uuid}-{date}-prompt'))
+            displayed_at = _timestamp(first.timestamp_UTC)
+            prompts_rows.append(
+                [user.uuid, prompt_uuid, 0, '["car"]', first.latitude, first.longitude, displayed_at]
+                + [first.timestamp_epoch, displayed_at, first.timestamp_epoch, displayed_at, first.timestamp_epoch]
+            )
+            cancelled_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, f'{user.uuid}-{date}-cancelled'))
+            cancelled_at = _timestamp(last.timestamp_UTC)
+            cancelled_prompts_rows.append(
+                [user.uuid, cancelled_uuid, last.latitude, last.longitude, cancelled_at, last.timestamp_epoch]
+                + [cancelled_at, last.timestamp_epoch, 1]
+            )
+
+    _write_csv(os.path.join(input_dir, 'survey_responses.csv'), SURVEY_RESPONSES_HEADERS, survey_responses_rows)
+    _write_csv(os.path.join(input_dir, 'coordinates.csv'), COORDINATES_HEADERS, coordinates_rows)
+    _write_csv(os.path.join(input_dir, 'prompt_responses.csv'), PROMPT_RESPONSES_HEADERS, prompts_rows)
+    _write_csv(os.path.join(input_dir, 'cancelled_prompts.csv'), CANCELLED_PROMPTS_HEADERS, cancelled_prompts_rows)
+    _write_csv(
+        os.path.join(input_dir, 'stations.csv'),
+        ['x', 'y'],
+        [[s.longitude, s.latitude] for s in survey.subway_entrances],
+    )
+
+
+def make_config(survey_name, input_dir, **kwargs):
+    config = types.SimpleNamespace(
+        SURVEY_NAME=survey_name,
+        INPUT_DATA_DIR=input_dir,
+        INPUT_DATA_TYPE='itinerum',
+        OUTPUT_DATA_DIR='./output',
+        SUBWAY_STATIONS_FP=os.path.join(input_dir, 'stations.csv'),
+        TRIP_DETECTION_BREAK_INTERVAL_SECONDS=300,
+        TRIP_DETECTION_SUBWAY_BUFFER_METERS=300,
+        TRIP_DETECTION_COLD_START_DISTANCE_METERS=750,
+        TRIP_DETECTION_ACCURACY_CUTOFF_METERS=50,
+        TIMEZONE='America/Montreal',
+        SEMANTIC_LOCATIONS={},
+        ACTIVITY_LOCATION_PROXIMITY_METERS=50,
+        MAP_MATCHING_BIKING_API_URL=None,
+        MAP_MATCHING_DRIVING_API_URL=None,
+        MAP_MATCHING_WALKING_API_URL=None,
+    )
+    for key, value in kwargs.items():
+        setattr(config, key, value)
+    return config
+
+
+def table_rows(tripkit, table, exclude=('id',)):
+    '''
+    Returns the rows of a cache database table without the `exclude` columns, sorted so tables loaded or
+    written in a different order compare equal.
+    '''
+    cursor = tripkit.database.db.execute_sql(f'SELECT * FROM {table};')
+    columns = [d[0] for d in cursor.description]
+    keep = [idx for idx, column in enumerate(columns) if column not in exclude]
+    rows = [tuple(row[idx] for idx in keep) for row in cursor.fetchall()]
+    return sorted(rows, key=repr)
+
+
+def trip_day_summary_rows(tripkit):
+    '''
+    Returns the trip day summaries with their start and end points referenced by trip number and timestamp
+    instead of row id.
+    '''
+    query = '''SELECT s.user_id, s.timezone, s.date, s.has_trips, s.is_complete, s.consecutive_inactive_days,
+                      s.inactivity_streak, sp.trip_num, sp.timestamp_UTC, ep.trip_num, ep.timestamp_UTC
+               FROM detected_trip_day_summaries s
+               LEFT JOIN detected_trip_coordinates sp ON sp.id = s.start_point_id
+               LEFT JOIN detected_trip_coordinates ep ON ep.id = s.end_point_id;'''
+    return sorted(tripkit.database.db.execute_sql(query).fetchall(), key=repr)
+
+
+def trip_rows(tripkit):
+    return table_rows(tripkit, DetectedTripCoordinate._meta.table_name)
+
+
+@pytest.fixture(scope='session')
+def synthetic_survey():
+    return generate_survey(num_users=4, num_days=SURVEY_DAYS, sampling_interval_s=10, start=SURVEY_START, seed=3)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # cache databases are created within the `_temp` directory of the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def export_dir(synthetic_survey, workdir):
+    input_dir = str(workdir / 'export')
+    write_itinerum_export(synthetic_survey, input_dir)
+    return input_dir
+
+
+@pytest.fixture
+def make_tripkit(workdir):
+    def _make_tripkit(survey_name, input_dir, **kwargs):
+        return TripKit(make_config(survey_name, input_dir, **kwargs))
+
+    return _make_tripkit
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Compares the grid-indexed DBSCAN and time-windowed ST-DBSCAN clustering with clustering by measuring the
+# distance between every pair of points.
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from tripkit.benchmarks.synthetic import generate_survey
+from tripkit.process.clustering import dbscan, dbscan_ref, stdbscan
+
+
+class _BruteForceIndex(stdbscan.TimeWindowIndex):
+    # finds the neighbors of a point by scanning every point instead of only those within its time window
+    def region_query(self, p_idx):
+        distances = np.hypot(self.eastings - self.eastings[p_idx], self.northings - self.northings[p_idx])
+        distances /= self.scales[p_idx]
+        within_time = np.abs(self.timestamps - self.timestamps[p_idx]) <= self.eps_s
+        return np.flatnonzero((distances < self.eps_m) & within_time)
+
+
+@pytest.fixture(scope='module')
+def dense_survey():
+    # points recorded each second while walking are dense enough to form clusters
+    return generate_survey(num_users=2, num_days=2, sampling_interval_s=1, seed=0)
+
+
+@pytest.fixture(scope='module')
+def stop_coordinates(dense_survey):
+    # the reference implementation measures the geodesic distance between every pair of points, so the points
+    # at the start of each trip are sampled with sparser points of the rest of the trip
+    coordinates = [c for c in dense_survey.users[0].coordinates if c.timestamp_UTC.day == 25]
+    trip_starts = [0] + [
+        idx
+        for idx in range(1, len(coordinates))
+        if coordinates[idx].timestamp_epoch - coordinates[idx - 1].timestamp_epoch > 60
+    ]
+    sample = []
+    for idx in trip_starts:
+        sample += coordinates[idx : idx + 30] + coordinates[idx + 30 : idx + 300 : 30]
+    return sample
+
+
+def test_grid_dbscan_matches_reference(stop_coordinates):
+    labels = dbscan.run(stop_coordinates)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference_labels = dbscan_ref.run(stop_coordinates)
+
+    assert labels == reference_labels
+    assert max(labels) > 1 and -1 in labels
+
+
+def test_grid_index_neighbors_match_reference(stop_coordinates):
+    index = dbscan.GridIndex(stop_coordinates)
+    for p_idx in range(len(stop_coordinates)):
+        assert index.region_query(p_idx).tolist() == dbscan_ref.region_query(stop_coordinates, p_idx)
+
+
+def test_stdbscan_matches_brute_force(dense_survey):
+    for user in dense_survey.users:
+        labels = stdbscan.run(user.coordinates)
+
+        brute_force_index = _BruteForceIndex(user.coordinates)
+        brute_force_labels = np.zeros(len(brute_force_index), dtype=np.int64)
+        for _ in stdbscan.generate_clusters(brute_force_index, brute_force_labels):
+            pass
+        assert labels == brute_force_labels.tolist()
+        assert max(labels) > 0
+
+
+def test_stdbscan_column_arrays_match_records(dense_survey):
+    coordinates = dense_survey.users[0].coordinates
+    columns = {
+        'latitude': [c.latitude for c in coordinates],
+        'longitude': [c.longitude for c in coordinates],
+        'timestamp_epoch': [c.timestamp_epoch for c in coordinates],
+    }
+    assert stdbscan.run(columns) == stdbscan.run(coordinates)
+
+    stops = list(stdbscan.detect_stops(coordinates))
+    assert [s.cluster_id for s in stops] == list(range(1, max(stdbscan.run(coordinates)) + 1))
+    assert all(s.start_UTC <= s.end_UTC for s in stops)
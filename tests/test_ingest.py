@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Compares the parallel, columnar and append loading of Itinerum exports with loading the .csv files
+# in a single process.
+from datetime import timedelta
+
+import pytest
+
+from tripkit.csvparser import parallel
+from tripkit.database import CancelledPromptResponse, Coordinate, PromptResponse, UserSurveyResponse
+
+from conftest import SURVEY_START, table_rows, write_itinerum_export
+
+
+TABLES = [
+    UserSurveyResponse._meta.table_name,
+    Coordinate._meta.table_name,
+    PromptResponse._meta.table_name,
+    CancelledPromptResponse._meta.table_name,
+]
+
+
+def _loaded_tables(tripkit):
+    return {table: table_rows(tripkit, table) for table in TABLES}
+
+
+@pytest.fixture
+def csv_tables(make_tripkit, export_dir):
+    tripkit = make_tripkit('csv', export_dir)
+    tripkit.setup()
+    tables = _loaded_tables(tripkit)
+    assert all(tables.values())
+    return tables
+
+
+def test_parallel_coordinates_match_csv(make_tripkit, export_dir, csv_tables, monkeypatch):
+    # split the coordinates into small chunks so users span the chunks parsed by different workers
+    split_lines = parallel.split_lines
+    monkeypatch.setattr(parallel, 'split_lines', lambda csv_fp, chunk_bytes: split_lines(csv_fp, 64 << 10))
+    tripkit = make_tripkit('parallel', export_dir)
+    tripkit.setup(workers=2)
+    assert _loaded_tables(tripkit) == csv_tables
+
+
+def test_columnar_exports_match_csv(make_tripkit, export_dir, csv_tables):
+    pytest.importorskip('pyarrow')
+    tripkit = make_tripkit('columnar', export_dir)
+    tripkit.csv.convert_to_parquet(export_dir)
+    tripkit.setup()
+    tables = _loaded_tables(tripkit)
+
+    assert tables.keys() == csv_tables.keys()
+    for table, rows in tables.items():
+        if table == Coordinate._meta.table_name:
+            # floats parsed by pyarrow may differ from Python's parsing in the last digit
+            assert len(rows) == len(csv_tables[table])
+            for row, csv_row in zip(rows, csv_tables[table]):
+                assert row == pytest.approx(csv_row, rel=1e-12)
+        else:
+            assert rows == csv_tables[table]
+
+
+def test_append_export_matches_full_load(synthetic_survey, make_tripkit, workdir, csv_tables):
+    part_dir = str(workdir / 'part')
+    write_itinerum_export(synthetic_survey, part_dir, end=SURVEY_START + timedelta(days=2))
+    tripkit = make_tripkit('append', part_dir)
+    tripkit.setup()
+
+    tripkit.config.INPUT_DATA_DIR = str(workdir / 'export')
+    tripkit.setup(mode='append')
+    assert _loaded_tables(tripkit) == csv_tables
+    assert set(tripkit.database.dirty_users()) == {u.uuid.replace('-', '') for u in synthetic_survey.users}
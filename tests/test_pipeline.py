@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Compares the process pool pipeline runner and incremental trip detection with processing all users in a
+# single process, and checks the processing ledger finds the users whose inputs or parameters changed.
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from tripkit import pipeline
+from tripkit.process.complete_days.triplab import counter
+from tripkit.process.trip_detection.triplab.v2 import algorithm as v2
+
+from conftest import SURVEY_START, trip_day_summary_rows, trip_rows, write_itinerum_export
+
+
+STAGES = ['trips', 'complete_days']
+# local midnight within the survey area so no trips are split between the partial and full exports
+PART_END = SURVEY_START + timedelta(days=2, hours=5)
+
+
+def _hex(uuids):
+    return sorted(str(u).replace('-', '') for u in uuids)
+
+
+@pytest.fixture
+def single_process_outputs(make_tripkit, export_dir):
+    tripkit = make_tripkit('single', export_dir)
+    tripkit.setup()
+    processed = tripkit.run_pipeline(STAGES, workers=1)
+    outputs = (_hex(processed), trip_rows(tripkit), trip_day_summary_rows(tripkit))
+    assert all(outputs)
+
+    # the start point of each day with trips references the first saved trip point of that local date
+    tz = pytz.timezone(tripkit.config.TIMEZONE)
+    for _, _, date, has_trips, _, _, _, _, start_timestamp, _, _ in outputs[2]:
+        if has_trips:
+            start_UTC = pytz.utc.localize(datetime.strptime(start_timestamp[:19], '%Y-%m-%d %H:%M:%S'))
+            assert str(start_UTC.astimezone(tz).date()) == date
+    return outputs
+
+
+def test_process_pool_matches_single_process(make_tripkit, export_dir, single_process_outputs):
+    tripkit = make_tripkit('pool', export_dir)
+    tripkit.setup()
+    processed = tripkit.run_pipeline(STAGES, workers=2)
+    assert (_hex(processed), trip_rows(tripkit), trip_day_summary_rows(tripkit)) == single_process_outputs
+
+
+def test_ledger_finds_users_needing_processing(synthetic_survey, make_tripkit, export_dir):
+    tripkit = make_tripkit('ledger', export_dir)
+    tripkit.setup()
+    user_ids = _hex(u.uuid for u in synthetic_survey.users)
+    trips_parameters = pipeline.STAGE_PARAMETERS['trips'](tripkit)
+    complete_days_parameters = pipeline.STAGE_PARAMETERS['complete_days'](tripkit)
+    assert tripkit.users_needing_processing(v2, trips_parameters) == user_ids
+
+    tripkit.run_pipeline(STAGES, workers=1)
+    assert tripkit.users_needing_processing(v2, trips_parameters) == []
+    assert tripkit.users_needing_processing(counter, complete_days_parameters) == []
+
+    # changed parameters require processing all users again
+    changed_parameters = dict(trips_parameters, break_interval_seconds=360)
+    assert tripkit.users_needing_processing(v2, changed_parameters) == user_ids
+
+    # users marked dirty need processing by each stage, with the stages depending on the trips of a user
+    # needing processing once their trips are detected again
+    dirty_user_id = user_ids[0]
+    tripkit.database.mark_dirty_users([dirty_user_id])
+    assert tripkit.users_needing_processing(v2, trips_parameters) == [dirty_user_id]
+    assert tripkit.users_needing_processing(counter, complete_days_parameters) == [dirty_user_id]
+    tripkit.run_pipeline(['trips'], workers=1, uuids=[dirty_user_id])
+    assert tripkit.users_needing_processing(v2, trips_parameters) == []
+    assert tripkit.users_needing_processing(counter, complete_days_parameters) == [dirty_user_id]
+    tripkit.run_pipeline(['complete_days'], workers=1, uuids=[dirty_user_id])
+    assert tripkit.users_needing_processing(counter, complete_days_parameters) == []
+
+
+def test_incremental_detection_matches_full_detection(
+    synthetic_survey, make_tripkit, workdir, export_dir, single_process_outputs, monkeypatch
+):
+    resumed = []
+    run_incremental = v2.run_incremental
+
+    def _run_incremental(*args, **kwargs):
+        result = run_incremental(*args, **kwargs)
+        resumed.append(result is not None)
+        return result
+
+    monkeypatch.setattr(v2, 'run_incremental', _run_incremental)
+
+    part_dir = str(workdir / 'part')
+    write_itinerum_export(synthetic_survey, part_dir, end=PART_END)
+    tripkit = make_tripkit('incremental', part_dir)
+    tripkit.setup()
+    tripkit.run_pipeline(STAGES, workers=1)
+
+    tripkit.config.INPUT_DATA_DIR = export_dir
+    tripkit.setup(mode='append')
+    trips_parameters = pipeline.STAGE_PARAMETERS['trips'](tripkit)
+    uuids = tripkit.users_needing_processing(v2, trips_parameters)
+    assert uuids == _hex(u.uuid for u in synthetic_survey.users)
+
+    processed = tripkit.run_pipeline(['trips_incremental', 'complete_days'], workers=1, uuids=uuids)
+    assert any(resumed)
+    assert (_hex(processed), trip_rows(tripkit), trip_day_summary_rows(tripkit)) == single_process_outputs
+    assert tripkit.users_needing_processing(v2, trips_parameters) == []
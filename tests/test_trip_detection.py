@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Compares the vectorized point preprocessing and column array inputs of TRIP Lab v2 trip detection with
+# detecting trips point by point from coordinate records.
+from tripkit import pipeline
+from tripkit.benchmarks.runner import TRIP_DETECTION_PARAMETERS
+from tripkit.cache import FeatureCache
+from tripkit.models import TripPoint
+from tripkit.process.trip_detection.triplab.v2 import algorithm as v2
+
+
+def _trips(trips):
+    return [
+        (trip.num, trip.trip_code, [tuple(getattr(p, name) for name in TripPoint.__slots__) for p in trip.points])
+        for trip in trips
+    ]
+
+
+def test_vectorized_preprocessing_matches_point_by_point(synthetic_survey):
+    parameters = dict(TRIP_DETECTION_PARAMETERS, subway_entrances=synthetic_survey.subway_entrances)
+    for user in synthetic_survey.users:
+        trips = v2.run(user.coordinates, parameters, feature_cache=FeatureCache())
+        vectorized_trips = v2.run(
+            user.coordinates, dict(parameters, vectorized_preprocessing=True), feature_cache=FeatureCache()
+        )
+        assert trips
+        assert _trips(vectorized_trips) == _trips(trips)
+
+
+def test_column_arrays_match_coordinate_records(make_tripkit, export_dir):
+    tripkit = make_tripkit('arrays', export_dir)
+    tripkit.setup()
+    parameters = pipeline.STAGE_PARAMETERS['trips'](tripkit)
+    for user in tripkit.iter_users(load_trips=False):
+        trips = v2.run(user.coordinates, parameters)
+        columns = tripkit.database.load_coordinates_array(user.uuid)
+        assert trips
+        assert _trips(v2.run(columns, parameters)) == _trips(trips)
+        assert _trips(v2.run(columns, dict(parameters, vectorized_preprocessing=True))) == _trips(trips)
@@ -0,0 +1,3 @@
+from . import synthetic
+from .runner import ALGORITHMS, run, run_case, write_json
+from .synthetic import generate_survey
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Command line interface for the trip detection benchmarks:
+#   python -m tripkit.benchmarks --algorithms triplab.v2 canue --sizes 1 7 28 --output benchmarks.json
+import argparse
+import json
+import logging
+
+from .runner import ALGORITHMS, DEFAULT_SIZES, run, write_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the trip detection algorithms on synthetic GPS traces.')
+    parser.add_argument('--algorithms', nargs='+', choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help='Days of travel per user')
+    parser.add_argument('--users', type=int, default=1, help='Number of users per survey')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case, the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic trace generator')
+    parser.add_argument('--sampling-interval', type=int, default=5, help='Seconds between recorded points')
+    parser.add_argument('--output', help='Filepath of the JSON results, printed when omitted')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('itinerum-tripkit').setLevel(logging.WARNING)
+    logging.getLogger('itinerum-tripkit.benchmarks').setLevel(logging.INFO)
+    results = run(
+        algorithms=args.algorithms,
+        sizes=args.sizes,
+        num_users=args.users,
+        repeat=args.repeat,
+        seed=args.seed,
+        survey_options={'sampling_interval_s': args.sampling_interval},
+    )
+    if args.output:
+        write_json(results, args.output)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+# guard is required for worker processes to be spawned
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Times the trip detection algorithms on synthetic surveys of increasing size. Each benchmark case runs
+# within a fresh worker process so its peak resident memory is measured independently of other cases.
+from datetime import datetime
+import gc
+import json
+import logging
+import multiprocessing
+import platform
+import time
+
+from tripkit.process.canue import preprocess as canue_preprocess
+from tripkit.process.trip_detection.canue import algorithm as canue_algorithm
+from tripkit.process.trip_detection.triplab.legacy import algorithm as legacy_algorithm
+from tripkit.process.trip_detection.triplab.v1 import algorithm as v1_algorithm
+from tripkit.process.trip_detection.triplab.v2 import algorithm as v2_algorithm
+from .synthetic import generate_survey
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+logger = logging.getLogger('itinerum-tripkit.benchmarks.runner')
+
+ALGORITHMS = ['triplab.v1', 'triplab.v2', 'triplab.legacy', 'canue']
+DEFAULT_SIZES = [1, 7, 28]
+TRIP_DETECTION_PARAMETERS = {
+    'break_interval_seconds': 300,
+    'subway_buffer_meters': 300,
+    'cold_start_distance': 750,
+    'accuracy_cutoff_meters': 50,
+}
+
+
+class _CanueConfig(object):
+    TRIP_DETECTION_BREAK_INTERVAL_SECONDS = TRIP_DETECTION_PARAMETERS['break_interval_seconds']
+
+
+class _CoordinatesQuery(list):
+    # CANUE preprocessing counts the coordinates of a peewee query
+    def count(self):
+        return len(self)
+
+
+def _point_dict(c, timestamp_key):
+    return {
+        'id': c.id,
+        'latitude': c.latitude,
+        'longitude': c.longitude,
+        'speed': c.speed,
+        'h_accuracy': c.h_accuracy,
+        'v_accuracy': c.v_accuracy,
+        timestamp_key: c.timestamp_UTC,
+    }
+
+
+class _QstarzCoordinate(object):
+    # QStarz coordinates are read from the cache database with ISO 8601 timestamp strings
+    __slots__ = ['uuid', 'latitude', 'longitude', 'altitude', 'speed', 'timestamp_UTC', 'timestamp_epoch']
+
+    def __init__(self, c):
+        self.uuid = c.uuid
+        self.latitude = c.latitude
+        self.longitude = c.longitude
+        self.altitude = c.altitude
+        self.speed = c.speed
+        self.timestamp_UTC = c.timestamp_UTC.isoformat()
+        self.timestamp_epoch = c.timestamp_epoch
+
+
+def prepare_inputs(algorithm, survey):
+    '''
+    Returns a function creating the inputs of each user for an algorithm and a function running the
+    algorithm on them. Inputs are created before timing since some algorithms modify them in place.
+
+    :param algorithm: The name of the algorithm from `ALGORITHMS`
+    :param survey:    The synthetic survey to process
+
+    :type survey:     :py:class:`tripkit.benchmarks.synthetic.SyntheticSurvey`
+    '''
+    if algorithm == 'triplab.v1':
+        parameters = dict(TRIP_DETECTION_PARAMETERS, subway_stations=survey.subway_entrances)
+
+        def _inputs(user):
+            return [_point_dict(c, 'timestamp_UTC') for c in user.coordinates]
+
+        def _run(points):
+            return v1_algorithm.run(points, parameters)
+
+    elif algorithm == 'triplab.v2':
+        parameters = dict(TRIP_DETECTION_PARAMETERS, subway_entrances=survey.subway_entrances)
+
+        def _inputs(user):
+            return user.coordinates
+
+        def _run(coordinates):
+            return v2_algorithm.run(coordinates, parameters)
+
+    elif algorithm == 'triplab.legacy':
+
+        def _inputs(user):
+            return [_point_dict(c, 'timestamp') for c in user.coordinates]
+
+        def _run(points):
+            return legacy_algorithm.run(TRIP_DETECTION_PARAMETERS, survey.subway_entrances, points)
+
+    elif algorithm == 'canue':
+
+        def _inputs(user):
+            coordinates = _CoordinatesQuery(_QstarzCoordinate(c) for c in user.coordinates)
+            return canue_preprocess.run(user.uuid, coordinates), user.activity_locations
+
+        def _run(inputs):
+            coordinates, locations = inputs
+            return canue_algorithm.run(_CanueConfig, coordinates, locations)
+
+    else:
+        raise Exception(f"Benchmark algorithm not recognized: {algorithm} Valid options: {ALGORITHMS}")
+    return _inputs, _run
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes on Linux and bytes on macOS
+    if platform.system() == 'Darwin':
+        return peak_rss
+    return peak_rss * 1024
+
+
+def run_case(algorithm, num_days, num_users=1, repeat=3, seed=0, survey_options=None):
+    '''
+    Times an algorithm on a synthetic survey within the current process and returns the result
+    as a dictionary.
+
+    :param algorithm:      The name of the algorithm from `ALGORITHMS`
+    :param num_days:       Number of days of travel for each user
+    :param num_users:      Number of users within the survey
+    :param repeat:         Number of timed runs, the fastest of which is reported
+    :param seed:           Seed of the synthetic survey generator
+    :param survey_options: Additional keyword arguments for
+                           :py:func:`tripkit.benchmarks.synthetic.generate_survey`
+
+    :type num_users:       int, optional
+    :type repeat:          int, optional
+    :type seed:            int, optional
+    :type survey_options:  dict, optional
+    '''
+    survey = generate_survey(num_users=num_users, num_days=num_days, seed=seed, **(survey_options or {}))
+    make_inputs, run_algorithm = prepare_inputs(algorithm, survey)
+    baseline_rss = _peak_rss_bytes()
+
+    durations = []
+    for _ in range(repeat):
+        inputs = [make_inputs(user) for user in survey.users]
+        gc.collect()
+        start = time.perf_counter()
+        for user_inputs in inputs:
+            run_algorithm(user_inputs)
+        durations.append(time.perf_counter() - start)
+
+    best = min(durations)
+    num_points = survey.num_coordinates
+    return {
+        'algorithm': algorithm,
+        'num_users': num_users,
+        'num_days': num_days,
+        'num_points': num_points,
+        'repeat': repeat,
+        'best_s': best,
+        'mean_s': sum(durations) / len(durations),
+        'points_per_second': num_points / best if best else None,
+        'baseline_rss_bytes': baseline_rss,
+        'peak_rss_bytes': _peak_rss_bytes(),
+    }
+
+
+def _run_case_args(kwargs):
+    # silence the algorithms' per-user logging within worker processes
+    logging.getLogger('itinerum-tripkit').setLevel(logging.WARNING)
+    return run_case(**kwargs)
+
+
+def run(algorithms=None, sizes=None, num_users=1, repeat=3, seed=0, survey_options=None, isolate=True):
+    '''
+    Benchmarks the trip detection algorithms on synthetic surveys of each size and returns the
+    results as a dictionary that can be serialized as JSON.
+
+    :param algorithms:     Names of the algorithms to benchmark, defaults to all of `ALGORITHMS`
+    :param sizes:          Number of days of travel for each user of each benchmarked survey
+    :param num_users:      Number of users within each survey
+    :param repeat:         Number of timed runs for each case, the fastest of which is reported
+    :param seed:           Seed of the synthetic survey generator
+    :param survey_options: Additional keyword arguments for
+                           :py:func:`tripkit.benchmarks.synthetic.generate_survey`
+    :param isolate:        Supply `False` to run all cases within the current process, in which case
+                           peak memory is not comparable between cases
+
+    :type algorithms:      list, optional
+    :type sizes:           list of int, optional
+    :type num_users:       int, optional
+    :type repeat:          int, optional
+    :type seed:            int, optional
+    :type survey_options:  dict, optional
+    :type isolate:         boolean, optional
+    '''
+    algorithms = algorithms or ALGORITHMS
+    for algorithm in algorithms:
+        if algorithm not in ALGORITHMS:
+            raise Exception(f"Benchmark algorithm not recognized: {algorithm} Valid options: {ALGORITHMS}")
+    sizes = sizes or DEFAULT_SIZES
+
+    results = []
+    for num_days in sizes:
+        for algorithm in algorithms:
+            kwargs = {
+                'algorithm': algorithm,
+                'num_days': num_days,
+                'num_users': num_users,
+                'repeat': repeat,
+                'seed': seed,
+                'survey_options': survey_options,
+            }
+            logger.info(f"Benchmarking {algorithm} with {num_users} users over {num_days} days...")
+            if isolate:
+                # a new process for each case so peak memory usage is not carried over
+                context = multiprocessing.get_context('spawn')
+                with context.Pool(processes=1, maxtasksperchild=1) as pool:
+                    result = pool.apply(_run_case_args, (kwargs,))
+            else:
+                result = run_case(**kwargs)
+            logger.info(f"{algorithm}: {result['points_per_second']:.0f} points/s ({result['num_points']} points)")
+            results.append(result)
+
+    return {
+        'created_at_UTC': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'num_users': num_users,
+            'sizes': sizes,
+            'repeat': repeat,
+            'seed': seed,
+            'survey_options': survey_options or {},
+            'trip_detection': TRIP_DETECTION_PARAMETERS,
+        },
+        'results': results,
+    }
+
+
+def write_json(results, fp):
+    '''
+    Writes benchmark results to a JSON file.
+    '''
+    with open(fp, 'w') as json_f:
+        json.dump(results, json_f, indent=2)
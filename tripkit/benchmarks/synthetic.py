@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Deterministic synthetic GPS traces for benchmarking the trip detection algorithms. Users commute
+# between home, work and errand locations each day by walking, driving or subway with collection
+# pauses while stationary, as recorded by the Itinerum mobile app.
+from datetime import datetime, timedelta
+import math
+import random
+import uuid
+
+from tripkit.models import ActivityLocation
+from tripkit.utils import geo
+
+
+# survey area center (Montréal)
+CENTER_LATITUDE = 45.5017
+CENTER_LONGITUDE = -73.5673
+METERS_PER_DEGREE = 111320.0
+
+WALKING_SPEED_MS = 1.4
+DRIVING_SPEED_MS = 11.0
+SUBWAY_SPEED_MS = 10.0
+MIN_DRIVING_DISTANCE_M = 1500.0
+
+
+class SyntheticCoordinate(object):
+    '''
+    A generated GPS point with the attributes of a :py:class:`tripkit.database.Coordinate` record.
+    '''
+
+    __slots__ = [
+        'id',
+        'uuid',
+        'latitude',
+        'longitude',
+        'altitude',
+        'speed',
+        'h_accuracy',
+        'v_accuracy',
+        'timestamp_UTC',
+        'timestamp_epoch',
+    ]
+
+    def __init__(self, id, uuid, latitude, longitude, altitude, speed, h_accuracy, v_accuracy, timestamp_UTC):
+        self.id = id
+        self.uuid = uuid
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.speed = speed
+        self.h_accuracy = h_accuracy
+        self.v_accuracy = v_accuracy
+        self.timestamp_UTC = timestamp_UTC
+        self.timestamp_epoch = int((timestamp_UTC - datetime(1970, 1, 1)).total_seconds())
+
+    def __repr__(self):
+        return f"<tripkit.benchmarks.synthetic.SyntheticCoordinate id={self.id}>"
+
+
+class SyntheticStation(object):
+    '''
+    A generated subway station entrance with the attributes of a
+    :py:class:`tripkit.database.SubwayStationEntrance` record.
+    '''
+
+    __slots__ = ['latitude', 'longitude']
+
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __getitem__(self, key):
+        # the legacy algorithm reads station entrances as dictionaries
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"<tripkit.benchmarks.synthetic.SyntheticStation>"
+
+
+class SyntheticUser(object):
+    '''
+    A generated survey participant.
+
+    :ivar uuid:                The user's generated UUID.
+    :ivar coordinates:         The timestamp-ordered GPS points of the user's trace.
+    :ivar activity_locations:  The user's home, work and errand locations.
+    '''
+
+    def __init__(self, uuid, coordinates, activity_locations):
+        self.uuid = uuid
+        self.coordinates = coordinates
+        self.activity_locations = activity_locations
+
+    def __repr__(self):
+        return f"<tripkit.benchmarks.synthetic.SyntheticUser uuid={self.uuid} coordinates={len(self.coordinates)}>"
+
+
+class SyntheticSurvey(object):
+    '''
+    Generated survey participants and the subway station entrances of the survey area.
+    '''
+
+    def __init__(self, users, subway_entrances):
+        self.users = users
+        self.subway_entrances = subway_entrances
+
+    @property
+    def num_coordinates(self):
+        return sum(len(u.coordinates) for u in self.users)
+
+    def __repr__(self):
+        return f"<tripkit.benchmarks.synthetic.SyntheticSurvey users={len(self.users)}>"
+
+
+def _offset(position, east_m, north_m):
+    latitude, longitude = position
+    return (
+        latitude + north_m / METERS_PER_DEGREE,
+        longitude + east_m / (METERS_PER_DEGREE * math.cos(math.radians(latitude))),
+    )
+
+
+def _distance_m(position1, position2):
+    latitude = math.radians((position1[0] + position2[0]) / 2)
+    north_m = (position2[0] - position1[0]) * METERS_PER_DEGREE
+    east_m = (position2[1] - position1[1]) * METERS_PER_DEGREE * math.cos(latitude)
+    return math.sqrt(east_m ** 2 + north_m ** 2)
+
+
+def _interpolate(position1, position2, fraction):
+    return (
+        position1[0] + (position2[0] - position1[0]) * fraction,
+        position1[1] + (position2[1] - position1[1]) * fraction,
+    )
+
+
+def generate_subway_entrances(num_stations=12, spacing_m=1000.0):
+    '''
+    Returns the entrances of a straight east-west subway line through the survey area center.
+    '''
+    first_m = -spacing_m * (num_stations - 1) / 2
+    return [
+        SyntheticStation(*_offset((CENTER_LATITUDE, CENTER_LONGITUDE), first_m + idx * spacing_m, 0.0))
+        for idx in range(num_stations)
+    ]
+
+
+class _TraceGenerator(object):
+    # records the GPS points of a single user's trips
+    def __init__(
+        self, rng, user_uuid, first_id, sampling_interval_s, noise_m, outlier_probability, poor_accuracy_probability
+    ):
+        self.rng = rng
+        self.uuid = user_uuid
+        self.next_id = first_id
+        self.sampling_interval_s = sampling_interval_s
+        self.noise_m = noise_m
+        self.outlier_probability = outlier_probability
+        self.poor_accuracy_probability = poor_accuracy_probability
+        self.coordinates = []
+
+    def _record(self, position, speed, timestamp):
+        rng = self.rng
+        position = _offset(position, rng.gauss(0.0, self.noise_m), rng.gauss(0.0, self.noise_m))
+        h_accuracy = max(3.0, abs(rng.gauss(self.noise_m, self.noise_m / 2)))
+        if rng.random() < self.poor_accuracy_probability:
+            h_accuracy = rng.uniform(60.0, 200.0)
+        if rng.random() < self.outlier_probability:
+            bearing = rng.uniform(0, 2 * math.pi)
+            jump_m = rng.uniform(300.0, 800.0)
+            position = _offset(position, math.cos(bearing) * jump_m, math.sin(bearing) * jump_m)
+        self.coordinates.append(
+            SyntheticCoordinate(
+                id=self.next_id,
+                uuid=self.uuid,
+                latitude=position[0],
+                longitude=position[1],
+                altitude=30.0 + rng.gauss(0.0, 2.0),
+                speed=max(0.0, speed + rng.gauss(0.0, 0.5)),
+                h_accuracy=h_accuracy,
+                v_accuracy=h_accuracy * 1.5,
+                timestamp_UTC=timestamp,
+            )
+        )
+        self.next_id += 1
+
+    def move(self, origin, destination, speed, timestamp, skip_m=0.0):
+        '''
+        Records points travelling in a straight line from the origin to the destination, skipping the
+        points within the first `skip_m` meters, and returns the time of the next point to follow.
+        '''
+        distance = _distance_m(origin, destination)
+        duration_s = max(1, int(distance / speed))
+        elapsed_s = 0
+        while elapsed_s <= duration_s:
+            fraction = elapsed_s / duration_s
+            if fraction * distance >= skip_m:
+                position = _interpolate(origin, destination, fraction)
+                self._record(position, speed, timestamp + timedelta(seconds=elapsed_s))
+            elapsed_s += self.sampling_interval_s + self.rng.choice([0, 0, 1])
+        return timestamp + timedelta(seconds=elapsed_s)
+
+
+def _nearest_station(position, stations):
+    return min(stations, key=lambda s: _distance_m(position, (s.latitude, s.longitude)))
+
+
+def _trip(trace, origin, destination, timestamp, stations, subway_probability, cold_start_probability):
+    # records a single trip with a subway ride (recorded as a gap in the trace), by driving or by walking
+    rng = trace.rng
+    skip_m = rng.uniform(800.0, 1500.0) if rng.random() < cold_start_probability else 0.0
+    distance = _distance_m(origin, destination)
+    origin_station = _nearest_station(origin, stations)
+    destination_station = _nearest_station(destination, stations)
+    if origin_station is not destination_station and rng.random() < subway_probability:
+        entrance = (origin_station.latitude, origin_station.longitude)
+        exit = (destination_station.latitude, destination_station.longitude)
+        timestamp = trace.move(origin, entrance, WALKING_SPEED_MS, timestamp, skip_m=skip_m)
+        timestamp += timedelta(seconds=int(_distance_m(entrance, exit) / SUBWAY_SPEED_MS) + rng.randint(60, 300))
+        return trace.move(exit, destination, WALKING_SPEED_MS, timestamp)
+    speed = DRIVING_SPEED_MS if distance >= MIN_DRIVING_DISTANCE_M else WALKING_SPEED_MS
+    waypoint = _offset(_interpolate(origin, destination, 0.5), rng.uniform(-300, 300), rng.uniform(-300, 300))
+    timestamp = trace.move(origin, waypoint, speed, timestamp, skip_m=skip_m)
+    return trace.move(waypoint, destination, speed, timestamp)
+
+
+def generate_survey(
+    num_users=1,
+    num_days=1,
+    sampling_interval_s=5,
+    subway_probability=0.3,
+    cold_start_probability=0.2,
+    noise_m=5.0,
+    outlier_probability=0.01,
+    poor_accuracy_probability=0.05,
+    start=datetime(2019, 3, 25),
+    seed=0,
+):
+    '''
+    Generates a synthetic survey of users commuting between home and work each day with lunchtime
+    errands. Stationary periods are recorded as collection pauses, subway rides as gaps between the
+    station entrances and cold starts as trips missing their first points. The same arguments always
+    generate the same survey.
+
+    :param num_users:                 Number of users to generate.
+    :param num_days:                  Number of days of travel for each user.
+    :param sampling_interval_s:       Seconds between recorded points while travelling.
+    :param subway_probability:        Probability a trip between different subway stations is by subway.
+    :param cold_start_probability:    Probability a trip's first 800-1500 meters are not recorded.
+    :param noise_m:                   Standard deviation of the position noise in meters.
+    :param outlier_probability:       Probability a point is displaced by 300-800 meters.
+    :param poor_accuracy_probability: Probability a point reports a horizontal accuracy worse than 60 meters.
+    :param start:                     Naive UTC datetime of the first survey day.
+    :param seed:                      Seed of the random number generator.
+
+    :type num_users:                  int, optional
+    :type num_days:                   int, optional
+    :type sampling_interval_s:        int, optional
+    :type subway_probability:         float, optional
+    :type cold_start_probability:     float, optional
+    :type noise_m:                    float, optional
+    :type outlier_probability:        float, optional
+    :type poor_accuracy_probability:  float, optional
+    :type start:                      datetime, optional
+    :type seed:                       int, optional
+
+    :rtype: :py:class:`tripkit.benchmarks.synthetic.SyntheticSurvey`
+    '''
+    stations = generate_subway_entrances()
+    center = (CENTER_LATITUDE, CENTER_LONGITUDE)
+    users = []
+    next_id = 1
+    for user_idx in range(num_users):
+        rng = random.Random(f'{seed}-{user_idx}')
+        user_uuid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        home = _offset(center, rng.uniform(-6000, 6000), rng.uniform(-4000, 4000))
+        work = _offset(center, rng.uniform(-3000, 3000), rng.uniform(-1500, 1500))
+        errand = _offset(work, rng.uniform(-1200, 1200), rng.uniform(-1200, 1200))
+
+        trace = _TraceGenerator(
+            rng, user_uuid, next_id, sampling_interval_s, noise_m, outlier_probability, poor_accuracy_probability
+        )
+        for day in range(num_days):
+            # times are offset 5 hours from UTC to local time in the survey area
+            midnight = start + timedelta(days=day, hours=5)
+            departure = midnight + timedelta(hours=7, minutes=30, seconds=rng.randint(0, 3600))
+            arrival = _trip(trace, home, work, departure, stations, subway_probability, cold_start_probability)
+            if rng.random() < 0.5:
+                departure = max(midnight + timedelta(hours=12), arrival + timedelta(minutes=30))
+                arrival = _trip(trace, work, errand, departure, stations, 0.0, cold_start_probability)
+                departure = arrival + timedelta(minutes=rng.randint(20, 60))
+                arrival = _trip(trace, errand, work, departure, stations, 0.0, cold_start_probability)
+            departure = max(
+                midnight + timedelta(hours=17, seconds=rng.randint(0, 5400)), arrival + timedelta(minutes=30)
+            )
+            _trip(trace, work, home, departure, stations, subway_probability, cold_start_probability)
+        next_id = trace.next_id
+
+        locations = []
+        for label, position in [('home', home), ('work', work), ('errand', errand)]:
+            locations.append(ActivityLocation(label=label, latitude=position[0], longitude=position[1]))
+        if trace.coordinates:
+            # project the locations within the UTM zone of the user's first point as for their coordinates
+            first = trace.coordinates[0]
+            _, _, zone_num, zone_letter = geo.project_utm([first.latitude], [first.longitude])
+            eastings, northings, _, _ = geo.project_utm(
+                [l.latitude for l in locations], [l.longitude for l in locations], zone_num, zone_letter
+            )
+            for location, easting, northing in zip(locations, eastings.tolist(), northings.tolist()):
+                location.easting, location.northing = easting, northing
+                location.zone_num, location.zone_letter = zone_num, zone_letter
+        users.append(SyntheticUser(user_uuid, trace.coordinates, locations))
+    return SyntheticSurvey(users, stations)
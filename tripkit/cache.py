@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Caches features derived from the survey-wide data in the cache database (such as projected subway
+# entrances and route shapes) so they are built once per survey instead of once per user.
+from collections import OrderedDict
+import logging
+import os
+import pickle
+
+from . import metrics
+from .utils.misc import parameters_hash
+
+logger = logging.getLogger('itinerum-tripkit.cache')
+
+# process-wide cache used by algorithms when a feature cache is not supplied explicitly
+_default_cache = None
+# number of features objects to remember the fingerprints of
+FINGERPRINTS_MAXSIZE = 8
+
+
+def features_fingerprint(features):
+    '''
+    Returns the number of survey-wide features (e.g., subway entrances) with a hash of their latitudes and
+    longitudes to key the features derived from them.
+    '''
+    return len(features), parameters_hash(features)
+
+
+class FeatureCache(object):
+    '''
+    Least-recently-used cache of processing features with an optional on-disk pickle. Keys are
+    supplied as lists (e.g., ``['subway_entrances', 'algo.v2']``). New features are written to the
+    on-disk pickle by :py:meth:`save` once they are built and the pickle is only reused while the key
+    of the source data returned by `source_key` is unchanged.
+
+    :param maxsize:    Maximum number of features to hold in memory
+    :param path:       Filepath of the on-disk pickle, omit to keep features in memory only
+    :param source_key: Function returning a key of the data the features are derived from (e.g., a hash of
+                       the subway entrances table's contents)
+
+    :type maxsize:     integer, optional
+    :type path:        str, optional
+    :type source_key:  function, optional
+    '''
+
+    def __init__(self, maxsize=128, path=None, source_key=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.source_key = source_key
+        self._entries = OrderedDict()
+        self._disk_loaded = False
+        self._unsaved = False
+        self._fingerprints = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"<tripkit.cache.FeatureCache entries={len(self._entries)} path={self.path}>"
+
+    def _source_key(self):
+        if self.source_key:
+            return self.source_key()
+
+    def _read_disk(self):
+        # returns the features of the on-disk pickle when it is for the current source data
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as pickle_f:
+                stored = pickle.load(pickle_f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            logger.warning(f"Feature cache could not be read from {self.path}: {e}")
+            return {}
+        if stored.get('source_key') != self._source_key():
+            logger.info("Feature cache on disk is outdated, ignored.")
+            return {}
+        return stored['entries']
+
+    def _load_disk(self):
+        self._disk_loaded = True
+        for key, value in self._read_disk().items():
+            self._entries.setdefault(key, value)
+        self._trim()
+
+    def _save_disk(self):
+        # the pickle is replaced atomically so processes sharing the cache never read a partially written file
+        stored = {'source_key': self._source_key(), 'entries': dict(self._entries)}
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'wb') as pickle_f:
+                pickle.dump(stored, pickle_f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"Feature cache could not be written to {self.path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _trim(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, keys):
+        '''
+        Returns the cached feature for the given keys or `None` if it has not been cached.
+
+        :param keys: Parts of the feature's cache key
+
+        :type keys:  list
+        '''
+        key = tuple(keys)
+        if key not in self._entries and self.path and not self._disk_loaded:
+            self._load_disk()
+        if key not in self._entries:
+            metrics.FEATURE_CACHE_REQUESTS.inc(result='miss')
+            return None
+        metrics.FEATURE_CACHE_REQUESTS.inc(result='hit')
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, keys, value):
+        '''
+        Caches a feature for the given keys, evicting the least recently used feature when full.
+
+        :param keys:  Parts of the feature's cache key
+        :param value: The feature to cache
+
+        :type keys:   list
+        '''
+        key = tuple(keys)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._trim()
+        self._unsaved = True
+
+    def save(self):
+        '''
+        Writes the cached features to the on-disk pickle when features have been set since it was last
+        written. The pickle is re-read first so features saved by other processes in the meantime are
+        kept, with this process's features replacing any saved under the same keys.
+        '''
+        if not self.path or not self._unsaved:
+            return
+        # features only found on disk are merged as the least recently used
+        entries = OrderedDict((key, value) for key, value in self._read_disk().items() if key not in self._entries)
+        entries.update(self._entries)
+        self._entries = entries
+        self._disk_loaded = True
+        self._trim()
+        self._save_disk()
+        self._unsaved = False
+
+    def fingerprint(self, features, fingerprint_func=None):
+        '''
+        Returns the fingerprint of survey-wide features to key the features derived from them. Fingerprints
+        are remembered for each features object (e.g., the subway entrances supplied with the parameters of
+        every user) so the features are only hashed once, and are expected to be unchanged afterwards.
+
+        :param features:         The survey-wide features
+        :param fingerprint_func: Function returning the fingerprint of the features, defaults to
+                                 :py:func:`features_fingerprint`
+
+        :type features:          list
+        :type fingerprint_func:  function, optional
+        '''
+        # the features are held with their fingerprint so their id cannot be reused by another object
+        remembered = self._fingerprints.get(id(features))
+        if remembered is None or remembered[0] is not features:
+            if len(self._fingerprints) >= FINGERPRINTS_MAXSIZE:
+                self._fingerprints.clear()
+            remembered = (features, (fingerprint_func or features_fingerprint)(features))
+            self._fingerprints[id(features)] = remembered
+        return remembered[1]
+
+    def clear(self):
+        '''
+        Removes all cached features from memory and disk.
+        '''
+        self._entries.clear()
+        self._fingerprints.clear()
+        self._disk_loaded = False
+        self._unsaved = False
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def set_default(feature_cache):
+    '''
+    Sets the process-wide feature cache used by algorithms when one is not supplied.
+    '''
+    global _default_cache
+    _default_cache = feature_cache
+
+
+def get_default():
+    '''
+    Returns the process-wide feature cache or `None` if one has not been set.
+    '''
+    return _default_cache
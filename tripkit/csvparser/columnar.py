@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Readers for Itinerum exports converted to the columnar Parquet or Arrow IPC (Feather) formats. Data
+# is read in column batches and passed to the cache database as column lists instead of per-row
+# dictionaries.
+import csv
+import importlib.util
+import logging
+import os
+import uuid
+
+from peewee import FloatField, IntegerField
+
+from ..utils import geo
+from ..utils.misc import LazyLoader
+
+# lazy load `pyarrow` modules on later function call since they are optional dependencies
+pa = LazyLoader('pa', globals(), 'pyarrow')
+pa_csv = LazyLoader('pa_csv', globals(), 'pyarrow.csv')
+feather = LazyLoader('feather', globals(), 'pyarrow.feather')
+pq = LazyLoader('pq', globals(), 'pyarrow.parquet')
+
+logger = logging.getLogger('itinerum-tripkit.csvparser.columnar')
+
+COLUMNAR_EXTENSIONS = ['.parquet', '.feather', '.arrow']
+
+
+def pyarrow_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def require_pyarrow():
+    '''
+    Raises an exception when the optional `pyarrow` library needed to read and write columnar exports
+    is not installed.
+    '''
+    if not pyarrow_available():
+        raise Exception(
+            "Columnar exports require the optional pyarrow library, "
+            "install it with: pip install itinerum-tripkit[columnar]"
+        )
+
+
+def find_export(input_dir, csv_fn, prefer_columnar=False):
+    '''
+    Returns the filepath of a columnar copy of an export .csv file within the input directory
+    (e.g., `coordinates.parquet` for `coordinates.csv`) to load in its place, or `None` if the .csv
+    file should be loaded. A columnar copy is only used when it was modified no earlier than the .csv
+    file (such as after converting it) unless `prefer_columnar` is supplied.
+
+    :param input_dir:       The directory containing the export files
+    :param csv_fn:          The filename of the export .csv file
+    :param prefer_columnar: Supply `True` to use a columnar copy even when the .csv file is newer
+
+    :type prefer_columnar:  boolean, optional
+    '''
+    csv_fp = os.path.join(input_dir, csv_fn)
+    csv_mtime = os.path.getmtime(csv_fp) if os.path.exists(csv_fp) else None
+    basename = os.path.splitext(csv_fn)[0]
+    for ext in COLUMNAR_EXTENSIONS:
+        fp = os.path.join(input_dir, basename + ext)
+        if not os.path.exists(fp):
+            continue
+        if not prefer_columnar and not pyarrow_available():
+            logger.warning(f"Ignoring {fp} since pyarrow is not installed, loading {csv_fp}")
+            return
+        if prefer_columnar or csv_mtime is None or os.path.getmtime(fp) >= csv_mtime:
+            logger.info(f"Loading {fp} in place of {csv_fn}")
+            return fp
+        logger.warning(f"Ignoring {fp} since {csv_fn} was modified after it, loading {csv_fp}")
+        return
+    logger.info(f"Loading {csv_fp}")
+
+
+def read_batches(fp, batch_size=50000):
+    '''
+    Reads a Parquet or Arrow IPC (Feather) file and yields dictionaries of column value lists by
+    `batch_size` rows.
+    '''
+    if fp.endswith('.parquet'):
+        record_batches = pq.ParquetFile(fp).iter_batches(batch_size=batch_size)
+    else:
+        record_batches = feather.read_table(fp, memory_map=True).to_batches(max_chunksize=batch_size)
+    for record_batch in record_batches:
+        yield {name: column.to_pylist() for name, column in zip(record_batch.schema.names, record_batch.columns)}
+
+
+def iter_rows(batches):
+    '''
+    Yields the rows of column batches as dictionaries, as for the rows read from an export .csv file.
+    '''
+    for batch in batches:
+        keys = list(batch)
+        for values in zip(*batch.values()):
+            yield dict(zip(keys, values))
+
+
+# column batch filters for Itinerum exports mirroring the .csv row filters
+def _filter_rows(batch, column):
+    keep = [idx for idx, value in enumerate(batch[column]) if value not in (None, '')]
+    if len(keep) == len(batch[column]):
+        return batch
+    return {key: [values[idx] for idx in keep] for key, values in batch.items()}
+
+
+def _user_ids(uuids):
+    return [uuid.UUID(hex=u).hex for u in uuids]
+
+
+def survey_responses_batch_filter(batch):
+    batch = _filter_rows(batch, 'member_type')
+    batch['uuid'] = _user_ids(batch['uuid'])
+    batch['travel_mode_work_primary'] = batch.pop('travel_mode_work', None)
+    batch['travel_mode_work_secondary'] = batch.pop('travel_mode_alt_work', None)
+    batch['travel_mode_study_primary'] = batch.pop('travel_mode_study', None)
+    batch['travel_mode_study_secondary'] = batch.pop('travel_mode_alt_study', None)
+    return {key: values for key, values in batch.items() if values is not None}
+
+
+def coordinates_batch_filter(batch):
+    batch = _filter_rows(batch, 'timestamp_UTC')
+    batch['user_id'] = _user_ids(batch.pop('uuid'))
+    return batch
+
+
+def prompts_batch_filter(batch):
+    batch['user_id'] = _user_ids(batch.pop('uuid'))
+    return batch
+
+
+def project_columns(batch, user_zones, user_ids=None):
+    '''
+    Adds the UTM easting, northing and zone columns to a batch of coordinates. Each user's coordinates are
+    projected in their zone from `user_zones` or, for users without one, the zone of their first coordinate
+    which is then added to `user_zones`.
+
+    :param batch:      Dictionary of coordinate column lists with `user_id`, `latitude` and `longitude` keys
+    :param user_zones: Mapping of user ids to their UTM zone number and letter
+    :param user_ids:   Supply to project only the coordinates of these users within the batch
+
+    :type user_ids:    set, optional
+    '''
+    user_indexes = {}
+    for idx, user_id in enumerate(batch['user_id']):
+        if user_ids is None or user_id in user_ids:
+            user_indexes.setdefault(user_id, []).append(idx)
+
+    num_rows = len(batch['user_id'])
+    for column in ['easting', 'northing', 'zone_num', 'zone_letter']:
+        if column not in batch:
+            batch[column] = [None] * num_rows
+    eastings, northings = batch['easting'], batch['northing']
+    zone_nums, zone_letters = batch['zone_num'], batch['zone_letter']
+    for user_id, indexes in user_indexes.items():
+        zone_num, zone_letter = user_zones.get(user_id, (None, None))
+        user_eastings, user_northings, zone_num, zone_letter = geo.project_utm(
+            [batch['latitude'][idx] for idx in indexes],
+            [batch['longitude'][idx] for idx in indexes],
+            zone_num,
+            zone_letter,
+        )
+        user_zones[user_id] = (zone_num, zone_letter)
+        for idx, easting, northing in zip(indexes, user_eastings.tolist(), user_northings.tolist()):
+            eastings[idx] = easting
+            northings[idx] = northing
+            zone_nums[idx] = zone_num
+            zone_letters[idx] = zone_letter
+    return batch
+
+
+def project_batches(batches):
+    '''
+    Adds the UTM easting, northing and zone columns to batches of coordinates. A user's UTM zone is selected
+    from their first coordinate and reused for all following batches.
+    '''
+    user_zones = {}
+    for batch in batches:
+        yield project_columns(batch, user_zones)
+
+
+def _column_types(Model, headers, renames=None):
+    # numeric database fields are typed while all other columns (e.g., uuids and timestamps) are kept as
+    # text so values are stored exactly as when loaded from .csv
+    renames = renames or {}
+    types = {}
+    for header in headers:
+        field = Model._meta.fields.get(renames.get(header, header))
+        if isinstance(field, FloatField):
+            types[header] = pa.float64()
+        elif isinstance(field, IntegerField) and not field.primary_key:
+            types[header] = pa.int64()
+        else:
+            types[header] = pa.string()
+    return types
+
+
+def convert_csv_to_parquet(csv_fp, parquet_fp, Model, renames=None, empty_as_null=True, block_size=64 << 20):
+    '''
+    Converts an export .csv file to Parquet by streaming blocks of rows, using the column types of
+    the matching cache database model.
+
+    :param csv_fp:        The full filepath of the source .csv file
+    :param parquet_fp:    The full filepath of the output .parquet file
+    :param Model:         Peewee database model of the table the .csv data is loaded to
+    :param renames:       Mapping of .csv column names to database field names when they differ
+    :param empty_as_null: Supply `False` to keep empty text values as empty strings instead of nulls
+    :param block_size:    Number of bytes of .csv text to parse at a time
+
+    :type renames:        dict, optional
+    :type empty_as_null:  boolean, optional
+    :type block_size:     int, optional
+    '''
+    logger.info(f"Converting {csv_fp} to Parquet...")
+    with open(csv_fp, 'r', encoding='utf-8-sig') as csv_f:
+        headers = next(csv.reader(csv_f))
+    convert_options = pa_csv.ConvertOptions(
+        column_types=_column_types(Model, headers, renames), strings_can_be_null=empty_as_null
+    )
+    read_options = pa_csv.ReadOptions(block_size=block_size)
+    reader = pa_csv.open_csv(csv_fp, read_options=read_options, convert_options=convert_options)
+    with pq.ParquetWriter(parquet_fp, reader.schema) as writer:
+        for record_batch in reader:
+            writer.write_batch(record_batch)
@@ -7,8 +7,10 @@ import csv
 from datetime import datetime
 import logging
 import os
+import uuid
 
 from ..database import SubwayStationEntrance, UserLocation, UserSurveyResponse
+from ..utils import geo
 
 logger = logging.getLogger('itinerum-tripkit.csvparser.common')
 
@@ -86,6 +88,23 @@ def _load_user_locations(locations_csv_fp, uuid_lookup=None):
             UserLocation.create(user=user_id, label=label, latitude=lat, longitude=lon)
 
 
+def _null_survey_row(uuid, orig_id=None):
+    '''
+    Returns an empty survey response for a user with only coordinate data.
+    '''
+    return {
+        'uuid': uuid,
+        'orig_id': orig_id,
+        'created_at_UTC': datetime(2000, 1, 1),
+        'modified_at_UTC': datetime(2000, 1, 1),
+        'itinerum_version': -1,
+        'member_type': -1,
+        'model': -1,
+        'os': -1,
+        'os_version': -1,
+    }
+
+
 def _generate_null_survey(input_dir, coordinates_csv_fn, id_column='uuid', uuid_lookup=None, headers=None):
     '''
     Generates an empty survey responses table for surveys with only coordinate data. Used for populating foreign keys
@@ -111,14 +130,77 @@ def _generate_null_survey(input_dir, coordinates_csv_fn, id_column='uuid', uuid_
             orig_id = uuid
             uuid = uuid_lookup[orig_id]
 
-        UserSurveyResponse.create(
-            uuid=uuid,
-            orig_id=orig_id,
-            created_at_UTC=datetime(2000, 1, 1),
-            modified_at_UTC=datetime(2000, 1, 1),
-            itinerum_version=-1,
-            member_type=-1,
-            model=-1,
-            os=-1,
-            os_version=-1,
-        )
+        UserSurveyResponse.create(**_null_survey_row(uuid, orig_id))
+
+
+def _project_coordinates(rows, chunk_size=50000, user_zones=None):
+    '''
+    Adds the UTM easting, northing and zone to coordinate rows for the cache database. Rows are buffered
+    by `chunk_size` and projected as a batch for each user within the chunk. A user's UTM zone is selected
+    from their first coordinate and reused for all following chunks.
+
+    :param rows:       Iterable of coordinate dictionaries with `user`, `latitude` and `longitude` keys.
+    :param chunk_size: Number of rows to project per batch.
+    :param user_zones: Mapping of users to the UTM zone number and letter to project their coordinates
+                       within, such as for users with coordinates already in the cache database.
+
+    :type user_zones:  dict, optional
+    '''
+    def _project_chunk(chunk):
+        user_rows = {}
+        for row in chunk:
+            user_rows.setdefault(row['user'], []).append(row)
+        for user_id, rows in user_rows.items():
+            zone_num, zone_letter = user_zones.get(user_id, (None, None))
+            eastings, northings, zone_num, zone_letter = geo.project_utm(
+                [r['latitude'] for r in rows], [r['longitude'] for r in rows], zone_num, zone_letter
+            )
+            user_zones[user_id] = (zone_num, zone_letter)
+            for row, easting, northing in zip(rows, eastings.tolist(), northings.tolist()):
+                row['easting'] = easting
+                row['northing'] = northing
+                row['zone_num'] = zone_num
+                row['zone_letter'] = zone_letter
+        return chunk
+
+    user_zones = dict(user_zones or {})
+    chunk = []
+    for row in rows:
+        if not row:
+            continue
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from _project_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from _project_chunk(chunk)
+
+
+def _new_coordinates(rows, latest_coordinates, updated_users):
+    '''
+    Yields the coordinate rows newer than each user's latest coordinate in the cache database, used to
+    append a new export to existing data. The `user` of each row is replaced by its uuid as a hex string
+    and is added to `updated_users`.
+
+    :param rows:               Iterable of coordinate dictionaries with `user` and `timestamp_epoch` keys.
+    :param latest_coordinates: Mapping of user uuids (as hex strings) to a tuple beginning with the epoch
+                               timestamp of their latest loaded coordinate, see
+                               :py:meth:`Database.latest_coordinates`
+    :param updated_users:      Set to add the uuids of users with new coordinates to
+    '''
+    user_ids = {}
+    for row in rows:
+        if not row:
+            continue
+        user = row['user']
+        user_id = user_ids.get(user)
+        if user_id is None:
+            user_id = user_ids[user] = uuid.UUID(hex=str(user)).hex
+        latest_epoch = latest_coordinates.get(user_id, (None,))[0]
+        if latest_epoch is not None:
+            # coordinates missing an epoch timestamp are only loaded for new users
+            if row['timestamp_epoch'] is None or int(row['timestamp_epoch']) <= latest_epoch:
+                continue
+        row['user'] = user_id
+        updated_users.add(user_id)
+        yield row
@@ -4,9 +4,11 @@ import csv
 from datetime import datetime
 import logging
 import os
-from playhouse.migrate import migrate, SqliteMigrator
+import uuid
 
-from .common import _generate_null_survey, _load_subway_stations
+from . import columnar, parallel
+from .. import metrics
+from .common import _generate_null_survey, _load_subway_stations, _new_coordinates, _project_coordinates
 from ..database import (
     UserSurveyResponse,
     Coordinate,
@@ -82,11 +84,17 @@ class ItinerumCSVParser(object):
     Parses Itinerum platform csv files and loads to them to a cache database.
 
     :param database: Open Peewee connection the cache database
+    :param config:   An imported Python file of global variables or a bare config class, used for the
+                     optional ``PREFER_COLUMNAR_EXPORTS`` parameter
+
+    :type config:    object, optional
     '''
 
-    def __init__(self, database):
+    def __init__(self, database, config=None):
         self.db = database
-        self._migrator = SqliteMigrator(database.db)
+        self.prefer_columnar = getattr(config, 'PREFER_COLUMNAR_EXPORTS', False)
+        if self.prefer_columnar:
+            columnar.require_pyarrow()
         self.cancelled_prompt_responses_csv = 'cancelled_prompts.csv'
         self.coordinates_csv = 'coordinates.csv'
         self.prompt_responses_csv = 'prompt_responses.csv'
@@ -114,6 +122,42 @@ class ItinerumCSVParser(object):
                 dict_row = dict(zip(headers, row))
                 yield filter_func(dict_row) if filter_func else dict_row
 
+    def _find_export(self, input_dir, csv_fn):
+        return columnar.find_export(input_dir, csv_fn, prefer_columnar=self.prefer_columnar)
+
+    def _export_rows(self, input_dir, csv_fn, filter_func):
+        # rows of an export file read from its columnar copy when used in place of the .csv file, with the
+        # same row filter since the copy has the .csv file's columns
+        columnar_fp = self._find_export(input_dir, csv_fn)
+        if columnar_fp:
+            return map(filter_func, columnar.iter_rows(columnar.read_batches(columnar_fp)))
+        return self._row_generator(os.path.join(input_dir, csv_fn), filter_func)
+
+    def convert_to_parquet(self, input_dir, output_dir=None):
+        '''
+        Converts the Itinerum export .csv files to Parquet files which are then loaded in column batches
+        in place of the .csv files. Requires the optional `pyarrow` library.
+
+        :param input_dir:  Directory containing input .csv data
+        :param output_dir: Directory to write the .parquet files, defaults to the input directory
+
+        :type output_dir:  str, optional
+        '''
+        columnar.require_pyarrow()
+        output_dir = output_dir or input_dir
+        exports = [
+            (self.survey_responses_csv, UserSurveyResponse, True),
+            (self.coordinates_csv, Coordinate, True),
+            (self.prompt_responses_csv, PromptResponse, False),
+            (self.cancelled_prompt_responses_csv, CancelledPromptResponse, False),
+        ]
+        for csv_fn, Model, empty_as_null in exports:
+            csv_fp = os.path.join(input_dir, csv_fn)
+            if not os.path.exists(csv_fp):
+                continue
+            parquet_fp = os.path.join(output_dir, os.path.splitext(csv_fn)[0] + '.parquet')
+            columnar.convert_csv_to_parquet(csv_fp, parquet_fp, Model, empty_as_null=empty_as_null)
+
     def generate_null_survey(self, input_dir):
         '''
         Wrapper function to generate null survey responses for each user in coordinates.
@@ -124,54 +168,158 @@ class ItinerumCSVParser(object):
 
     def load_export_survey_responses(self, input_dir):
         '''
-        Loads Itinerum survey responses data to the cache database.
+        Loads Itinerum survey responses data to the cache database. A Parquet or Arrow (Feather) copy of the
+        .csv file is loaded instead when found in the input directory and not older than the .csv file.
 
         :param input_dir: The directory containing the `self.survey_responses_csv` data file.
         '''
-        survey_responses_fp = os.path.join(input_dir, self.survey_responses_csv)
-        survey_responses_rows = self._row_generator(survey_responses_fp, _survey_response_row_filter)
-        self.db.bulk_insert(UserSurveyResponse, survey_responses_rows)
-
-    def load_export_coordinates(self, input_dir):
+        columnar_fp = self._find_export(input_dir, self.survey_responses_csv)
+        if columnar_fp:
+            batches = map(columnar.survey_responses_batch_filter, columnar.read_batches(columnar_fp))
+            num_rows = self.db.bulk_insert_columns(UserSurveyResponse, batches)
+        else:
+            survey_responses_fp = os.path.join(input_dir, self.survey_responses_csv)
+            survey_responses_rows = self._row_generator(survey_responses_fp, _survey_response_row_filter)
+            num_rows = len(self.db.bulk_insert(UserSurveyResponse, survey_responses_rows))
+        metrics.ROWS_INGESTED.inc(num_rows, source='survey_responses')
+
+    def load_export_coordinates(self, input_dir, workers=1):
         '''
-        Loads Itinerum coordinates data to the cache database.
+        Loads Itinerum coordinates data with their projected UTM coordinates to the cache database. A Parquet
+        or Arrow (Feather) copy of the .csv file is loaded instead when found in the input directory and not
+        older than the .csv file.
 
         :param input_dir: The directory containing the `self.coordinates_csv` data file.
+        :param workers:   Number of worker processes to parse the .csv file in parallel chunks, supply `None`
+                          to use the number of CPUs.
+
+        :type workers:    int, optional
         '''
         logger.info("Loading coordinates .csv to db...")
-        migrate(self._migrator.drop_index(Coordinate, 'coordinate_user_id'))
+        self.db.drop_indexes(Coordinate)
+        columnar_fp = self._find_export(input_dir, self.coordinates_csv)
         coordinates_fp = os.path.join(input_dir, self.coordinates_csv)
-        coordinates_rows = self._row_generator(coordinates_fp, _coordinates_row_filter)
-        self.db.bulk_insert(Coordinate, coordinates_rows)
-        migrate(self._migrator.add_index('coordinates', ('user_id',), False))
+        if columnar_fp:
+            batches = map(columnar.coordinates_batch_filter, columnar.read_batches(columnar_fp))
+            num_rows = self.db.bulk_insert_columns(Coordinate, columnar.project_batches(batches))
+        elif workers != 1:
+            with open(coordinates_fp, 'r', encoding='utf-8-sig') as csv_f:
+                headers = next(csv.reader(csv_f))
+            num_rows = parallel.load_coordinates(
+                self.db, Coordinate, coordinates_fp, headers, _coordinates_row_filter, workers=workers
+            )
+        else:
+            coordinates_rows = _project_coordinates(self._row_generator(coordinates_fp, _coordinates_row_filter))
+            num_rows = len(self.db.bulk_insert(Coordinate, coordinates_rows))
+        metrics.ROWS_INGESTED.inc(num_rows, source='coordinates')
+        self.db.create_indexes(Coordinate)
 
     def load_export_prompt_responses(self, input_dir):
         '''
         Loads Itinerum prompt responses data to the cache database. For each .csv row, the data 
         is fetched by column name if it exists and cast to appropriate types as set in the database.
+        A Parquet or Arrow (Feather) copy of the .csv file is loaded instead when found in the input directory
+        and not older than the .csv file.
 
         :param input_dir: The directory containing the `self.prompt_responses.csv` data file.
         '''
         logger.info("Loading prompt responses .csv to db...")
-        migrate(self._migrator.drop_index(PromptResponse, 'promptresponse_user_id'))
-        prompt_responses_fp = os.path.join(input_dir, self.prompt_responses_csv)
-        prompt_responses_rows = self._row_generator(prompt_responses_fp, _prompts_row_filter)
-        self.db.bulk_insert(PromptResponse, prompt_responses_rows)
-        migrate(self._migrator.add_index('prompt_responses', ('user_id',), False))
+        self.db.drop_indexes(PromptResponse)
+        columnar_fp = self._find_export(input_dir, self.prompt_responses_csv)
+        if columnar_fp:
+            batches = map(columnar.prompts_batch_filter, columnar.read_batches(columnar_fp))
+            num_rows = self.db.bulk_insert_columns(PromptResponse, batches)
+        else:
+            prompt_responses_fp = os.path.join(input_dir, self.prompt_responses_csv)
+            prompt_responses_rows = self._row_generator(prompt_responses_fp, _prompts_row_filter)
+            num_rows = len(self.db.bulk_insert(PromptResponse, prompt_responses_rows))
+        metrics.ROWS_INGESTED.inc(num_rows, source='prompt_responses')
+        self.db.create_indexes(PromptResponse)
 
     def load_export_cancelled_prompt_responses(self, input_dir):
         '''
         Loads Itinerum cancelled prompt responses data to the cache database. For each .csv row, the data
         is fetched by column name if it exists and cast to appropriate types as set in the database.
+        A Parquet or Arrow (Feather) copy of the .csv file is loaded instead when found in the input directory
+        and not older than the .csv file.
 
         :param input_dir: The directory containing the `self.cancelled_prompt_responses.csv` data file.
         '''
         logger.info("Loading cancelled prompt responses .csv to db...")
-        cancelled_prompt_responses_fp = os.path.join(input_dir, self.cancelled_prompt_responses_csv)
-        cancelled_prompt_responses_rows = self._row_generator(
-            cancelled_prompt_responses_fp, _cancelled_prompts_row_filter
+        self.db.drop_indexes(CancelledPromptResponse)
+        columnar_fp = self._find_export(input_dir, self.cancelled_prompt_responses_csv)
+        if columnar_fp:
+            batches = map(columnar.prompts_batch_filter, columnar.read_batches(columnar_fp))
+            num_rows = self.db.bulk_insert_columns(CancelledPromptResponse, batches)
+        else:
+            cancelled_prompt_responses_fp = os.path.join(input_dir, self.cancelled_prompt_responses_csv)
+            cancelled_prompt_responses_rows = self._row_generator(
+                cancelled_prompt_responses_fp, _cancelled_prompts_row_filter
+            )
+            num_rows = len(self.db.bulk_insert(CancelledPromptResponse, cancelled_prompt_responses_rows))
+        metrics.ROWS_INGESTED.inc(num_rows, source='cancelled_prompt_responses')
+        self.db.create_indexes(CancelledPromptResponse)
+
+    def append_export(self, input_dir):
+        '''
+        Appends an Itinerum export (e.g., a daily export of an ongoing survey) to an existing cache database,
+        loading only the .csv rows not already found. Survey responses are loaded for new users, coordinates
+        newer than each user's latest loaded coordinate and prompt responses with unseen prompt uuids. New
+        coordinates are projected within the UTM zone of the user's existing coordinates. Table indexes are
+        kept and updated while inserting since the appended rows are expected to be few. As when loading an
+        export, the rows are read from a Parquet or Arrow (Feather) copy of each .csv file when found in the
+        input directory and not older than the .csv file.
+
+        :param input_dir: The directory containing the Itinerum export .csv data files.
+
+        :rtype: set of the uuids (as hex strings) of users with new coordinates or prompt responses
+        '''
+        logger.info("Appending new survey responses .csv rows to db...")
+        existing_users = self.db.user_ids()
+        survey_responses_rows = (
+            row
+            for row in self._export_rows(input_dir, self.survey_responses_csv, _survey_response_row_filter)
+            if row and uuid.UUID(hex=row['uuid']).hex not in existing_users
+        )
+        num_rows = len(self.db.bulk_insert(UserSurveyResponse, survey_responses_rows))
+        metrics.ROWS_INGESTED.inc(num_rows, source='survey_responses')
+
+        logger.info("Appending new coordinates .csv rows to db...")
+        updated_users = set()
+        latest_coordinates = self.db.latest_coordinates()
+        user_zones = {user_id: tuple(zone) for user_id, (_, *zone) in latest_coordinates.items()}
+        coordinates_rows = _new_coordinates(
+            self._export_rows(input_dir, self.coordinates_csv, _coordinates_row_filter),
+            latest_coordinates,
+            updated_users,
         )
-        self.db.bulk_insert(CancelledPromptResponse, cancelled_prompt_responses_rows)
+        num_rows = len(self.db.bulk_insert(Coordinate, _project_coordinates(coordinates_rows, user_zones=user_zones)))
+        metrics.ROWS_INGESTED.inc(num_rows, source='coordinates')
+
+        prompts = [
+            (self.prompt_responses_csv, PromptResponse, _prompts_row_filter, 'prompt_responses'),
+            (
+                self.cancelled_prompt_responses_csv,
+                CancelledPromptResponse,
+                _cancelled_prompts_row_filter,
+                'cancelled_prompt_responses',
+            ),
+        ]
+        for csv_fn, Model, row_filter, source in prompts:
+            logger.info(f"Appending new {csv_fn} rows to db...")
+            loaded_prompts = self.db.prompt_uuids(Model)
+
+            def _new_prompts(rows):
+                for row in rows:
+                    if uuid.UUID(hex=row['prompt_uuid']).hex in loaded_prompts:
+                        continue
+                    row['user_id'] = uuid.UUID(hex=row['user']).hex
+                    updated_users.add(row['user_id'])
+                    yield row
+
+            num_rows = len(self.db.bulk_insert(Model, _new_prompts(self._export_rows(input_dir, csv_fn, row_filter))))
+            metrics.ROWS_INGESTED.inc(num_rows, source=source)
+        return updated_users
 
     def load_trips(self, trips_csv_fp):
         '''
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Parallel loading of large coordinates .csv files. The file is split into chunks on line boundaries
+# which are parsed, filtered and projected by a pool of worker processes and returned as column lists
+# in file order to the parent process, which remains the single writer to the cache database.
+import collections
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import uuid
+
+from . import columnar
+
+
+logger = logging.getLogger('itinerum-tripkit.csvparser.parallel')
+
+
+def split_lines(csv_fp, chunk_bytes=16 << 20):
+    '''
+    Returns the (start, end) byte offsets of chunks of a .csv file aligned to line boundaries,
+    skipping the header line. Rows must not contain quoted line breaks.
+
+    :param csv_fp:      The full filepath of the .csv file
+    :param chunk_bytes: Approximate size of each chunk in bytes
+
+    :type chunk_bytes:  int, optional
+    '''
+    file_size = os.path.getsize(csv_fp)
+    chunks = []
+    with open(csv_fp, 'rb') as csv_f:
+        csv_f.readline()
+        start = csv_f.tell()
+        while start < file_size:
+            csv_f.seek(min(start + chunk_bytes, file_size))
+            csv_f.readline()
+            end = min(csv_f.tell(), file_size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def _parse_chunk(args):
+    csv_fp, start, end, headers, row_filter, raw_users = args
+    with open(csv_fp, 'rb') as csv_f:
+        csv_f.seek(start)
+        text = csv_f.read(end - start).decode('utf-8')
+
+    rows = []
+    for row in csv.reader(io.StringIO(text, newline='')):
+        dict_row = row_filter(dict(zip(headers, row)))
+        if dict_row:
+            rows.append(dict_row)
+    if not rows:
+        return None, {}
+
+    batch = {key: [r[key] for r in rows] for key in rows[0] if key != 'user'}
+    if raw_users:
+        batch['user_id'] = [r['user'] for r in rows]
+    else:
+        batch['user_id'] = [uuid.UUID(hex=r['user']).hex for r in rows]
+    user_zones = {}
+    columnar.project_columns(batch, user_zones)
+    return batch, user_zones
+
+
+def _ordered_results(pool, func, tasks, max_pending):
+    # submit a bounded number of tasks ahead so parsed chunks do not accumulate in memory while
+    # waiting for the database writer, yielding results in the original order
+    tasks = iter(tasks)
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        result = pending.popleft().get()
+        task = next(tasks, None)
+        if task is not None:
+            pending.append(pool.apply_async(func, (task,)))
+        yield result
+
+
+def load_coordinates(
+    database, Model, csv_fp, headers, row_filter, workers=None, chunk_bytes=16 << 20, user_lookup=None
+):
+    '''
+    Loads a coordinates .csv file to the cache database by parsing chunks of the file in parallel. Rows are
+    inserted in file order and each user's coordinates are projected in the UTM zone of their first
+    coordinate, as when loading the file in a single process.
+
+    :param database:    The cache database object
+    :param Model:       Peewee database model of target table for inserts
+    :param csv_fp:      The full filepath of the coordinates .csv file
+    :param headers:     The column names of the .csv rows
+    :param row_filter:  Module-level function (or `functools.partial` of one) to filter each row dictionary,
+                        returning a row with a `user` uuid key or `None` to skip the row
+    :param workers:     Number of worker processes, defaults to the number of CPUs
+    :param chunk_bytes: Approximate size of each chunk of the file sent to a worker in bytes
+    :param user_lookup: Mapping of the rows' `user` values to uuids when they are not already uuids. Users
+                        are looked up in file order within this process, so a mapping that generates
+                        missing uuids (e.g., a `dict` with `__missing__`) assigns them on first sight.
+
+    :type workers:      int, optional
+    :type chunk_bytes:  int, optional
+    :type user_lookup:  dict, optional
+
+    :rtype: int
+    '''
+    workers = workers or os.cpu_count()
+    chunks = split_lines(csv_fp, chunk_bytes)
+    logger.info(f"Parsing {len(chunks)} chunks of {csv_fp} with {workers} workers...")
+    raw_users = user_lookup is not None
+    tasks = ((csv_fp, start, end, headers, row_filter, raw_users) for start, end in chunks)
+
+    def _reconciled_batches(results):
+        # reproject any user whose first coordinate of a chunk fell in a different zone than their
+        # first coordinate overall
+        user_zones = {}
+        for batch, chunk_zones in results:
+            if batch is None:
+                continue
+            mismatched = set()
+            for user_id, zone in chunk_zones.items():
+                if user_zones.setdefault(user_id, zone) != zone:
+                    mismatched.add(user_id)
+            if mismatched:
+                columnar.project_columns(batch, user_zones, user_ids=mismatched)
+            if raw_users:
+                user_ids = {}
+                for user in batch['user_id']:
+                    if user not in user_ids:
+                        user_ids[user] = uuid.UUID(hex=user_lookup[user]).hex
+                batch['user_id'] = [user_ids[user] for user in batch['user_id']]
+            yield batch
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        results = _ordered_results(pool, _parse_chunk, tasks, max_pending=workers * 2)
+        return database.bulk_insert_columns(Model, _reconciled_batches(results))
@@ -1,20 +1,102 @@
 #!/usr/bin/env python
 # Kyle Fitzsimmons, 2019
 import csv
-from datetime import datetime
+from datetime import date, time
+import functools
 import json
 import logging
 import os
-from playhouse.migrate import migrate, SqliteMigrator
+from peewee import chunked
 import pytz
 import uuid
 
-from .common import _generate_null_survey, _load_subway_stations, _load_user_locations
-from ..database import Coordinate
+from . import parallel
+from .. import metrics
+from .common import _generate_null_survey, _load_subway_stations, _project_coordinates, _load_user_locations
+from .common import _new_coordinates, _null_survey_row
+from ..database import Coordinate, UserSurveyResponse
 from ..utils.misc import temp_path
 
 logger = logging.getLogger('itinerum-tripkit.csvparser.qstarz')
 
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# .csv row filters for parsing QStarz data to database models
+def _value_or_none(row, key):
+    '''
+    Helper function to return the value stripped of whitespace or `None` for a 0-length string
+    from a .csv cell value.
+    '''
+    v = row.get(key)
+    if v and isinstance(v, str):
+        return v.strip()
+
+
+# QStarz dates and times are decoded once for each distinct value, returning the text stored for a UTC
+# `datetime` by SQLite with the seconds since the epoch (NOTE: QStarz data returns a 2-digit year)
+@functools.lru_cache(maxsize=None)
+def _parse_utc_date(utc_date):
+    year, month, day = utc_date.split('/')
+    if len(year) == 2:
+        year = int('20' + year)
+    utc_date = date(int(year), int(month), int(day))
+    return utc_date.isoformat(), (utc_date.toordinal() - EPOCH_ORDINAL) * 86400
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_utc_time(utc_time):
+    hour, minute, second = [int(i) for i in utc_time.split(':')]
+    utc_time = time(hour, minute, second)
+    return utc_time.isoformat(), utc_time.hour * 3600 + utc_time.minute * 60 + utc_time.second
+
+
+def _coordinates_row_filter(row, uuid_lookup=None):
+    lat, lon = _value_or_none(row, 'LATITUDE'), _value_or_none(row, 'LONGITUDE')
+    if not lat or not lon:
+        return
+    lat, lon = float(lat), float(lon)
+    if int(lat) == 0 and int(lon) == 0:
+        return
+    # add sign to negative lat/lons depending on hemisphere
+    if row.get('N/S') == 'S' and lat > 0:
+        lat *= -1
+    if row.get('E/W') == 'W' and lon > 0:
+        lon *= -1
+
+    date_str, date_epoch = _parse_utc_date(row['UTC_DATE'])
+    time_str, time_seconds = _parse_utc_time(row['UTC_TIME'])
+    timestamp_UTC = f'{date_str} {time_str}+00:00'
+    timestamp_epoch = date_epoch + time_seconds
+    db_row = {
+        'user': uuid_lookup[row['USER']] if uuid_lookup is not None else row['USER'],
+        'latitude': lat,
+        'longitude': lon,
+        'altitude': _value_or_none(row, 'ALTITUDE'),
+        'speed': _value_or_none(row, 'SPEED'),
+        'direction': _value_or_none(row, 'HEADING'),
+        'h_accuracy': None,
+        'v_accuracy': None,
+        'acceleration_x': _value_or_none(row, 'G-X'),
+        'acceleration_y': _value_or_none(row, 'G-Y'),
+        'acceleration_z': _value_or_none(row, 'G-Z'),
+        'point_type': None,
+        'mode_detected': None,
+        'timestamp_UTC': timestamp_UTC,
+        'timestamp_epoch': timestamp_epoch,
+    }
+    return db_row
+
+
+class _UUIDLookup(dict):
+    '''
+    Mapping of original user ids to UUIDs which generates a new UUID the first time a user id is looked up.
+    '''
+
+    def __missing__(self, user_id):
+        self[user_id] = str(uuid.uuid4())
+        return self[user_id]
+
 
 # .csv parsing
 class QstarzCSVParser(object):
@@ -29,7 +111,6 @@ class QstarzCSVParser(object):
     def __init__(self, config, database):
         self.config = config
         self.db = database
-        self._migrator = SqliteMigrator(database.db)
         self.coordinates_csv = 'coordinates.csv'
         self.locations_csv = 'locations.csv'
         self.headers = [
@@ -53,55 +134,8 @@ class QstarzCSVParser(object):
         # intialize survey timezone offset
         self.tz = pytz.timezone(self.config.TIMEZONE)
 
-    @staticmethod
-    def _value_or_none(row, key):
-        '''
-        Helper function to return the value stripped of whitespace or `None` for a 0-length string
-        from a .csv cell value.
-        '''
-        v = row.get(key)
-        if v and isinstance(v, str):
-            return v.strip()
-
     def _coordinates_row_filter(self, row):
-        lat, lon = self._value_or_none(row, 'LATITUDE'), self._value_or_none(row, 'LONGITUDE')
-        if not lat or not lon:
-            return
-        lat, lon = float(lat), float(lon)
-        if int(lat) == 0 and int(lon) == 0:
-            return
-        # add sign to negative lat/lons depending on hemisphere
-        if row.get('N/S') == 'S' and lat > 0:
-            lat *= -1
-        if row.get('E/W') == 'W' and lon > 0:
-            lon *= -1
-
-        # format date and time columns into Python datetime (NOTE: QStarz data returns a 2-digit year)
-        year, month, day = row['UTC_DATE'].split('/')
-        if len(year) == 2:
-            year = int('20' + year)
-        year, month, day = int(year), int(month), int(day)
-        hour, minute, second = [int(i) for i in row['UTC_TIME'].split(':')]
-        timestamp_UTC = datetime(year, month, day, hour, minute, second, tzinfo=pytz.utc)
-        timestamp_epoch = int(timestamp_UTC.timestamp())
-        db_row = {
-            'user': self.uuid_lookup[row['USER']],
-            'latitude': lat,
-            'longitude': lon,
-            'altitude': self._value_or_none(row, 'ALTITUDE'),
-            'speed': self._value_or_none(row, 'SPEED'),
-            'direction': self._value_or_none(row, 'HEADING'),
-            'h_accuracy': None,
-            'v_accuracy': None,
-            'acceleration_x': self._value_or_none(row, 'G-X'),
-            'acceleration_y': self._value_or_none(row, 'G-Y'),
-            'acceleration_z': self._value_or_none(row, 'G-Z'),
-            'point_type': None,
-            'mode_detected': None,
-            'timestamp_UTC': timestamp_UTC,
-            'timestamp_epoch': timestamp_epoch,
-        }
-        return db_row
+        return _coordinates_row_filter(row, self.uuid_lookup)
 
     # read .csv file, apply filter and yield row
     def _row_generator(self, csv_fp, filter_func=None):
@@ -117,10 +151,13 @@ class QstarzCSVParser(object):
                 dict_row = dict(zip(self.headers, row))
                 yield filter_func(dict_row) if filter_func else dict_row
 
+    def _uuid_lookup_fp(self):
+        return temp_path(f'{self.config.SURVEY_NAME}.json')
+
     def _generate_uuids(self, input_dir):
         self.uuid_lookup = {}
         logger.info("Generating UUIDs for non-standard user ids...")
-        lookup_fp = temp_path(f'{self.config.SURVEY_NAME}.json')
+        lookup_fp = self._uuid_lookup_fp()
         if os.path.exists(lookup_fp):
             with open(lookup_fp, 'r') as json_f:
                 self.uuid_lookup = json.load(json_f)
@@ -151,19 +188,92 @@ class QstarzCSVParser(object):
             input_dir, self.coordinates_csv, id_column='user', uuid_lookup=self.uuid_lookup, headers=self.headers
         )
 
-    def load_export_coordinates(self, input_dir):
+    def load_export_coordinates(self, input_dir, workers=1, generate_null_survey=False):
         '''
-        Loads QStarz coordinates data to the cache database.
+        Loads QStarz coordinates data with their projected UTM coordinates to the cache database. With
+        `generate_null_survey`, the UUID lookup and null survey responses are created in the same pass
+        over the .csv file instead of calling :py:meth:`generate_null_survey` beforehand.
 
-        :param input_dir: The directory containing the `self.coordinates_csv` data file.
+        :param input_dir:            The directory containing the `self.coordinates_csv` data file.
+        :param workers:              Number of worker processes to parse the .csv file in parallel chunks,
+                                     supply `None` to use the number of CPUs.
+        :param generate_null_survey: Supply `True` to generate UUIDs for user ids on first sight and
+                                     an empty survey response for each user with coordinates
+
+        :type workers:               int, optional
+        :type generate_null_survey:  boolean, optional
         '''
         logger.info("Loading coordinates .csv to db...")
-        migrate(self._migrator.drop_index(Coordinate, 'coordinate_user_id'))
+        self.db.drop_indexes(Coordinate)
         coordinates_fp = os.path.join(input_dir, self.coordinates_csv)
-        coordinates_rows = self._row_generator(coordinates_fp, self._coordinates_row_filter)
-        self.db.bulk_insert(Coordinate, coordinates_rows)
-        migrate(self._migrator.add_index('coordinates', ('user_id',), False))
+        if generate_null_survey:
+            self._load_uuid_lookup()
+
+        if workers != 1:
+            # user ids are resolved to UUIDs by this process in file order when generating the lookup
+            if generate_null_survey:
+                row_filter, user_lookup = _coordinates_row_filter, self.uuid_lookup
+            else:
+                row_filter, user_lookup = functools.partial(_coordinates_row_filter, uuid_lookup=self.uuid_lookup), None
+            num_rows = parallel.load_coordinates(
+                self.db, Coordinate, coordinates_fp, self.headers, row_filter, workers=workers, user_lookup=user_lookup
+            )
+        else:
+            coordinates_rows = _project_coordinates(self._row_generator(coordinates_fp, self._coordinates_row_filter))
+            num_rows = len(self.db.bulk_insert(Coordinate, coordinates_rows))
+        metrics.ROWS_INGESTED.inc(num_rows, source='coordinates')
+        self.db.create_indexes(Coordinate)
+
+        if generate_null_survey:
+            self._save_null_survey(self.db.latest_coordinates())
+
+    def _load_uuid_lookup(self):
+        self.uuid_lookup = _UUIDLookup()
+        if os.path.exists(self._uuid_lookup_fp()):
+            with open(self._uuid_lookup_fp(), 'r') as json_f:
+                self.uuid_lookup.update(json.load(json_f))
 
+    def _save_null_survey(self, user_ids):
+        # insert null survey responses for the users loaded by this pass (uuids as hex strings) that do not
+        # have a survey response yet and save the lookup, which may also hold users from previous loads
+        self.uuid_lookup = dict(self.uuid_lookup)
+        new_users = set(user_ids) - self.db.user_ids()
+        logger.info("Populating survey responses with null data in db...")
+        null_survey_rows = [
+            _null_survey_row(user_uuid, orig_id)
+            for orig_id, user_uuid in self.uuid_lookup.items()
+            if uuid.UUID(hex=user_uuid).hex in new_users
+        ]
+        with self.db.db.atomic():
+            for batch in chunked(null_survey_rows, 100):
+                UserSurveyResponse.insert_many(batch).execute()
+        with open(self._uuid_lookup_fp(), 'w') as json_f:
+            json.dump(self.uuid_lookup, json_f)
+
+    def append_export(self, input_dir):
+        '''
+        Appends QStarz coordinates (e.g., newly downloaded logger data) to an existing cache database, loading
+        only the coordinates newer than each user's latest loaded coordinate. New user ids are assigned UUIDs
+        and null survey responses, while existing users keep their UUIDs from the saved lookup. New coordinates
+        are projected within the UTM zone of the user's existing coordinates. User locations are not appended.
+
+        :param input_dir: The directory containing the `self.coordinates_csv` data file.
+
+        :rtype: set of the uuids (as hex strings) of users with new coordinates
+        '''
+        logger.info("Appending new coordinates .csv rows to db...")
+        self._load_uuid_lookup()
+        updated_users = set()
+        latest_coordinates = self.db.latest_coordinates()
+        user_zones = {user_id: tuple(zone) for user_id, (_, *zone) in latest_coordinates.items()}
+        coordinates_fp = os.path.join(input_dir, self.coordinates_csv)
+        coordinates_rows = _new_coordinates(
+            self._row_generator(coordinates_fp, self._coordinates_row_filter), latest_coordinates, updated_users
+        )
+        num_rows = len(self.db.bulk_insert(Coordinate, _project_coordinates(coordinates_rows, user_zones=user_zones)))
+        metrics.ROWS_INGESTED.inc(num_rows, source='coordinates')
+        self._save_null_survey(updated_users)
+        return updated_users
 
     def load_user_locations(self, input_dir):
         '''
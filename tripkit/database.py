@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 # Kyle Fitzsimmons, 2018-2019
 from datetime import datetime
+import calendar
+import collections
 import itertools
 import logging
+import numpy as np
+import time
 from peewee import (
     Model,
     SqliteDatabase,
@@ -13,15 +17,19 @@ from peewee import (
     FloatField,
     ForeignKeyField,
     IntegerField,
+    fn,
     TextField,
     UUIDField,
+    chunked,
 )
-import utm
+from playhouse.migrate import migrate, SqliteMigrator
 import uuid
 
+from . import metrics
 from .models.DaySummary import DaySummary
 from .models.ActivityLocation import ActivityLocation
 from .models.Trip import Trip
+from .models.TripArray import TripArray
 from .models.TripPoint import TripPoint
 from .models.User import User
 from .utils import geo
@@ -32,6 +40,66 @@ logger = logging.getLogger('itinerum-tripkit.database')
 # globally create a single database connection for SQLite
 deferred_db = SqliteDatabase(None)
 
+# SQLite pragmas for the cache database performance profiles: `bulk_load` trades durability for write
+# speed while ingesting data (an interrupted setup should be re-run with `force=True`) and `analysis`
+# favors reads while running processes on the loaded data. Temporary tables and the sorts of index builds
+# are kept in memory. The page size is set first since it cannot be changed once the database uses
+# write-ahead logging, which persists in the database file after the connection is closed.
+DATABASE_PROFILES = {
+    'bulk_load': {
+        'page_size': 8192,
+        'journal_mode': 'wal',
+        'synchronous': 'off',
+        'cache_size': -262144,  # KiB
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+    },
+    'analysis': {
+        'page_size': 8192,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -65536,  # KiB
+        'mmap_size': 1073741824,
+        'temp_store': 'memory',
+    },
+}
+
+# composite indexes of each table's user and time columns, created after bulk loading so per-user time
+# windows are read as index range scans already in timestamp order
+TABLE_INDEXES = {
+    'coordinates': [('user_id', 'timestamp_UTC')],
+    'prompt_responses': [('user_id', 'displayed_at_UTC')],
+    'cancelled_prompt_responses': [('user_id', 'displayed_at_UTC')],
+    'detected_trip_coordinates': [('user_id', 'timestamp_UTC')],
+    'detected_trip_day_summaries': [('user_id', 'date')],
+}
+
+# maximum number of users within the `IN (...)` clause of a query, below SQLite's limit of query variables
+IN_QUERY_CHUNK_SIZE = 500
+
+# NumPy types of the coordinates table columns returned by `Database.load_coordinates_array`
+COORDINATE_ARRAY_DTYPES = {
+    'id': np.int64,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'altitude': np.float64,
+    'speed': np.float64,
+    'direction': np.float64,
+    'h_accuracy': np.float64,
+    'v_accuracy': np.float64,
+    'acceleration_x': np.float64,
+    'acceleration_y': np.float64,
+    'acceleration_z': np.float64,
+    'point_type': object,
+    'mode_detected': object,
+    'timestamp_UTC': 'datetime64[s]',
+    'timestamp_epoch': np.int64,
+    'easting': np.float64,
+    'northing': np.float64,
+    'zone_num': object,
+    'zone_letter': object,
+}
+
 
 class Database(object):
     '''
@@ -42,8 +110,18 @@ class Database(object):
         self.config = config
         database_fp = temp_path(f'{self.config.SURVEY_NAME}.sqlite')
 
+        # the `auto` profile begins with the analysis pragmas and switches during setup
+        profile = getattr(self.config, 'DATABASE_PROFILE', None)
+        if profile == 'auto':
+            profile = 'analysis'
+        if profile and profile not in DATABASE_PROFILES:
+            raise Exception(
+                f"Database profile not recognized: {profile} Valid options: auto, {', '.join(DATABASE_PROFILES)}"
+            )
+        pragmas = DATABASE_PROFILES.get(profile)
+
         self.db = deferred_db
-        self.db.init(database_fp)
+        self.db.init(database_fp, pragmas=pragmas)
 
     def create(self):
         '''
@@ -59,9 +137,70 @@ class Database(object):
                 DetectedTripDaySummary,
                 SubwayStationEntrance,
                 UserLocation,
+                DirtyUser,
+                ProcessingLedger,
             ]
         )
 
+    def set_profile(self, profile):
+        '''
+        Applies the SQLite pragmas of a performance profile to the cache database connection, including
+        any connections opened later. The page size only takes effect for a newly created database.
+
+        :param profile: The name of the profile: ``bulk_load`` or ``analysis``
+
+        :type profile:  str
+        '''
+        if profile not in DATABASE_PROFILES:
+            raise Exception(f"Database profile not recognized: {profile} Valid options: {', '.join(DATABASE_PROFILES)}")
+        logger.info(f"Setting database profile: {profile}")
+        for key, value in DATABASE_PROFILES[profile].items():
+            self.db.pragma(key, value, permanent=True)
+        # fold the write-ahead log written so far back into the database file
+        self.db.execute_sql('PRAGMA wal_checkpoint(TRUNCATE);')
+
+    def drop_indexes(self, Model):
+        '''
+        Drops the non-unique indexes of a table to speed up bulk loading. Recreate them afterwards
+        with :py:meth:`create_indexes`.
+
+        :param Model: Peewee database model of the table
+        '''
+        table_name = Model._meta.table_name
+        for index in self.db.get_indexes(table_name):
+            if not index.unique:
+                self.db.execute_sql(f'DROP INDEX IF EXISTS "{index.name}";')
+
+    def create_indexes(self, Model=None):
+        '''
+        Creates the composite user and time indexes for a table, or for all tables when a model is not
+        supplied, if they do not already exist. Returns the names of the newly created indexes.
+
+        :param Model: Peewee database model of the table
+
+        :rtype: list of str
+        '''
+        table_names = [Model._meta.table_name] if Model else list(TABLE_INDEXES.keys())
+        created = []
+        for table_name in table_names:
+            existing = {index.name for index in self.db.get_indexes(table_name)}
+            for columns in TABLE_INDEXES.get(table_name, []):
+                index_name = '_'.join([table_name] + list(columns))
+                if index_name in existing:
+                    continue
+                logger.info(f"Creating index {index_name}...")
+                columns_str = ', '.join([f'"{c}"' for c in columns])
+                self.db.execute_sql(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({columns_str});')
+                created.append(index_name)
+        return created
+
+    def analyze(self):
+        '''
+        Gathers table and index statistics for the SQLite query planner.
+        '''
+        logger.info("Analyzing cache database...")
+        self.db.execute_sql('ANALYZE;')
+
     def drop(self):
         '''
         Drops all cache database tables.
@@ -75,25 +214,77 @@ class Database(object):
                 DetectedTripCoordinate,
                 DetectedTripDaySummary,
                 SubwayStationEntrance,
+                DirtyUser,
+                ProcessingLedger,
             ]
         )
 
+    def migrate(self):
+        '''
+        Adds any tables, columns and indexes introduced by newer versions of itinerum-tripkit to an existing
+        cache database and populates them.
+        '''
+        self.db.create_tables([DirtyUser, ProcessingLedger])
+        if self.create_indexes():
+            self.analyze()
+
+        coordinates_columns = {c.name for c in self.db.get_columns(Coordinate._meta.table_name)}
+        projection_fields = [Coordinate.easting, Coordinate.northing, Coordinate.zone_num, Coordinate.zone_letter]
+        missing_fields = [f for f in projection_fields if f.column_name not in coordinates_columns]
+        if missing_fields:
+            logger.info("Adding projected coordinates columns to cache database...")
+            migrator = SqliteMigrator(self.db)
+            migrate(*[migrator.add_column(Coordinate._meta.table_name, f.column_name, f) for f in missing_fields])
+            self.update_coordinates_projection()
+
+    def update_coordinates_projection(self):
+        '''
+        Projects any coordinates without a stored UTM easting and northing in batches for each user. A user's
+        coordinates are all projected within the UTM zone of their first coordinate.
+        '''
+        query = '''SELECT id, latitude, longitude FROM coordinates
+                   WHERE user_id = ? AND easting IS NULL ORDER BY timestamp_UTC;'''
+        update_query = '''UPDATE coordinates SET easting = ?, northing = ?, zone_num = ?, zone_letter = ?
+                          WHERE id = ?;'''
+        user_ids = [row[0] for row in self.db.execute_sql('''SELECT DISTINCT user_id FROM coordinates;''')]
+        with self.db.atomic():
+            for idx, user_id in enumerate(user_ids, start=1):
+                rows = self.db.execute_sql(query, [user_id]).fetchall()
+                if not rows:
+                    continue
+                logger.info(f"Projecting coordinates for user {idx}/{len(user_ids)}...")
+                ids, latitudes, longitudes = zip(*rows)
+                eastings, northings, zone_num, zone_letter = geo.project_utm(latitudes, longitudes)
+                updates = [
+                    (easting, northing, zone_num, zone_letter, row_id)
+                    for easting, northing, row_id in zip(eastings.tolist(), northings.tolist(), ids)
+                ]
+                self.db.cursor().executemany(update_query, updates)
+
     def delete_user_from_table(self, Model, user):
         '''
         Deletes a given user's records from a table in preparation for overwriting.
         '''
         Model.delete().where(Model.user == user.uuid).execute()
 
-    def bulk_insert(self, Model, rows, chunk_size=50000):
+    def bulk_insert(self, Model, rows, chunk_size=50000, on_chunk=None):
         '''
-        Bulk insert an iterable of dictionaries into a supplied Peewee model by ``chunk_size``.
+        Bulk insert an iterable of dictionaries into a supplied Peewee model by ``chunk_size``. When called
+        within an open transaction (e.g., ``with database.db.atomic():``), rows are written as part of that
+        transaction instead of committing each chunk.
 
         :param Model:      Peewee database model of target table for inserts.
         :param rows:       Iterable of dictionaries matching table model for bulk insert.
         :param chunk_size: Number of rows to insert per transaction.
+        :param on_chunk:   Function called after each chunk is inserted with the range of row ids
+                           assigned to the chunk's rows (in order of insertion).
 
         :type chunk_size:  int, optional
         :type rows:        list
+        :type on_chunk:    function, optional
+
+        :returns: The row ids of the inserted rows in order of insertion.
+        :rtype: list of int
         '''
         # Note: Peewee runs into "TOO MANY SQL VARIABLES" limits across systems with similar
         # versions of Python. The alternative below is to write the bulk insert operations using
@@ -111,7 +302,27 @@ class Database(object):
         query = f'''INSERT INTO {table_name} ({columns_str}) VALUES ({values_str});'''
         rows_inserted = 0
         inserted_row_ids = []
-        cur.execute('''BEGIN TRANSACTION;''')
+        # join the caller's transaction if one is open, otherwise commit by chunk
+        manage_transactions = not conn.in_transaction
+        # time spent writing to the database, excluding the time taken to generate the input rows
+        write_s = 0.0
+
+        def _write_chunk(chunk):
+            nonlocal write_s
+            start = time.perf_counter()
+            cur.executemany(query, chunk)
+            # rowids are assigned sequentially since SQLite allows only a single writer
+            last_row_id = cur.execute('''SELECT last_insert_rowid();''').fetchone()[0]
+            row_ids = range(last_row_id - len(chunk) + 1, last_row_id + 1)
+            inserted_row_ids.extend(row_ids)
+            if on_chunk:
+                on_chunk(row_ids)
+            if manage_transactions:
+                cur.execute('''COMMIT;''')
+            write_s += time.perf_counter() - start
+
+        if manage_transactions:
+            cur.execute('''BEGIN TRANSACTION;''')
         for row in rows:
             if not row:
                 continue
@@ -134,24 +345,263 @@ class Database(object):
                 logger.info(
                     f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: bulk inserting {chunk_size} rows ({rows_inserted})..."
                 )
-                cur.executemany(query, chunk)
-                cur.execute('''COMMIT;''')
-                start_row_id = cur.lastrowid - chunk_size + 1
-                row_ids = range(start_row_id, cur.lastrowid + 1)
-                inserted_row_ids.extend(row_ids)
-                cur.execute('''BEGIN TRANSACTION;''')
+                _write_chunk(chunk)
+                if manage_transactions:
+                    cur.execute('''BEGIN TRANSACTION;''')
                 # reset chunk
                 chunk = []
         # commit all remaining transactions
         if chunk:
-            cur.executemany(query, chunk)
+            rows_inserted += len(chunk)
+            _write_chunk(chunk)
+        elif manage_transactions:
             cur.execute('''COMMIT;''')
-            start_row_id = cur.lastrowid - len(chunk) + 1
-            row_ids = range(start_row_id, cur.lastrowid + 1)
-            inserted_row_ids.extend(row_ids)
-        conn.commit()
+        metrics.DB_ROWS_WRITTEN.inc(rows_inserted, table=table_name)
+        metrics.DB_WRITE_SECONDS.inc(write_s, table=table_name)
         return inserted_row_ids
 
+    def bulk_insert_columns(self, Model, batches):
+        '''
+        Bulk insert an iterable of column batches into a supplied Peewee model. Each batch is a dictionary
+        of equal-length lists of values by column name and is written as a single transaction. Table columns
+        missing from a batch are inserted as `NULL` and any extra keys are ignored. As with
+        :py:meth:`bulk_insert`, an already open transaction is joined instead of committing each batch.
+
+        :param Model:   Peewee database model of target table for inserts.
+        :param batches: Iterable of dictionaries of column values matching the table model.
+
+        :type batches:  list of dict
+
+        :rtype: int
+        '''
+        conn = self.db.connection()
+        cur = conn.cursor()
+        table_name = Model._meta.table_name
+        columns = list(Model._meta.columns.keys())
+        if 'id' in columns:
+            columns.remove('id')
+
+        columns_str = ','.join(columns)
+        values_str = ','.join(['?'] * len(columns))
+        query = f'''INSERT INTO {table_name} ({columns_str}) VALUES ({values_str});'''
+        rows_inserted = 0
+        manage_transactions = not conn.in_transaction
+        for batch in batches:
+            num_rows = len(next(iter(batch.values()), []))
+            if not num_rows:
+                continue
+            values = [batch[c] if c in batch else itertools.repeat(None, num_rows) for c in columns]
+            rows_inserted += num_rows
+            logger.info(
+                f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: bulk inserting {num_rows} rows ({rows_inserted})..."
+            )
+            start = time.perf_counter()
+            if manage_transactions:
+                cur.execute('''BEGIN TRANSACTION;''')
+            cur.executemany(query, zip(*values))
+            if manage_transactions:
+                cur.execute('''COMMIT;''')
+            metrics.DB_WRITE_SECONDS.inc(time.perf_counter() - start, table=table_name)
+        metrics.DB_ROWS_WRITTEN.inc(rows_inserted, table=table_name)
+        return rows_inserted
+
+    def user_ids(self):
+        '''
+        Returns the set of uuids (as hex strings) of all survey responses in the cache database.
+        '''
+        return {row[0] for row in self.db.execute_sql('''SELECT uuid FROM survey_responses;''')}
+
+    def latest_coordinates(self):
+        '''
+        Returns the epoch timestamp of each user's latest coordinate with the UTM zone their coordinates
+        are projected within, by user uuid (as hex strings).
+
+        :rtype: dict
+        '''
+        # SQLite returns the bare zone columns from the row with the maximum timestamp
+        query = '''SELECT user_id, MAX(timestamp_epoch), zone_num, zone_letter FROM coordinates
+                   GROUP BY user_id;'''
+        return {row[0]: row[1:] for row in self.db.execute_sql(query)}
+
+    def prompt_uuids(self, Model):
+        '''
+        Returns the set of prompt uuids (as hex strings) loaded to a prompt responses table.
+
+        :param Model: Peewee database model of the prompt responses or cancelled prompt responses table
+        '''
+        query = f'''SELECT DISTINCT prompt_uuid FROM {Model._meta.table_name};'''
+        return {uuid.UUID(hex=row[0]).hex for row in self.db.execute_sql(query)}
+
+    def mark_dirty_users(self, user_ids):
+        '''
+        Marks users as requiring re-processing after new data has been loaded for them. A user
+        already marked has their time of marking updated.
+
+        :param user_ids: The uuids of the users with new data
+
+        :type user_ids:  iterable
+        '''
+        marked_at = datetime.utcnow()
+        rows = [(uuid.UUID(hex=str(user_id)).hex, marked_at) for user_id in user_ids]
+        query = '''INSERT OR REPLACE INTO dirty_users (user_id, marked_at_UTC) VALUES (?, ?);'''
+        with self.db.atomic():
+            self.db.cursor().executemany(query, rows)
+        return len(rows)
+
+    def dirty_users(self):
+        '''
+        Returns the uuids (as hex strings) of users marked as requiring re-processing with the UTC time
+        they were last marked.
+
+        :rtype: dict
+        '''
+        return {row.user_id.hex: row.marked_at_UTC for row in DirtyUser.select()}
+
+    def clear_dirty_users(self, user_ids=None):
+        '''
+        Removes the re-processing marks of the given users, or of all users when omitted.
+
+        :param user_ids: The uuids of the users to unmark
+
+        :type user_ids:  iterable, optional
+        '''
+        query = DirtyUser.delete()
+        if user_ids is not None:
+            query = query.where(DirtyUser.user.in_([uuid.UUID(hex=str(u)).hex for u in user_ids]))
+        return query.execute()
+
+    def record_processing(self, user_ids, process, algorithm, parameters_hash):
+        '''
+        Records in the processing ledger that a process has been run for users with the latest coordinate
+        timestamp of each user at the time of recording, replacing any previous record of the process.
+
+        :param user_ids:        The uuids of the processed users
+        :param process:         The name of the process output, i.e., ``trips`` or ``complete_days``
+        :param algorithm:       The name of the algorithm run
+        :param parameters_hash: The hash of the algorithm parameters, see
+                                :py:func:`tripkit.utils.misc.parameters_hash`
+
+        :type user_ids:         iterable
+        '''
+        processed_at = datetime.utcnow()
+        user_ids = [uuid.UUID(hex=str(user_id)).hex for user_id in user_ids]
+        query = '''INSERT OR REPLACE INTO processing_ledger
+                   (user_id, process, algorithm, parameters_hash, last_coordinate_epoch, processed_at_UTC)
+                   SELECT ?, ?, ?, ?, MAX(timestamp_epoch), ? FROM coordinates WHERE user_id = ?;'''
+        rows = [(user_id, process, algorithm, parameters_hash, processed_at, user_id) for user_id in user_ids]
+        with self.db.atomic():
+            self.db.cursor().executemany(query, rows)
+        return len(rows)
+
+    def users_needing_processing(self, process, algorithm, parameters_hash, depends_on=None):
+        '''
+        Returns the uuids (as hex strings) of users with coordinates for which a process has not been run with
+        the given algorithm and parameters since their data last changed. A user needs processing when they have
+        newer coordinates than when last processed, have been marked as dirty since or, with `depends_on`, the
+        process they depend on has been run since.
+
+        :param process:         The name of the process output, i.e., ``trips`` or ``complete_days``
+        :param algorithm:       The name of the algorithm to run
+        :param parameters_hash: The hash of the algorithm parameters to run with
+        :param depends_on:      The name of a process whose output is the input of this process
+
+        :type depends_on:       str, optional
+
+        :rtype: list of str
+        '''
+        query = '''SELECT c.user_id FROM
+                       (SELECT user_id, MAX(timestamp_epoch) AS last_epoch FROM coordinates GROUP BY user_id) c
+                   LEFT JOIN processing_ledger l ON l.user_id = c.user_id AND l.process = ?
+                   LEFT JOIN processing_ledger u ON u.user_id = c.user_id AND u.process = ?
+                   LEFT JOIN dirty_users d ON d.user_id = c.user_id
+                   WHERE l.user_id IS NULL
+                       OR l.algorithm != ?
+                       OR l.parameters_hash != ?
+                       OR c.last_epoch > l.last_coordinate_epoch
+                       OR d.marked_at_UTC > l.processed_at_UTC
+                       OR u.processed_at_UTC > l.processed_at_UTC
+                   ORDER BY c.user_id;'''
+        params = [process, depends_on, algorithm, parameters_hash]
+        return [row[0] for row in self.db.execute_sql(query, params)]
+
+    def count_user_coordinates(self, start=None, end=None):
+        '''
+        Returns the number of coordinates of each user with coordinates by uuid (as hex strings)
+        using a single grouped query.
+
+        :param start: `Optional.` Naive datetime object (set within UTC) for the start of the
+                      period to count coordinates within (inclusive).
+        :param end:   `Optional.` Naive datetime object (set within UTC) for the end of the
+                      period to count coordinates within (inclusive).
+
+        :rtype: dict
+        '''
+        query = Coordinate.select(Coordinate.user, fn.COUNT(Coordinate.id))
+        if start:
+            query = query.where(Coordinate.timestamp_UTC >= start)
+        if end:
+            query = query.where(Coordinate.timestamp_UTC <= end)
+        return {user_id.hex: count for user_id, count in query.group_by(Coordinate.user).tuples()}
+
+    def load_users_bulk(self, uuids, start=None, end=None, load_trips=False, load_locations=False):
+        '''
+        Loads a batch of users by ``uuid`` to itinerum-tripkit :py:class:`User` objects. The survey responses,
+        user locations and detected trips of all users are each fetched with a single query (by
+        `IN_QUERY_CHUNK_SIZE` users) instead of separate queries for every user. Users not found are omitted.
+
+        :param uuids:          The uuids of the users to load
+        :param start:          `Optional.` Naive datetime object (set within UTC) for
+                               selecting the users' coordinates start period.
+        :param end:            `Optional.` Naive datetime object (set within UTC) for
+                               selecting the users' coordinates end period.
+        :param load_trips:     Supply `True` to load the users' trips
+        :param load_locations: Supply `True` to load the users' activity locations
+
+        :type uuids:           list
+        :type load_trips:      boolean, optional
+        :type load_locations:  boolean, optional
+
+        :rtype: list of :py:class:`tripkit.models.User`
+        '''
+        uuids = [uuid.UUID(hex=str(u)).hex for u in uuids]
+        db_users = {}
+        user_locations = collections.defaultdict(list)
+        trip_coordinates = collections.defaultdict(list)
+        for uuids_chunk in chunked(uuids, IN_QUERY_CHUNK_SIZE):
+            for db_user in UserSurveyResponse.select().where(UserSurveyResponse.uuid.in_(uuids_chunk)):
+                db_users[db_user.uuid.hex] = db_user
+            if load_locations:
+                for loc in UserLocation.select().where(UserLocation.user.in_(uuids_chunk)).order_by(UserLocation.id):
+                    user_locations[loc.user_id.hex].append(loc)
+            if load_trips:
+                query = (
+                    DetectedTripCoordinate.select(
+                        DetectedTripCoordinate.user,
+                        DetectedTripCoordinate.trip_num,
+                        DetectedTripCoordinate.trip_code,
+                        *self._trip_point_fields(),
+                    )
+                    .where(DetectedTripCoordinate.user.in_(uuids_chunk))
+                    .order_by(
+                        DetectedTripCoordinate.user, DetectedTripCoordinate.timestamp_UTC, DetectedTripCoordinate.id
+                    )
+                    .tuples()
+                )
+                for row in query:
+                    trip_coordinates[row[0].hex].append(row[1:])
+
+        users = []
+        for u in uuids:
+            if u not in db_users:
+                continue
+            user = self._init_user(db_users[u], start=start, end=end)
+            if load_trips:
+                user.trips = self._group_trips(trip_coordinates[u], start=start, end=end)
+            if load_locations:
+                user.activity_locations = self._activity_locations(user_locations[u])
+            users.append(user)
+        return users
+
     def count_users(self):
         '''
         Returns a count of all survey responses in cache database.
@@ -181,7 +631,9 @@ class Database(object):
         db_user = UserSurveyResponse.get_or_none(uuid=uuid)
         if not db_user:
             raise UserNotFoundError(uuid)
+        return self._init_user(db_user, start=start, end=end)
 
+    def _init_user(self, db_user, start=None, end=None):
         user = User(db_user)
         if start and end:
             user.coordinates = user.coordinates.where(
@@ -225,6 +677,49 @@ class Database(object):
             )
         return user
 
+    def load_coordinates_array(self, uuid, start=None, end=None, columns=None):
+        '''
+        Loads a user's coordinates as a dictionary of NumPy column arrays using a single raw SQL query
+        instead of creating a peewee model instance for each row. Null values are returned as `NaN` within
+        numeric columns and `timestamp_UTC` is returned as a `datetime64` array derived from `timestamp_epoch`.
+
+        :param uuid:    A individual user's UUID from within an Itinerum survey.
+        :param start:   `Optional.` Naive datetime object (set within UTC) for
+                        selecting a user's coordinates start period (inclusive).
+        :param end:     `Optional.` Naive datetime object (set within UTC) for
+                        selecting a user's coordinates end period (inclusive).
+        :param columns: `Optional.` Subset of coordinates table column names to load.
+
+        :rtype: dict of numpy.ndarray
+        '''
+        if not columns:
+            columns = list(COORDINATE_ARRAY_DTYPES.keys())
+        # `timestamp_UTC` is derived from the epoch column to avoid parsing datetime strings
+        select_columns = [c for c in columns if c != 'timestamp_UTC']
+        if 'timestamp_UTC' in columns and 'timestamp_epoch' not in select_columns:
+            select_columns.append('timestamp_epoch')
+
+        query = f'''SELECT {','.join(select_columns)} FROM coordinates WHERE user_id = ?'''
+        params = [UserSurveyResponse.uuid.db_value(uuid)]
+        if start:
+            query += ''' AND timestamp_epoch >= ?'''
+            params.append(calendar.timegm(start.timetuple()))
+        if end:
+            query += ''' AND timestamp_epoch <= ?'''
+            params.append(calendar.timegm(end.timetuple()))
+        query += ''' ORDER BY timestamp_UTC;'''
+
+        rows = self.db.execute_sql(query, params).fetchall()
+        values = list(zip(*rows)) if rows else [()] * len(select_columns)
+        arrays = {}
+        for column, column_values in zip(select_columns, values):
+            arrays[column] = np.array(column_values, dtype=COORDINATE_ARRAY_DTYPES[column])
+        if 'timestamp_UTC' in columns:
+            arrays['timestamp_UTC'] = arrays['timestamp_epoch'].astype(COORDINATE_ARRAY_DTYPES['timestamp_UTC'])
+            if 'timestamp_epoch' not in columns:
+                del arrays['timestamp_epoch']
+        return arrays
+
     def clear_trips(self, user=None):
         '''
         Clears the detected trip points table or for an individual user.
@@ -236,35 +731,86 @@ class Database(object):
         else:
             DetectedTripCoordinate.delete().execute()
 
-    def load_trips(self, user, start=None, end=None):
+    def load_trips(self, user, start=None, end=None, min_trip_num=None, max_trip_num=None):
         '''
         Load the sorted trips for a given user as list.
 
-        :param user: A database user response record with a populated
-                     `detected_trip_coordinates` relation.
+        :param user:         A database user response record with a populated
+                             `detected_trip_coordinates` relation.
+        :param min_trip_num: Supply to load only the trips numbered from this trip onward (inclusive)
+        :param max_trip_num: Supply to load only the trips numbered up to this trip (inclusive)
+
+        :type min_trip_num:  integer, optional
+        :type max_trip_num:  integer, optional
         '''
+        trip_coordinates = user.detected_trip_coordinates.select(
+            DetectedTripCoordinate.trip_num, DetectedTripCoordinate.trip_code, *self._trip_point_fields()
+        )
+        if min_trip_num is not None:
+            trip_coordinates = trip_coordinates.where(DetectedTripCoordinate.trip_num >= min_trip_num)
+        if max_trip_num is not None:
+            trip_coordinates = trip_coordinates.where(DetectedTripCoordinate.trip_num <= max_trip_num)
+        return self._group_trips(trip_coordinates.tuples(), start=start, end=end)
+
+    @staticmethod
+    def _trip_point_fields():
+        # detected trip coordinates columns in the order of the `TripArray` columns
+        return [
+            DetectedTripCoordinate.id,
+            DetectedTripCoordinate.latitude,
+            DetectedTripCoordinate.longitude,
+            DetectedTripCoordinate.h_accuracy,
+            DetectedTripCoordinate.distance_before,
+            DetectedTripCoordinate.trip_distance,
+            DetectedTripCoordinate.period_before,
+            DetectedTripCoordinate.timestamp_UTC,
+        ]
+
+    @staticmethod
+    def _group_trips(rows, start=None, end=None):
+        # group rows of (trip_num, trip_code, *trip point fields) to trips stored as column arrays
         trips = {}
-        for c in user.detected_trip_coordinates:
-            if start and c.timestamp_UTC <= start:
+        for row in rows:
+            timestamp_UTC = row[-1]
+            if start and timestamp_UTC <= start:
                 continue
-            if end and c.timestamp_UTC >= end:
+            if end and timestamp_UTC >= end:
                 continue
 
-            point = TripPoint(
-                database_id=c.id,
-                latitude=c.latitude,
-                longitude=c.longitude,
-                h_accuracy=c.h_accuracy,
-                distance_before=c.distance_before,
-                trip_distance=c.trip_distance,
-                period_before=c.period_before,
-                timestamp_UTC=c.timestamp_UTC,
-            )
+            trip_num = row[0]
+            if trip_num not in trips:
+                trips[trip_num] = (row[1], [])
+            trips[trip_num][1].append(row[2:])
+        return [
+            Trip.from_array(trip_num, trip_code, TripArray(*zip(*points)))
+            for trip_num, (trip_code, points) in sorted(trips.items())
+        ]
 
-            if c.trip_num not in trips:
-                trips[c.trip_num] = Trip(num=c.trip_num, trip_code=c.trip_code)
-            trips[c.trip_num].points.append(point)
-        return [value for _, value in sorted(trips.items())]
+    def tail_trip_num(self, user, num_trips, exclude_codes=None):
+        '''
+        Returns the number of a user's `num_trips`-last saved trip or `None` when fewer trips have been saved.
+
+        :param user:          A database user response record.
+        :param num_trips:     The number of trips from the end of the user's trips
+        :param exclude_codes: Trip codes not counted as trips (e.g., missing trips)
+
+        :type num_trips:      integer
+        :type exclude_codes:  list of integer, optional
+        '''
+        query = DetectedTripCoordinate.select(DetectedTripCoordinate.trip_num).where(
+            DetectedTripCoordinate.user == user.uuid
+        )
+        if exclude_codes:
+            query = query.where(DetectedTripCoordinate.trip_code.not_in(list(exclude_codes)))
+        trip_nums = (
+            query.group_by(DetectedTripCoordinate.trip_num)
+            .order_by(DetectedTripCoordinate.trip_num.desc())
+            .limit(num_trips)
+            .tuples()
+        )
+        trip_nums = [trip_num for trip_num, in trip_nums]
+        if len(trip_nums) == num_trips:
+            return trip_nums[-1]
 
     def load_trip_day_summaries(self, user):
         '''
@@ -300,9 +846,15 @@ class Database(object):
 
         :param user: A database user response record
         '''
+        return self._activity_locations(list(user.user_locations))
+
+    @staticmethod
+    def _activity_locations(user_locations):
+        eastings, northings, zone_num, zone_letter = geo.project_utm(
+            [loc.latitude for loc in user_locations], [loc.longitude for loc in user_locations]
+        )
         locations = []
-        for loc in user.user_locations:
-            easting, northing, zone_num, zone_letter = utm.from_latlon(loc.latitude, loc.longitude)
+        for loc, easting, northing in zip(user_locations, eastings.tolist(), northings.tolist()):
             locations.append(
                 ActivityLocation(
                     label=loc.label,
@@ -311,16 +863,16 @@ class Database(object):
                     easting=easting,
                     northing=northing,
                     zone_num=zone_num,
-                    zone_letter=zone_letter
+                    zone_letter=zone_letter,
                 )
             )
         return locations
 
-
     def save_trips(self, user, trips, overwrite=True):
         '''
         Saves detected trips from processing algorithms to cache database. This
-        table will be recreated on each save by default.
+        table will be recreated on each save by default. Database ids are attached to
+        the trip points as each chunk of rows is inserted.
 
         :param user:  A database user response record associated with the trip records.
         :param trips: Iterable of detected trips from a trip processing algorithm.
@@ -328,12 +880,17 @@ class Database(object):
         :type user: :py:class:`tripkit.models.User`
         :type trips: list of :py:class:`tripkit.models.Trip`
         '''
+        # points written to the database that are awaiting their row ids
+        pending_points = collections.deque()
 
-        def _trip_row_filter(trip_rows, model_fields):
-            row = {}
+        def _trip_row_filter(trip_rows):
             for trip in trip_rows:
+                if trip.is_array_backed:
+                    yield from _trip_array_row_filter(trip)
+                    continue
                 for point in trip.points:
-                    row = {
+                    pending_points.append(point)
+                    yield {
                         'user_id': user.uuid,
                         'trip_num': trip.num,
                         'trip_code': trip.trip_code,
@@ -345,23 +902,85 @@ class Database(object):
                         'period_before': point.period_before,
                         'timestamp_UTC': point.timestamp_UTC,
                     }
-                    yield row
+
+        def _trip_array_row_filter(trip):
+            array = trip.array
+            columns = zip(
+                array.latitude.tolist(),
+                array.longitude.tolist(),
+                array.h_accuracy.tolist(),
+                array.distance_before.tolist(),
+                array.trip_distance.tolist(),
+                array.period_before.tolist(),
+                array.timestamp_UTC.tolist(),
+            )
+            for idx, (lat, lon, h_accuracy, distance_before, trip_distance, period_before, timestamp_UTC) in enumerate(
+                columns
+            ):
+                pending_points.append((trip, idx))
+                yield {
+                    'user_id': user.uuid,
+                    'trip_num': trip.num,
+                    'trip_code': trip.trip_code,
+                    'latitude': lat,
+                    'longitude': lon,
+                    'h_accuracy': h_accuracy,
+                    'distance_before': distance_before,
+                    'trip_distance': trip_distance,
+                    'period_before': period_before,
+                    'timestamp_UTC': timestamp_UTC,
+                }
+
+        # attach data to original user's object with database id
+        def _attach_row_ids(row_ids):
+            for row_id in row_ids:
+                point = pending_points.popleft()
+                if isinstance(point, tuple):
+                    trip, idx = point
+                    trip.set_database_id(idx, row_id)
+                else:
+                    point.database_id = row_id
 
         if overwrite:
             logger.info("overwriting user trips information...")
             self.delete_user_from_table(DetectedTripCoordinate, user)
 
-        model_fields = set(DetectedTripCoordinate._meta.sorted_field_names)
-        db_row_ids = self.bulk_insert(DetectedTripCoordinate, _trip_row_filter(trips, model_fields))
-
-        # attach data to original user's object with database id
-        idx = 0
-        for trip in trips:
-            for point in trip.points:
-                point.database_id = db_row_ids[idx]
-                idx += 1
+        self.bulk_insert(DetectedTripCoordinate, _trip_row_filter(trips), on_chunk=_attach_row_ids)
         user.trips = trips
 
+    def replace_trips(self, user, trips, from_trip_num):
+        '''
+        Replaces a user's saved trips numbered from `from_trip_num` onward with newly detected trips, such as
+        the trips returned by an incremental trip detection run, within a single transaction.
+
+        :param user:          A database user response record associated with the trip records.
+        :param trips:         Iterable of detected trips numbered from `from_trip_num`.
+        :param from_trip_num: The number of the first saved trip to replace.
+
+        :type user:           :py:class:`tripkit.models.User`
+        :type trips:          list of :py:class:`tripkit.models.Trip`
+        :type from_trip_num:  integer
+        '''
+        with self.db.atomic():
+            DetectedTripCoordinate.delete().where(
+                DetectedTripCoordinate.user == user.uuid, DetectedTripCoordinate.trip_num >= from_trip_num
+            ).execute()
+            self.save_trips(user, trips, overwrite=False)
+
+    def save_users_trips(self, users_trips, overwrite=True):
+        '''
+        Saves detected trips for multiple users to the cache database within a single transaction.
+
+        :param users_trips: Iterable of each user with their detected trips from a trip processing algorithm.
+        :param overwrite:   Supply `False` to keep the users' previously saved trips.
+
+        :type users_trips: list of tuple(:py:class:`tripkit.models.User`, list of :py:class:`tripkit.models.Trip`)
+        :type overwrite:   boolean, optional
+        '''
+        with self.db.atomic():
+            for user, trips in users_trips:
+                self.save_trips(user, trips, overwrite=overwrite)
+
     def save_trip_day_summaries(self, user, trip_day_summaries, timezone, overwrite=True):
         '''
         Saves the daily summaries for detected trip days to cache database. This
@@ -389,14 +1008,16 @@ class Database(object):
                 dict_row['end_point_id'] = row.end_point.database_id if row.end_point else None
                 yield dict_row
 
-        if not trip_day_summaries:
-            logger.info(f"no daily summaries for {user.uuid}. Has trip detection been run?")
-            return
-
+        # summaries are cleared before checking for new ones so a user whose trips were removed does not keep
+        # the summaries from a previous run, as with `save_trips`
         if overwrite:
             logger.info("overwriting user daily summaries information...")
             self.delete_user_from_table(DetectedTripDaySummary, user)
 
+        if not trip_day_summaries:
+            logger.info(f"no daily summaries for {user.uuid}. Has trip detection been run?")
+            return
+
         model_fields = set(DetectedTripDaySummary._meta.sorted_field_names)
         self.bulk_insert(DetectedTripDaySummary, _row_filter(trip_day_summaries, model_fields))
 
@@ -474,6 +1095,10 @@ class Coordinate(BaseModel):
     mode_detected = TextField(null=True)
     timestamp_UTC = DateTimeField()
     timestamp_epoch = IntegerField()
+    easting = FloatField(null=True)
+    northing = FloatField(null=True)
+    zone_num = IntegerField(null=True)
+    zone_letter = TextField(null=True)
 
 
 class PromptResponse(BaseModel):
@@ -553,3 +1178,24 @@ class UserLocation(BaseModel):
     label = TextField()
     latitude = FloatField()
     longitude = FloatField()
+
+
+class DirtyUser(BaseModel):
+    class Meta:
+        table_name = 'dirty_users'
+
+    user = ForeignKeyField(UserSurveyResponse, backref='dirty_users_backref', unique=True)
+    marked_at_UTC = DateTimeField()
+
+
+class ProcessingLedger(BaseModel):
+    class Meta:
+        table_name = 'processing_ledger'
+        indexes = ((('user', 'process'), True),)
+
+    user = ForeignKeyField(UserSurveyResponse, backref='processing_ledger_backref')
+    process = TextField()
+    algorithm = TextField()
+    parameters_hash = TextField()
+    last_coordinate_epoch = IntegerField(null=True)
+    processed_at_UTC = DateTimeField()
@@ -3,15 +3,20 @@
 #
 # This module implements the core TripKit object
 from datetime import datetime
+import functools
 import logging
 import time
 
 from .io import IO
+from . import cache
+from . import metrics
 from . import models
+from . import pipeline
 from . import process
 from .csvparser import ItinerumCSVParser, QstarzCSVParser
 from .database import Database, UserSurveyResponse
 from .database import Coordinate, PromptResponse, CancelledPromptResponse, DetectedTripCoordinate, SubwayStationEntrance
+from .utils.misc import parameters_hash, temp_path
 
 
 logger = logging.getLogger('itinerum-tripkit.main')
@@ -46,6 +51,8 @@ class TripKit(object):
 
         self._database = Database(self.config)
         self._csv = self._init_csv_parser()
+        self._feature_cache = self._init_feature_cache()
+        self._subway_entrances = None
 
         # attach I/O functions and extensions as objects
         self._io = IO(self.config)
@@ -54,13 +61,26 @@ class TripKit(object):
 
     def _init_csv_parser(self):
         if self.config.INPUT_DATA_TYPE == 'itinerum':
-            return ItinerumCSVParser(self._database)
+            return ItinerumCSVParser(self._database, self.config)
         if self.config.INPUT_DATA_TYPE == 'qstarz':
             return QstarzCSVParser(self.config, self._database)
         raise Exception(
             f"Input data type not recognized: {self.config.INPUT_DATA_TYPE} Valid options: itinerum, qstarz"
         )
 
+    def _init_feature_cache(self):
+        feature_cache_fp = None
+        if getattr(self.config, 'FEATURE_CACHE_TO_DISK', False):
+            feature_cache_fp = temp_path(f'{self.config.SURVEY_NAME}.features.pickle')
+        feature_cache = cache.FeatureCache(path=feature_cache_fp, source_key=self._feature_cache_source_key)
+        cache.set_default(feature_cache)
+        return feature_cache
+
+    def _feature_cache_source_key(self):
+        # features saved to disk are reused while the subway entrances they are built from are unchanged, with
+        # the same fingerprint that keys the cached features of the entrances
+        return self.feature_cache.fingerprint(self.subway_entrances)
+
     @property
     def csv(self):
         '''
@@ -75,6 +95,35 @@ class TripKit(object):
         '''
         return self._database
 
+    @property
+    def feature_cache(self):
+        '''
+        Provides access to the cache of survey-wide features (e.g., projected subway entrances) used
+        by the processing algorithms. This cache is used by default when an algorithm is not supplied
+        a `feature_cache` parameter.
+        '''
+        return self._feature_cache
+
+    @property
+    def subway_entrances(self):
+        '''
+        Provides the survey's subway station entrances, loaded from the cache database once and reused
+        as the trip detection parameters of every user (reloaded after setup).
+        '''
+        if self._subway_entrances is None:
+            if not SubwayStationEntrance.table_exists():
+                return []
+            self._subway_entrances = list(self.database.load_subway_entrances())
+        return self._subway_entrances
+
+    @property
+    def metrics(self):
+        '''
+        Provides access to the registry of metrics recorded by TripKit (e.g., rows ingested, users processed
+        and processing latencies), see :py:mod:`tripkit.metrics`.
+        '''
+        return metrics.REGISTRY
+
     @property
     def io(self):
         '''
@@ -89,22 +138,61 @@ class TripKit(object):
         '''
         return self._process
 
-    def setup(self, force=False, generate_null_survey=False):
+    def setup(self, force=False, generate_null_survey=False, workers=1, mode='create'):
         '''
-        Create the cache database tables if the ``UserSurveyResponse`` table does not exist.
+        Create the cache database tables if the ``UserSurveyResponse`` table does not exist. An existing
+        cache database is migrated to include any columns added by newer library versions.
+
+        With ``mode='append'``, the input data is instead appended to an existing cache database: only
+        rows not already loaded are inserted and the users with new data are marked as requiring
+        re-processing (see :py:meth:`tripkit.database.Database.dirty_users`).
 
         :param force:                Supply `True` to force creation of a new cache database
         :param generate_null_survey: Supply `True` to generate an empty survey responses table
                                      for coordinates-only data
+        :param workers:              Number of worker processes to parse the coordinates .csv in
+                                     parallel chunks, supply `None` to use the number of CPUs
+        :param mode:                 Supply `append` to load new rows of the input data to an existing
+                                     cache database
 
         :type force:                 boolean, optional
         :type generate_null_survey:  boolean, optional
+        :type workers:               integer, optional
+        :type mode:                  string, optional
         '''
+        if mode not in ('create', 'append'):
+            raise Exception(f"Setup mode not recognized: {mode} Valid options: create, append")
+        start = time.time()
+        self._subway_entrances = None
         if force:
             self.database.drop()
 
-        if not UserSurveyResponse.table_exists():
+        # ingest with the bulk loading database profile before switching to analysis
+        auto_profile = getattr(self.config, 'DATABASE_PROFILE', None) == 'auto'
+        if auto_profile:
+            self.database.set_profile('bulk_load')
+        try:
+            if mode == 'append' and UserSurveyResponse.table_exists():
+                self._append_tables()
+            else:
+                self._setup_tables(generate_null_survey, workers)
+        finally:
+            if auto_profile:
+                self.database.set_profile('analysis')
+        self._record_run('setup', start)
+
+    def _append_tables(self):
+        self.database.migrate()
+        updated_users = self.csv.append_export(self.config.INPUT_DATA_DIR)
+        self.database.mark_dirty_users(updated_users)
+        logger.info(f"Appended new data for {len(updated_users)} users.")
+
+    def _setup_tables(self, generate_null_survey, workers):
+        if UserSurveyResponse.table_exists():
+            self.database.migrate()
+        else:
             self.database.create()
+            self.feature_cache.clear()
             if getattr(self.config, 'SUBWAY_STATIONS_FP', None):
                 self.csv.load_subway_stations(self.config.SUBWAY_STATIONS_FP)
 
@@ -113,13 +201,14 @@ class TripKit(object):
                     self.csv.load_export_survey_responses(self.config.INPUT_DATA_DIR)
                 else:
                     self.csv.generate_null_survey(self.config.INPUT_DATA_DIR)
-                self.csv.load_export_coordinates(self.config.INPUT_DATA_DIR)
+                self.csv.load_export_coordinates(self.config.INPUT_DATA_DIR, workers=workers)
                 self.csv.load_export_prompt_responses(self.config.INPUT_DATA_DIR)
                 self.csv.load_export_cancelled_prompt_responses(self.config.INPUT_DATA_DIR)
             elif self.config.INPUT_DATA_TYPE == 'qstarz':
-                self.csv.generate_null_survey(self.config.INPUT_DATA_DIR)
-                self.csv.load_export_coordinates(self.config.INPUT_DATA_DIR)
+                self.csv.load_export_coordinates(self.config.INPUT_DATA_DIR, workers=workers, generate_null_survey=True)
                 self.csv.load_user_locations(self.config.INPUT_DATA_DIR)
+            self.database.create_indexes()
+            self.database.analyze()
 
     def check_setup(self):
         '''
@@ -158,29 +247,68 @@ class TripKit(object):
         self.check_setup()
 
         if uuid:
-            uuids = [uuid]
-        else:
-            uuids = [u.uuid for u in UserSurveyResponse.select(UserSurveyResponse.uuid)]
-            if limit:
-                uuids = uuids[:limit]
-
-        users = []
-        return_one = uuid is not None
-        for idx, _uuid in enumerate(uuids, start=1):
-            logger.info(f"Loading user from database: {idx}/{len(uuids)}...")
-
-            user = self.database.load_user(_uuid, start=start, end=end)
+            user = self.database.load_user(uuid, start=start, end=end)
             if user.coordinates.count() == 0:
-                logger.info(f"User {idx} has no points, skipped.")
-                continue
+                logger.info(f"User {uuid} has no points, skipped.")
+                return []
             if load_trips:
                 user.trips = self.database.load_trips(user, start=start, end=end)
             if load_locations:
                 user.activity_locations = self.database.load_activity_locations(user)
-            if return_one:
-                return user
-            users.append(user)
-        return users
+            return user
+
+        uuids = [u.uuid.hex for u in UserSurveyResponse.select(UserSurveyResponse.uuid)]
+        if limit:
+            uuids = uuids[:limit]
+        coordinate_counts = self.database.count_user_coordinates(start=start, end=end)
+        uuids_with_points = [u for u in uuids if u in coordinate_counts]
+        if len(uuids_with_points) < len(uuids):
+            logger.info(f"{len(uuids) - len(uuids_with_points)} users have no points, skipped.")
+
+        logger.info(f"Loading {len(uuids_with_points)} users from database...")
+        return self.database.load_users_bulk(
+            uuids_with_points, start=start, end=end, load_trips=load_trips, load_locations=load_locations
+        )
+
+    def iter_users(self, batch_size=100, load_trips=True, load_locations=True, start=None, end=None):
+        '''
+        Generator of all available users as :py:class:`tripkit.models.User` objects from the database for
+        processing survey-wide data without holding every user in memory. Users without coordinates are skipped
+        using a single grouped query, survey responses are fetched for `batch_size` users at a time and trips
+        are loaded on the first access of a user's ``trips``.
+
+        :param batch_size:     Number of users to fetch from the database at a time
+        :param load_trips:     Supply False to disable loading of trips to
+                               :py:class:`tripkit.models.User` objects on first access
+        :param load_locations: Supply False to disable automatic loading of activity locations to
+                               :py:class:`tripkit.models.User` objects
+        :param start:          Mininum timestamp bounds (inclusive) for loading user coordinate and
+                               prompts data
+        :param end:            Maximum timestamp bounds (inclusive) for loading user coordinate and
+                               prompts data
+
+        :type batch_size:      integer, optional
+        :type load_trips:      boolean, optional
+        :type load_locations:  boolean, optional
+        :type start:           datetime, optional
+        :type end:             datetime, optional
+
+        :rtype: generator of :py:class:`tripkit.models.User`
+        '''
+        self.check_setup()
+
+        coordinate_counts = self.database.count_user_coordinates(start=start, end=end)
+        uuids = [
+            u.uuid.hex for u in UserSurveyResponse.select(UserSurveyResponse.uuid) if u.uuid.hex in coordinate_counts
+        ]
+        for batch_idx in range(0, len(uuids), batch_size):
+            batch_uuids = uuids[batch_idx : batch_idx + batch_size]
+            logger.info(f"Loading users from database: {batch_idx + len(batch_uuids)}/{len(uuids)}...")
+            users = self.database.load_users_bulk(batch_uuids, start=start, end=end, load_locations=load_locations)
+            for user in users:
+                if load_trips:
+                    user.defer_trips(functools.partial(self.database.load_trips, user, start=start, end=end))
+                yield user
 
     def load_user_by_orig_id(self, orig_id, load_trips=True, start=None, end=None):
         '''
@@ -210,3 +338,131 @@ class TripKit(object):
             if load_trips:
                 user.trips = self.database.load_trips(user, start=start, end=end)
             return user
+
+    def run_pipeline(self, stages, workers=None, uuids=None, chunksize=1):
+        '''
+        Runs processing stages for all users in parallel across a pool of worker processes. Each worker
+        loads users with its own connection to the cache database and returns the stage outputs to this
+        process, which saves detected trips and trip day summaries as the single database writer.
+
+        Stages are run in order for each user and can be provided by name (``trips`` for TRIP Lab v2 trip
+        detection, ``trips_incremental`` to resume TRIP Lab v2 trip detection from each user's saved trips,
+        ``complete_days`` for the TRIP Lab complete days counter) or as module-level functions accepting
+        ``(tripkit, user)`` and returning a dict of outputs. The ``trips`` and ``trip_day_summaries`` outputs
+        are saved to the cache database, with the ``trips`` replacing only the saved trips numbered from
+        ``trips_from_num`` when output.
+
+        On Windows, scripts calling this method must be guarded by ``if __name__ == '__main__':``.
+
+        :param stages:    The names or functions of the stages to run for each user
+        :param workers:   Number of worker processes, defaults to the number of CPUs. Supply 1 to run
+                          all stages in the current process.
+        :param uuids:     Supply a subset of user UUIDs to process instead of all users
+        :param chunksize: Number of users sent to a worker at a time
+
+        :type stages:     list of str or function
+        :type workers:    integer, optional
+        :type uuids:      list of str, optional
+        :type chunksize:  integer, optional
+
+        :rtype: list of str
+        '''
+        self.check_setup()
+        start = time.time()
+
+        if uuids is None:
+            uuids = [u.uuid for u in UserSurveyResponse.select(UserSurveyResponse.uuid)]
+
+        # named stages are recorded to the processing ledger with the hash of their parameters
+        ledger_stages = [
+            (
+                pipeline.algorithm_stage(pipeline.STAGE_ALGORITHMS[stage])[1],
+                pipeline.STAGE_ALGORITHMS[stage],
+                parameters_hash(pipeline.STAGE_PARAMETERS[stage](self)),
+            )
+            for stage in stages
+            if isinstance(stage, str) and stage in pipeline.STAGE_ALGORITHMS
+        ]
+
+        processed = []
+        results = pipeline.run(self, uuids, stages, workers=workers, chunksize=chunksize)
+        for idx, (uuid, outputs) in enumerate(results, start=1):
+            if outputs is None:
+                logger.info(f"User {idx}/{len(uuids)} has no points, skipped.")
+                metrics.USERS_PROCESSED.inc(status='skipped')
+                continue
+
+            user = self.database.load_user(uuid)
+            if 'trips_from_num' in outputs:
+                self.database.replace_trips(user, outputs['trips'], outputs['trips_from_num'])
+            elif 'trips' in outputs:
+                self.database.save_trips(user, outputs['trips'])
+            if 'trip_day_summaries' in outputs:
+                self.database.save_trip_day_summaries(user, outputs['trip_day_summaries'], self.config.TIMEZONE)
+            for stage, algorithm, stage_parameters_hash in ledger_stages:
+                self.database.record_processing([uuid], stage, algorithm, stage_parameters_hash)
+            logger.info(f"Processed user {idx}/{len(uuids)}: {uuid}")
+            metrics.USERS_PROCESSED.inc(status='processed')
+            processed.append(uuid)
+        self._record_run('run_pipeline', start)
+        return processed
+
+    def _record_run(self, operation, start):
+        end = time.time()
+        metrics.RUN_SECONDS.set(end - start, operation=operation)
+        metrics.RUN_TIMESTAMP.set(end, operation=operation)
+        if getattr(self.config, 'METRICS_FP', None):
+            self.write_metrics(self.config.METRICS_FP)
+
+    def write_metrics(self, fp):
+        '''
+        Writes the metrics recorded by TripKit as JSON when the filepath ends with ``.json``, otherwise as a
+        Prometheus textfile. Metrics are also written at the end of :py:meth:`setup` and :py:meth:`run_pipeline`
+        when ``METRICS_FP`` is set in the config.
+
+        :param fp: The full filepath of the output ``.prom`` or ``.json`` file
+        '''
+        metrics.REGISTRY.write(fp)
+
+    def users_needing_processing(self, algorithm, parameters=None):
+        '''
+        Returns the uuids of users whose inputs or parameters have changed since an algorithm was last run
+        for them, as recorded in the cache database's processing ledger. Users are recorded by
+        :py:meth:`run_pipeline` for its named stages or by :py:meth:`record_processing`.
+
+        Example::
+
+            algorithm = tripkit.process.trip_detection.triplab.v2.algorithm
+            uuids = tripkit.users_needing_processing(algorithm, parameters)
+            tripkit.run_pipeline(['trips', 'complete_days'], uuids=uuids)
+
+        :param algorithm:  The algorithm module or its name within `tripkit.process`
+                           (e.g., ``complete_days.triplab.counter``)
+        :param parameters: The algorithm parameters, ``{'timezone': ...}`` for the complete days counter
+
+        :type algorithm:   module or str
+        :type parameters:  dict, optional
+
+        :rtype: list of str
+        '''
+        self.check_setup()
+        name, stage = pipeline.algorithm_stage(algorithm)
+        return self.database.users_needing_processing(
+            stage, name, parameters_hash(parameters), depends_on=pipeline.STAGE_DEPENDENCIES.get(stage)
+        )
+
+    def record_processing(self, uuids, algorithm, parameters=None):
+        '''
+        Records in the processing ledger that an algorithm has been run for users outside of
+        :py:meth:`run_pipeline` and its results saved.
+
+        :param uuids:      The uuids of the processed users
+        :param algorithm:  The algorithm module or its name within `tripkit.process`
+        :param parameters: The algorithm parameters used
+
+        :type uuids:       list of str
+        :type algorithm:   module or str
+        :type parameters:  dict, optional
+        '''
+        name, stage = pipeline.algorithm_stage(algorithm)
+        self.database.record_processing(uuids, stage, name, parameters_hash(parameters))
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Registry of counters, gauges and histograms describing a TripKit run (rows ingested, users processed,
+# per-user processing latency, cache database write throughput and feature cache hit rates) which can be
+# written as a Prometheus textfile or JSON at the end of a run to track throughput over time.
+import contextlib
+from datetime import datetime
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+
+logger = logging.getLogger('itinerum-tripkit.metrics')
+
+# upper bounds (in seconds) of the default histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, math.inf)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def _parse_value(value):
+    if value == '+Inf':
+        return math.inf
+    if value == '-Inf':
+        return -math.inf
+    return float(value)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class _Metric(object):
+    type_name = None
+
+    def __init__(self, name, documentation='', labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise Exception(
+                f"Metric labels not recognized: {sorted(labels)} Valid options: {list(self.labelnames)} ({self.name})"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __repr__(self):
+        return f"<tripkit.metrics.{self.__class__.__name__} name={self.name}>"
+
+
+class Counter(_Metric):
+    '''
+    A monotonically increasing count, such as the number of rows written to a table.
+
+    :param name:          The metric name, by convention ending with ``_total``.
+    :param documentation: The metric description.
+    :param labelnames:    Names of the labels each count is recorded by.
+    '''
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        '''
+        Increments the count for the given label values.
+        '''
+        if amount < 0:
+            raise Exception(f"Counter can only be incremented by non-negative amounts: {amount} ({self.name})")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [{'labels': self._labels(key), 'value': value} for key, value in self._values.items()]
+
+    def merge(self, samples):
+        with self._lock:
+            for sample in samples:
+                key = self._key(sample['labels'])
+                self._values[key] = self._values.get(key, 0) + sample['value']
+
+
+class Gauge(_Metric):
+    '''
+    A value that can go up and down, such as the number of entries within a cache.
+
+    :param name:          The metric name.
+    :param documentation: The metric description.
+    :param labelnames:    Names of the labels each value is recorded by.
+    '''
+
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [{'labels': self._labels(key), 'value': value} for key, value in self._values.items()]
+
+    def merge(self, samples):
+        with self._lock:
+            for sample in samples:
+                self._values[self._key(sample['labels'])] = sample['value']
+
+
+class Histogram(_Metric):
+    '''
+    Distribution of observed values within buckets, such as the time taken to process each user.
+
+    :param name:          The metric name, by convention ending with the unit (e.g., ``_seconds``).
+    :param documentation: The metric description.
+    :param labelnames:    Names of the labels each distribution is recorded by.
+    :param buckets:       Increasing upper bounds of the buckets, ending with infinity.
+
+    :type buckets:        tuple of float, optional
+    '''
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation='', labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        buckets = [float(b) for b in buckets]
+        if buckets != sorted(buckets):
+            raise Exception(f"Histogram buckets must be in increasing order: {buckets} ({self.name})")
+        if not buckets or buckets[-1] != math.inf:
+            buckets.append(math.inf)
+        self.buckets = tuple(buckets)
+
+    def _state(self, key):
+        state = self._values.get(key)
+        if state is None:
+            state = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            self._values[key] = state
+        return state
+
+    def observe(self, value, **labels):
+        '''
+        Adds an observed value to the distribution for the given label values.
+        '''
+        key = self._key(labels)
+        with self._lock:
+            state = self._state(key)
+            for idx, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    state['counts'][idx] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextlib.contextmanager
+    def _timer(self, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def time(self, **labels):
+        '''
+        Returns a context manager observing the seconds elapsed within it. It can also be used
+        as a function decorator.
+        '''
+        return self._timer(labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state['count'] if state else 0
+
+    def sum(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state['sum'] if state else 0.0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative, buckets = 0, []
+                for upper_bound, count in zip(self.buckets, state['counts']):
+                    cumulative += count
+                    buckets.append([_format_value(upper_bound), cumulative])
+                samples.append(
+                    {'labels': self._labels(key), 'buckets': buckets, 'sum': state['sum'], 'count': state['count']}
+                )
+        return samples
+
+    def merge(self, samples):
+        with self._lock:
+            for sample in samples:
+                state = self._state(self._key(sample['labels']))
+                # merge by upper bound, converting from cumulative counts
+                previous = 0
+                bucket_counts = {}
+                for upper_bound, cumulative in sample['buckets']:
+                    bucket_counts[_parse_value(upper_bound)] = cumulative - previous
+                    previous = cumulative
+                for idx, upper_bound in enumerate(self.buckets):
+                    state['counts'][idx] += bucket_counts.get(upper_bound, 0)
+                state['sum'] += sample['sum']
+                state['count'] += sample['count']
+
+
+METRIC_TYPES = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+
+class MetricsRegistry(object):
+    '''
+    Collection of named metrics. Metrics are created on first use and later requests for the same
+    name return the existing metric.
+    '''
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, Metric, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = Metric(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, Metric):
+                raise Exception(f"Metric already registered as a {metric.type_name}: {name}")
+            return metric
+
+    def counter(self, name, documentation='', labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation='', labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation='', labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def clear(self):
+        '''
+        Resets the recorded values of all metrics while keeping them registered.
+        '''
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def to_dict(self):
+        '''
+        Returns the metrics and their samples by name.
+        '''
+        metrics = {}
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            metrics[name] = {
+                'type': metric.type_name,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'samples': metric.samples(),
+            }
+            if isinstance(metric, Histogram):
+                metrics[name]['buckets'] = [_format_value(b) for b in metric.buckets]
+        return metrics
+
+    def collect(self):
+        '''
+        Returns the metrics as from :py:meth:`to_dict` and resets them, such as to send the metrics recorded
+        within a worker process to the parent process.
+        '''
+        with self._lock:
+            metrics = self.to_dict()
+            self.clear()
+        return metrics
+
+    def merge(self, metrics):
+        '''
+        Adds the metrics returned by :py:meth:`to_dict` of another registry. Counts and distributions
+        are summed and gauges are set to the merged value.
+        '''
+        for name, metric in metrics.items():
+            if not metric['samples']:
+                continue
+            Metric = METRIC_TYPES[metric['type']]
+            kwargs = {}
+            if Metric is Histogram:
+                kwargs['buckets'] = [_parse_value(b) for b in metric['buckets']]
+            self._get_or_create(Metric, name, metric['help'], metric['labelnames'], **kwargs).merge(
+                metric['samples']
+            )
+
+    def to_prometheus(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+        '''
+        lines = []
+        for name, metric in self.to_dict().items():
+            if not metric['samples']:
+                continue
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for sample in metric['samples']:
+                labels = [f'{k}="{_escape_label_value(v)}"' for k, v in sample['labels'].items()]
+                if metric['type'] == 'histogram':
+                    for upper_bound, count in sample['buckets']:
+                        bucket_labels = ','.join(labels + [f'le="{upper_bound}"'])
+                        lines.append(f"{name}_bucket{{{bucket_labels}}} {count}")
+                    labels_str = '{' + ','.join(labels) + '}' if labels else ''
+                    lines.append(f"{name}_sum{labels_str} {_format_value(sample['sum'])}")
+                    lines.append(f"{name}_count{labels_str} {sample['count']}")
+                else:
+                    labels_str = '{' + ','.join(labels) + '}' if labels else ''
+                    lines.append(f"{name}{labels_str} {_format_value(sample['value'])}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, fp):
+        '''
+        Writes the metrics as a Prometheus textfile (e.g., for the node exporter textfile collector). The
+        file is replaced atomically so a partially written file is never collected.
+
+        :param fp: The full filepath of the output ``.prom`` file
+        '''
+        temp_fp = f'{fp}.{os.getpid()}.tmp'
+        with open(temp_fp, 'w') as prom_f:
+            prom_f.write(self.to_prometheus())
+        os.replace(temp_fp, fp)
+        logger.info(f"Metrics written to {fp}")
+
+    def write_json(self, fp):
+        '''
+        Writes the metrics with the current time as JSON.
+
+        :param fp: The full filepath of the output ``.json`` file
+        '''
+        output = {'timestamp_UTC': datetime.utcnow().isoformat(), 'metrics': self.to_dict()}
+        with open(fp, 'w') as json_f:
+            json.dump(output, json_f, indent=2)
+        logger.info(f"Metrics written to {fp}")
+
+    def write(self, fp):
+        '''
+        Writes the metrics as JSON when the filepath ends with ``.json``, otherwise as a Prometheus textfile.
+        '''
+        if fp.lower().endswith('.json'):
+            self.write_json(fp)
+        else:
+            self.write_prometheus(fp)
+
+    def __repr__(self):
+        return f"<tripkit.metrics.MetricsRegistry metrics={len(self._metrics)}>"
+
+
+# process-wide registry fed by TripKit, the cache database, the .csv parsers and the processing modules
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, documentation='', labelnames=()):
+    '''
+    Returns the counter of the process-wide registry with the given name, creating it on first use.
+    '''
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def gauge(name, documentation='', labelnames=()):
+    '''
+    Returns the gauge of the process-wide registry with the given name, creating it on first use.
+    '''
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+
+def histogram(name, documentation='', labelnames=(), buckets=DEFAULT_BUCKETS):
+    '''
+    Returns the histogram of the process-wide registry with the given name, creating it on first use.
+    '''
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+
+# metrics recorded by TripKit
+ROWS_INGESTED = counter('tripkit_rows_ingested_total', 'Rows loaded from exports by source.', ['source'])
+DB_ROWS_WRITTEN = counter('tripkit_db_rows_written_total', 'Rows bulk inserted to the cache database.', ['table'])
+DB_WRITE_SECONDS = counter(
+    'tripkit_db_write_seconds_total', 'Seconds spent bulk inserting to the cache database.', ['table']
+)
+USERS_PROCESSED = counter('tripkit_users_processed_total', 'Users run through the processing pipeline.', ['status'])
+STAGE_SECONDS = histogram('tripkit_pipeline_stage_seconds', 'Seconds to run a pipeline stage for a user.', ['stage'])
+PROCESS_SECONDS = histogram(
+    'tripkit_process_seconds', 'Seconds to run a processing algorithm for a user.', ['algorithm']
+)
+FEATURE_CACHE_REQUESTS = counter(
+    'tripkit_feature_cache_requests_total', 'Feature cache lookups by result (hit or miss).', ['result']
+)
+RUN_SECONDS = gauge('tripkit_run_seconds', 'Seconds taken by the last run of a TripKit operation.', ['operation'])
+RUN_TIMESTAMP = gauge(
+    'tripkit_run_timestamp_seconds', 'UNIX time the last run of a TripKit operation completed.', ['operation']
+)
@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 # Kyle Fitzsimmons, 2018
+import numpy as np
+
+from .TripArray import TripArray
 
 
 class Trip(object):
@@ -11,45 +14,146 @@ class Trip(object):
 
     :ivar points:         The timestamp-ordered points that comprise this ``Trip``.
     :vartype points:      list of :py:class:`tripkit.models.TripPoint`
+    :ivar array:          The timestamp-ordered points that comprise this ``Trip`` as column arrays.
+    :vartype array:       :py:class:`tripkit.models.TripArray`
     '''
 
     def __init__(self, num, trip_code):
         self.num = int(num)
         self.trip_code = int(trip_code)
-        self.points = []
+        self._points = []
+        self._array = None
+        # the first and last points created from the array of an array-backed trip
+        self._start = None
+        self._end = None
+
+    @classmethod
+    def from_array(cls, num, trip_code, array):
+        '''
+        Creates a trip backed by a :py:class:`tripkit.models.TripArray`. The ``points`` objects are only
+        created when first accessed, after which the list of points is used in place of the array.
+
+        :param int num:       The integer index (starting at 1) of the trip.
+        :param int trip_code: The integer code representing the detected trip type.
+        :param array:         The trip's points as column arrays.
+
+        :type array:          :py:class:`tripkit.models.TripArray`
+        '''
+        trip = cls(num, trip_code)
+        trip._points = None
+        trip._array = array
+        return trip
+
+    @property
+    def points(self):
+        if self._points is None:
+            self._points = self._array.to_points()
+            # keep the start and end points already returned (e.g., referenced by trip day summaries)
+            if self._start is not None:
+                self._points[0] = self._start
+            if self._end is not None:
+                self._points[-1] = self._end
+            self._array = None
+            self._start = self._end = None
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self._array = None
+        self._start = self._end = None
+
+    @property
+    def array(self):
+        if self._array is not None:
+            return self._array
+        return TripArray.from_points(self._points)
+
+    @property
+    def is_array_backed(self):
+        '''
+        Whether the trip's points are stored as a :py:class:`tripkit.models.TripArray` without point objects.
+        '''
+        return self._array is not None
+
+    @property
+    def num_points(self):
+        if self._array is not None:
+            return len(self._array)
+        return len(self._points)
 
     @property
     def distance(self):
-        if len(self.points) > 1:
+        if self.num_points > 1:
+            if self._array is not None:
+                return float(self._array.trip_distance[-1])
             return self.points[-1].trip_distance
         return 0.0
 
     @property
     def duration(self):
-        if len(self.points) > 1:
+        if self.num_points > 1:
+            if self._array is not None:
+                timestamps = self._array.timestamp_UTC
+                return float((timestamps[-1] - timestamps[0]) / np.timedelta64(1, 's'))
             return self.points[-1].timestamp_epoch - self.points[0].timestamp_epoch
         return 0
 
     @property
     def start_UTC(self):
-        if self.points:
+        if self._array is not None:
+            if len(self._array):
+                return self._array.timestamp_UTC[0].item()
+        elif self.points:
             return self.points[0].timestamp_UTC
 
     @property
     def end_UTC(self):
-        if self.points:
+        if self._array is not None:
+            if len(self._array):
+                return self._array.timestamp_UTC[-1].item()
+        elif self.points:
             return self.points[-1].timestamp_UTC
 
     @property
     def start(self):
+        # array-backed trips create only the requested point instead of all of the trip's points, which is
+        # kept so the same point object is returned each time
+        if self._array is not None:
+            if self._start is None:
+                self._start = self._array[0]
+            return self._start
         return self.points[0]
 
     @property
     def end(self):
+        if self._array is not None:
+            if self._end is None:
+                self._end = self._array[-1]
+            return self._end
         return self.points[-1]
 
+    def set_database_id(self, idx, database_id):
+        '''
+        Sets the database record id of the trip point at an index, such as once the trip is saved to the cache
+        database, without creating the points of an array-backed trip.
+
+        :param int idx:         The index of the point within the trip.
+        :param int database_id: The database record id of the point.
+        '''
+        if self._array is None:
+            self._points[idx].database_id = database_id
+            return
+        self._array.database_id[idx] = database_id
+        if idx == 0 and self._start is not None:
+            self._start.database_id = database_id
+        if idx == len(self._array) - 1 and self._end is not None:
+            self._end.database_id = database_id
+
     @property
     def geojson_coordinates(self):
+        if self._array is not None:
+            return list(zip(self._array.longitude.tolist(), self._array.latitude.tolist()))
         return [(p.longitude, p.latitude) for p in self.points]
 
     def __repr__(self):
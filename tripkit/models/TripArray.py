@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+import numpy as np
+
+from .TripPoint import TripPoint
+
+# NumPy types of the trip point columns, database ids are stored as -1 for points without a database record
+# (e.g., the start and end points of missing trips)
+TRIP_ARRAY_DTYPES = {
+    'database_id': np.int64,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'h_accuracy': np.float64,
+    'distance_before': np.float64,
+    'trip_distance': np.float64,
+    'period_before': np.int64,
+    'timestamp_UTC': 'datetime64[us]',
+}
+
+
+class TripArray(object):
+    '''
+    Compact storage of a trip's points as parallel NumPy column arrays instead of a
+    :py:class:`tripkit.models.TripPoint` object per point. Indexing returns newly created
+    :py:class:`tripkit.models.TripPoint` objects for the stored values.
+
+    :param database_id:     The GPS points' database record ids (`None` or -1 for points without one).
+    :param latitude:        The GPS points' latitudes.
+    :param longitude:       The GPS points' longitudes.
+    :param h_accuracy:      The reported horizontal accuracies of the GPS points.
+    :param distance_before: The distances between each point and the point immediately prior in meters.
+    :param trip_distance:   The cumulative distances of the trip at each point in meters.
+    :param period_before:   The number of seconds passed since the last recorded point.
+    :param timestamp_UTC:   The points' naive datetimes localized to UTC.
+
+    :type database_id:      list or numpy.ndarray
+    :type latitude:         list or numpy.ndarray
+    :type longitude:        list or numpy.ndarray
+    :type h_accuracy:       list or numpy.ndarray
+    :type distance_before:  list or numpy.ndarray
+    :type trip_distance:    list or numpy.ndarray
+    :type period_before:    list or numpy.ndarray
+    :type timestamp_UTC:    list of datetime or numpy.ndarray
+    '''
+
+    __slots__ = tuple(TRIP_ARRAY_DTYPES.keys())
+
+    def __init__(
+        self, database_id, latitude, longitude, h_accuracy, distance_before, trip_distance, period_before, timestamp_UTC
+    ):
+        if not isinstance(database_id, np.ndarray):
+            database_id = [-1 if i is None else i for i in database_id]
+        self.database_id = np.asarray(database_id, dtype=TRIP_ARRAY_DTYPES['database_id'])
+        self.latitude = np.asarray(latitude, dtype=TRIP_ARRAY_DTYPES['latitude'])
+        self.longitude = np.asarray(longitude, dtype=TRIP_ARRAY_DTYPES['longitude'])
+        self.h_accuracy = np.asarray(h_accuracy, dtype=TRIP_ARRAY_DTYPES['h_accuracy'])
+        self.distance_before = np.asarray(distance_before, dtype=TRIP_ARRAY_DTYPES['distance_before'])
+        self.trip_distance = np.asarray(trip_distance, dtype=TRIP_ARRAY_DTYPES['trip_distance'])
+        self.period_before = np.asarray(period_before, dtype=TRIP_ARRAY_DTYPES['period_before'])
+        self.timestamp_UTC = np.asarray(timestamp_UTC, dtype=TRIP_ARRAY_DTYPES['timestamp_UTC'])
+
+    @classmethod
+    def from_points(cls, points):
+        '''
+        Creates a trip array from a list of :py:class:`tripkit.models.TripPoint` objects.
+        '''
+        return cls(**{name: [getattr(p, name) for p in points] for name in TRIP_ARRAY_DTYPES})
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        # values are converted to Python types as by `to_points`
+        database_id = self.database_id[idx].item()
+        return TripPoint(
+            database_id=database_id if database_id != -1 else None,
+            latitude=self.latitude[idx].item(),
+            longitude=self.longitude[idx].item(),
+            h_accuracy=self.h_accuracy[idx].item(),
+            distance_before=self.distance_before[idx].item(),
+            trip_distance=self.trip_distance[idx].item(),
+            period_before=self.period_before[idx].item(),
+            timestamp_UTC=self.timestamp_UTC[idx].item(),
+        )
+
+    def __iter__(self):
+        return iter(self.to_points())
+
+    @property
+    def timestamp_epoch(self):
+        '''
+        The points' datetimes within the UNIX epoch format as an array of seconds.
+        '''
+        return (self.timestamp_UTC - np.datetime64(0, 'us')) / np.timedelta64(1, 's')
+
+    def to_points(self):
+        '''
+        Returns the trip's points as a list of :py:class:`tripkit.models.TripPoint` objects.
+        '''
+        database_ids = [None if i == -1 else i for i in self.database_id.tolist()]
+        columns = zip(
+            database_ids,
+            self.latitude.tolist(),
+            self.longitude.tolist(),
+            self.h_accuracy.tolist(),
+            self.distance_before.tolist(),
+            self.trip_distance.tolist(),
+            self.period_before.tolist(),
+            self.timestamp_UTC.tolist(),
+        )
+        return [TripPoint(*row) for row in columns]
+
+    def __repr__(self):
+        return f"<tripkit.models.TripArray points={len(self)}>"
@@ -2,6 +2,8 @@
 # Kyle Fitzsimmons, 2018
 from datetime import datetime
 
+EPOCH = datetime(1970, 1, 1)
+
 
 class TripPoint(object):
     '''
@@ -16,8 +18,23 @@ class TripPoint(object):
 
     :ivar timestamp_epoch:         The point's datetime within the UNIX epoch format.
     :vartype timestamp_epoch:      int
+    :ivar label:                   The semantic location label of the point set by activity detection.
+    :vartype label:                str
     '''
 
+    # fixed attributes without a per-instance `__dict__` since trips are often made of millions of points
+    __slots__ = (
+        'database_id',
+        'latitude',
+        'longitude',
+        'h_accuracy',
+        'distance_before',
+        'trip_distance',
+        'period_before',
+        'timestamp_UTC',
+        'label',
+    )
+
     def __init__(
         self, database_id, latitude, longitude, h_accuracy, distance_before, trip_distance, period_before, timestamp_UTC
     ):
@@ -31,7 +48,11 @@ class TripPoint(object):
         self.trip_distance = float(trip_distance)
         self.period_before = int(period_before)
         self.timestamp_UTC = timestamp_UTC
-        self.timestamp_epoch = (timestamp_UTC - datetime(1970, 1, 1)).total_seconds()
+        self.label = None
+
+    @property
+    def timestamp_epoch(self):
+        return (self.timestamp_UTC - EPOCH).total_seconds()
 
     def __repr__(self):
         return f"<tripkit.models.TripPoint ({self.latitude}, {self.longitude}) {self.timestamp_UTC}>"
@@ -8,7 +8,8 @@ class User(object):
     :ivar list activity_locations: A user's saved or detected activity locations. This is loaded automatically
                                    when a ``User`` is initialized by :py:meth:`tripkit.database.Database.load_user`.
     :ivar list trips:              A user's detected trips. This is loaded automatically when a ``User`` 
-                                   is initialized by :py:meth:`tripkit.database.Database.load_user`.
+                                   is initialized by :py:meth:`tripkit.database.Database.load_user`, or
+                                   on first access for users from :py:meth:`tripkit.TripKit.iter_users`.
     '''
 
     def __init__(self, db_user):
@@ -21,7 +22,29 @@ class User(object):
         self.detected_trip_day_summaries = db_user.detected_trip_day_summaries
         self.user_locations = db_user.user_locations
         self.activity_locations = []
-        self.trips = []
+        self._trips = []
+        self._trips_loader = None
+
+    @property
+    def trips(self):
+        if self._trips_loader is not None:
+            self._trips = self._trips_loader()
+            self._trips_loader = None
+        return self._trips
+
+    @trips.setter
+    def trips(self, trips):
+        self._trips = trips
+        self._trips_loader = None
+
+    def defer_trips(self, loader):
+        '''
+        Sets a function returning the user's trips to be called on the first access of ``trips``.
+
+        :param loader: Function accepting no arguments which returns a list of :py:class:`tripkit.models.Trip`
+        '''
+        self._trips = None
+        self._trips_loader = loader
 
     def __repr__(self):
         return f"<tripkit.models.User uuid={self.uuid}>"
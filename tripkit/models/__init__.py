@@ -1,5 +1,6 @@
 from .ActivityLocation import ActivityLocation
 from .DaySummary import DaySummary
 from .Trip import Trip
+from .TripArray import TripArray
 from .TripPoint import TripPoint
 from .User import User
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Runs processing stages for many users in parallel across a pool of worker processes. Each
+# worker opens its own read connection to the cache database and all writes are funneled back
+# to the parent process so SQLite only ever sees a single writer.
+import functools
+import logging
+import multiprocessing
+import types
+
+from . import metrics
+
+
+logger = logging.getLogger('itinerum-tripkit.pipeline')
+
+# per-process TripKit instance created by the pool initializer
+_worker_tripkit = None
+
+
+def _trip_detection_parameters(tripkit):
+    '''
+    Build the trip detection parameters from a TripKit instance's config.
+    '''
+    return {
+        'subway_entrances': tripkit.subway_entrances,
+        'break_interval_seconds': tripkit.config.TRIP_DETECTION_BREAK_INTERVAL_SECONDS,
+        'subway_buffer_meters': tripkit.config.TRIP_DETECTION_SUBWAY_BUFFER_METERS,
+        'cold_start_distance': tripkit.config.TRIP_DETECTION_COLD_START_DISTANCE_METERS,
+        'accuracy_cutoff_meters': tripkit.config.TRIP_DETECTION_ACCURACY_CUTOFF_METERS,
+    }
+
+
+def _complete_days_parameters(tripkit):
+    '''
+    Build the complete days counter parameters from a TripKit instance's config.
+    '''
+    return {'timezone': tripkit.config.TIMEZONE}
+
+
+# pipeline stages
+def detect_trips(tripkit, user):
+    '''
+    Pipeline stage to run the TRIP Lab v2 trip detection algorithm on a user's coordinates.
+    '''
+    parameters = _trip_detection_parameters(tripkit)
+    user.trips = tripkit.process.trip_detection.triplab.v2.algorithm.run(
+        user.coordinates, parameters, feature_cache=tripkit.feature_cache
+    )
+    return {'trips': user.trips}
+
+
+def detect_trips_incremental(tripkit, user):
+    '''
+    Pipeline stage to resume the TRIP Lab v2 trip detection algorithm from a user's previously saved trips,
+    processing only the coordinates from their last trips onward. The full coordinates history is processed
+    when the user has too few saved trips or the resumed detection does not match them. The stage outputs
+    the replacing trips with the number of the first replaced trip as `trips_from_num`.
+    '''
+    v2 = tripkit.process.trip_detection.triplab.v2.algorithm
+    parameters = _trip_detection_parameters(tripkit)
+    from_trip_num = tripkit.database.tail_trip_num(user, v2.INCREMENTAL_TRIPS, exclude_codes=v2.MISSING_TRIP_CODES)
+    if from_trip_num is not None:
+        previous_trips = tripkit.database.load_trips(user, min_trip_num=from_trip_num)
+        start = v2.resume_timestamp(previous_trips)
+        coordinates = tripkit.database.load_user(user.uuid, start=start).coordinates
+        resumed = v2.run_incremental(coordinates, parameters, previous_trips, feature_cache=tripkit.feature_cache)
+        if resumed is not None:
+            tail_trips, trips_from_num = resumed
+            # following stages are supplied all of the user's trips
+            user.trips = tripkit.database.load_trips(user, max_trip_num=trips_from_num - 1) + tail_trips
+            return {'trips': tail_trips, 'trips_from_num': trips_from_num}
+    return detect_trips(tripkit, user)
+
+
+def detect_complete_days(tripkit, user):
+    '''
+    Pipeline stage to run the TRIP Lab complete days counter on a user's trips. Trips are loaded
+    from the cache database when they have not been detected by an earlier stage (see :py:func:`run_user_stages`).
+    '''
+    parameters = _complete_days_parameters(tripkit)
+    trip_day_summaries = tripkit.process.complete_days.triplab.counter.run(user.trips, parameters['timezone'])
+    # no summaries are output for users without trips, replacing any saved by a previous run
+    return {'trip_day_summaries': trip_day_summaries or []}
+
+
+STAGES = {'trips': detect_trips, 'trips_incremental': detect_trips_incremental, 'complete_days': detect_complete_days}
+
+# the algorithms and parameters of the named stages recorded to the processing ledger, with the stage
+# whose outputs are used as the input of another stage
+STAGE_ALGORITHMS = {
+    'trips': 'trip_detection.triplab.v2.algorithm',
+    'trips_incremental': 'trip_detection.triplab.v2.algorithm',
+    'complete_days': 'complete_days.triplab.counter',
+}
+STAGE_PARAMETERS = {
+    'trips': _trip_detection_parameters,
+    'trips_incremental': _trip_detection_parameters,
+    'complete_days': _complete_days_parameters,
+}
+STAGE_DEPENDENCIES = {'complete_days': 'trips'}
+
+# the processing ledger stage of each algorithm by its `tripkit.process` subpackage
+ALGORITHM_STAGES = {'trip_detection': 'trips', 'complete_days': 'complete_days'}
+
+
+def algorithm_stage(algorithm):
+    '''
+    Returns the name of an algorithm within `tripkit.process` (e.g., ``trip_detection.triplab.v2.algorithm``)
+    with the pipeline stage its outputs are recorded as in the processing ledger.
+
+    :param algorithm: The algorithm module (e.g., ``tripkit.process.trip_detection.triplab.v2.algorithm``)
+                      or its name within `tripkit.process`
+
+    :type algorithm:  module or str
+    '''
+    name = algorithm if isinstance(algorithm, str) else algorithm.__name__
+    prefix = 'tripkit.process.'
+    if name.startswith(prefix):
+        name = name[len(prefix) :]
+    stage = ALGORITHM_STAGES.get(name.split('.')[0])
+    if not stage:
+        raise Exception(f"Algorithm not recognized: {name} Valid options: {', '.join(ALGORITHM_STAGES)} algorithms")
+    return name, stage
+
+
+def _resolve_stage(stage):
+    if callable(stage):
+        return stage
+    if stage in STAGES:
+        return STAGES[stage]
+    raise Exception(f"Pipeline stage not recognized: {stage} Valid options: {', '.join(STAGES)}")
+
+
+def picklable_config(config):
+    '''
+    Copy the uppercase attributes of a config module or class to a namespace that can be sent
+    to worker processes.
+    '''
+    return types.SimpleNamespace(**{key: getattr(config, key) for key in dir(config) if key.isupper()})
+
+
+# worker processes
+def _init_worker(config):
+    global _worker_tripkit
+    from .main import TripKit
+
+    # forked workers start with a copy of the parent's metrics, which are already counted
+    metrics.REGISTRY.clear()
+    _worker_tripkit = TripKit(config)
+
+
+def run_user_stages(tripkit, uuid, stages):
+    '''
+    Load a user from the cache database and run each stage in sequence. Returns the user's uuid with
+    the combined outputs of all stages, or `None` for the outputs when the user has no coordinates.
+    '''
+    user = tripkit.database.load_user(uuid)
+    if not user.coordinates.exists():
+        return uuid, None
+    # trips are only loaded from the cache database when accessed before a stage has detected them, so
+    # detecting no trips is not mistaken for not having run trip detection
+    user.defer_trips(functools.partial(tripkit.database.load_trips, user))
+
+    outputs = {}
+    for stage in stages:
+        stage_func = _resolve_stage(stage)
+        with metrics.STAGE_SECONDS.time(stage=stage if isinstance(stage, str) else stage_func.__name__):
+            stage_outputs = stage_func(tripkit, user)
+        if stage_outputs:
+            outputs.update(stage_outputs)
+    return uuid, outputs
+
+
+def _run_worker_stages(args):
+    uuid, stages = args
+    uuid, outputs = run_user_stages(_worker_tripkit, uuid, stages)
+    # metrics recorded by the worker are sent with each result to be merged by the parent process
+    return uuid, outputs, metrics.REGISTRY.collect()
+
+
+def run(tripkit, uuids, stages, workers=None, chunksize=1):
+    '''
+    Generator to run the pipeline stages over the supplied users, yielding each user's uuid with the stage
+    outputs as they complete. With a single worker, stages are run in the current process.
+    '''
+    if workers == 1:
+        for uuid in uuids:
+            yield run_user_stages(tripkit, uuid, stages)
+        return
+
+    # close the parent connection so an open SQLite handle is never shared with forked workers
+    tripkit.database.db.close()
+    config = picklable_config(tripkit.config)
+    with multiprocessing.Pool(processes=workers, initializer=_init_worker, initargs=(config,)) as pool:
+        tasks = ((uuid, stages) for uuid in uuids)
+        for uuid, outputs, worker_metrics in pool.imap_unordered(_run_worker_stages, tasks, chunksize=chunksize):
+            metrics.REGISTRY.merge(worker_metrics)
+            yield uuid, outputs
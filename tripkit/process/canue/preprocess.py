@@ -23,7 +23,6 @@ Wolf, J. (2000). Using GPS Data Loggers to Replace Travel Diaries in the Collect
     Travel Data. Ph.D. Thesis, Georgia Institute of Technology, Atlanta.
 '''
 import logging
-import utm
 
 from .models import Coordinate
 from tripkit.utils import calc, geo
@@ -47,6 +46,11 @@ def run(uuid, coordinates):
     total_coordinates = coordinates.count()
     logger.info(f"Uncleaned input coordinates: {total_coordinates}")
 
+    # use the cached projection or project all coordinates at once within the UTM zone of the user's first point
+    coordinates = list(coordinates)
+    eastings, northings, zone_num, zone_letter = geo.project_coordinates(coordinates)
+    eastings, northings = eastings.tolist(), northings.tolist()
+
     processed = []
     last_gc = None
     last_pct = 0
@@ -62,7 +66,7 @@ def run(uuid, coordinates):
 
         # calculate coordinate attributes compared to previous coordinate
         if not last_gc:
-            gc.easting, gc.northing, gc.zone_num, gc.zone_letter = utm.from_latlon(gc.latitude, gc.longitude)
+            gc.easting, gc.northing, gc.zone_num, gc.zone_letter = eastings[idx], northings[idx], zone_num, zone_letter
             processed.append(gc)
             last_gc = gc
             continue
@@ -84,7 +88,7 @@ def run(uuid, coordinates):
         #     processed.append(gc)
 
         # augment with projected coordinates
-        gc.easting, gc.northing, gc.zone_num, gc.zone_letter = utm.from_latlon(gc.latitude, gc.longitude)
+        gc.easting, gc.northing, gc.zone_num, gc.zone_letter = eastings[idx], northings[idx], zone_num, zone_letter
         processed.append(gc)
         last_gc = gc
     logger.info(f"Processing...100%")
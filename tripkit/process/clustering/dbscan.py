@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# DBSCAN clustering to detect stops, producing the same labels as the reference implementation
+# (`dbscan_ref`) with neighbors found from a uniform grid of projected UTM coordinates instead of
+# measuring the geodesic distance to every other point
+from collections import deque
+from geopy.distance import distance
+import logging
+import numpy as np
+
+from tripkit.utils import geo
+
+
+logger = logging.getLogger('itinerum-tripkit.process.clustering.dbscan')
+
+EPS = 20  # threshold distance, meters
+MIN_PTS = 10  # minimum number of points to consider as a cluster
+# bound of the relative difference between scale-corrected UTM planar distances and geodesic distances,
+# distances within this tolerance of `EPS` are measured geodesically so labels match the reference
+# implementation
+PLANAR_TOLERANCE = 0.001
+
+
+def scale_factors(latitudes, longitudes, zone_num):
+    '''
+    Returns the point scale factors of the UTM projection (the ratio of projected to true distances
+    near each point) by the spherical approximation.
+    '''
+    central_longitude = (zone_num - 1) * 6 - 180 + 3
+    b = np.cos(np.radians(latitudes)) * np.sin(np.radians(np.asarray(longitudes) - central_longitude))
+    return 0.9996 / np.sqrt(1 - b * b)
+
+
+class GridIndex(object):
+    '''
+    Uniform grid of points by their projected UTM coordinates with cells the size of the neighborhood
+    radius, so the neighbors of a point are found within its own and the 8 surrounding cells.
+
+    :param points: The points with `latitude` and `longitude` attributes and optionally their projected
+                   UTM `easting`, `northing`, `zone_num` and `zone_letter` from the cache database
+    :param eps:    The neighborhood radius in meters
+
+    :type points:  list
+    :type eps:     float, optional
+    '''
+
+    def __init__(self, points, eps=EPS):
+        self.points = points
+        self.eps = eps
+        self.eastings, self.northings, zone_num, _ = geo.project_coordinates(points)
+        self.scales = scale_factors([p.latitude for p in points], [p.longitude for p in points], zone_num)
+
+        self.cell_size = eps * (1 + PLANAR_TOLERANCE) * self.scales.max()
+        self.cell_xs = np.floor(self.eastings / self.cell_size).astype(np.int64)
+        self.cell_ys = np.floor(self.northings / self.cell_size).astype(np.int64)
+        cells = {}
+        for idx, cell in enumerate(zip(self.cell_xs.tolist(), self.cell_ys.tolist())):
+            cells.setdefault(cell, []).append(idx)
+        self.cells = {cell: np.array(idxs, dtype=np.int64) for cell, idxs in cells.items()}
+
+    def candidates(self, p_idx):
+        '''
+        Returns the indexes of the points within the cells surrounding a point in ascending order.
+        '''
+        cell_x, cell_y = int(self.cell_xs[p_idx]), int(self.cell_ys[p_idx])
+        found = []
+        for x in (cell_x - 1, cell_x, cell_x + 1):
+            for y in (cell_y - 1, cell_y, cell_y + 1):
+                cell_idxs = self.cells.get((x, y))
+                if cell_idxs is not None:
+                    found.append(cell_idxs)
+        candidate_idxs = np.concatenate(found)
+        candidate_idxs.sort()
+        return candidate_idxs
+
+    def region_query(self, p_idx):
+        '''
+        Returns the indexes of all points within distance `eps` of a point (including itself) in ascending
+        order. Candidates are compared by their planar distance corrected for the projection's scale unless
+        it is too close to `eps` to decide, in which case the geodesic distance is measured as by the
+        reference implementation.
+        '''
+        candidate_idxs = self.candidates(p_idx)
+        distances = np.hypot(
+            self.eastings[candidate_idxs] - self.eastings[p_idx], self.northings[candidate_idxs] - self.northings[p_idx]
+        )
+        distances /= self.scales[p_idx]
+        within = distances < self.eps * (1 - PLANAR_TOLERANCE)
+        uncertain = ~within & (distances < self.eps * (1 + PLANAR_TOLERANCE))
+        if uncertain.any():
+            p = self.points[p_idx]
+            for candidate_idx in np.flatnonzero(uncertain).tolist():
+                n = self.points[candidate_idxs[candidate_idx]]
+                within[candidate_idx] = distance((p.latitude, p.longitude), (n.latitude, n.longitude)).meters < self.eps
+        return candidate_idxs[within]
+
+    def __repr__(self):
+        return f"<tripkit.process.clustering.dbscan.GridIndex cells={len(self.cells)} cell_size={self.cell_size}>"
+
+
+def grow_cluster(index, labels, p_idx, neighbor_idxs, cluster_id, min_pts=MIN_PTS):
+    '''
+    Labels the points density-reachable from a seed point with its cluster and returns their indexes in
+    the order claimed. The index can be any object with a `region_query` method returning a point's
+    neighbor indexes as an array.
+    '''
+    # assign the cluster label to the seed point and search its neighbors as a FIFO queue; only noise and
+    # unclaimed points are queued since points claimed by a cluster cannot change clusters
+    labels[p_idx] = cluster_id
+    member_idxs = [p_idx]
+    queue = deque(neighbor_idxs[labels[neighbor_idxs] <= 0].tolist())
+    while queue:
+        neighbor_idx = queue.popleft()
+        # a noise point is not a branch point (not enough neighbors), make it a leaf point of the cluster
+        if labels[neighbor_idx] == -1:
+            labels[neighbor_idx] = cluster_id
+            member_idxs.append(neighbor_idx)
+        # claim an unclaimed point and queue its neighbors when it is a branch point
+        elif labels[neighbor_idx] == 0:
+            labels[neighbor_idx] = cluster_id
+            member_idxs.append(neighbor_idx)
+            neighbors_neighbor_idxs = index.region_query(neighbor_idx)
+            if len(neighbors_neighbor_idxs) >= min_pts:
+                queue.extend(neighbors_neighbor_idxs[labels[neighbors_neighbor_idxs] <= 0].tolist())
+    return member_idxs
+
+
+def run(coordinates, eps=EPS, min_pts=MIN_PTS):
+    '''
+    Clusters coordinates with DBSCAN, returning a label for each coordinate: -1 for noise or the cluster
+    number starting from 1. Each point's neighborhood is queried once from a grid index, so clustering
+    runs in linear time for points spread over more than a few grid cells.
+
+    :param coordinates: The coordinates with `latitude` and `longitude` attributes and optionally their
+                        projected UTM `easting`, `northing`, `zone_num` and `zone_letter` from the cache
+                        database
+    :param eps:         The neighborhood radius in meters
+    :param min_pts:     The minimum number of neighbors (including the point itself) of a cluster's branch
+                        points
+
+    :type eps:          float, optional
+    :type min_pts:      int, optional
+
+    :rtype: list of int
+    '''
+    points = list(coordinates)
+    if not points:
+        return []
+    index = GridIndex(points, eps=eps)
+
+    # Reserved labels: 0 (no cluster), -1 (noise)
+    labels = np.zeros(len(points), dtype=np.int64)
+    cluster_id = 0
+    progress_step = max(len(points) // 10, 1)
+    for p_idx in range(len(points)):
+        if (p_idx + 1) % progress_step == 0:
+            logger.info(f"Clustering: {(p_idx + 1) / len(points) * 100:.2f}%")
+
+        # points already belonging to a cluster cannot be new seed points and are skipped
+        if labels[p_idx] != 0:
+            continue
+
+        neighbor_idxs = index.region_query(p_idx)
+        if len(neighbor_idxs) < min_pts:
+            labels[p_idx] = -1
+        else:
+            cluster_id += 1
+            grow_cluster(index, labels, p_idx, neighbor_idxs, cluster_id, min_pts)
+    return labels.tolist()
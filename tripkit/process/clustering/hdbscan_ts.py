@@ -7,6 +7,7 @@ import os
 import utm
 import warnings
 
+from tripkit.utils import geo
 from tripkit.utils.misc import LazyLoader
 scipy = LazyLoader('scipy', globals(), 'scipy')
 hdbscan = LazyLoader('hdbscan', globals(), 'hdbscan')
@@ -124,11 +125,9 @@ def run(min_stop_time_s, coordinates):
     if count <= 10:
         return {}
 
-    points = np.empty([count, 2])
-    utm_zone_number, utm_zone_letter = None, None
-    for idx, c in enumerate(coordinates):
-        easting, northing, utm_zone_number, utm_zone_letter = utm.from_latlon(c.latitude, c.longitude)
-        points[idx] = [easting, northing]
+    eastings, northings, utm_zone_number, utm_zone_letter = geo.project_coordinates(coordinates)
+    points = np.column_stack([eastings, northings])
+    for c, easting, northing in zip(coordinates, eastings.tolist(), northings.tolist()):
         c.easting, c.northing = easting, northing
 
     jobs = -1
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # Kyle Fitzsimmons, 2019
+from datetime import datetime, timezone
 
 
 class ClusterInfo:
@@ -10,3 +11,29 @@ class ClusterInfo:
     def __repr__(self):
         return f"<tripkit.process.clustering.models.ClusterInfo group_num={self.group_num} label={self.label}>"
 
+
+class Stop:
+    def __init__(self, cluster_id=None, start_epoch=None, end_epoch=None, centroid=None, num_points=None):
+        self.cluster_id = cluster_id
+        self.start_epoch = start_epoch
+        self.end_epoch = end_epoch
+        self.centroid = centroid
+        self.num_points = num_points
+
+    @property
+    def start_UTC(self):
+        return datetime.fromtimestamp(self.start_epoch, timezone.utc).replace(tzinfo=None)
+
+    @property
+    def end_UTC(self):
+        return datetime.fromtimestamp(self.end_epoch, timezone.utc).replace(tzinfo=None)
+
+    @property
+    def duration_s(self):
+        return self.end_epoch - self.start_epoch
+
+    def __repr__(self):
+        return (
+            f"<tripkit.process.clustering.models.Stop cluster_id={self.cluster_id} "
+            f"start_UTC={self.start_UTC} duration_s={self.duration_s}>"
+        )
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# ST-DBSCAN clustering to detect stops where points are only neighbors when within both a spatial radius
+# and a time window (Birant & Kut, 2007). Since coordinates are ordered by time, the neighbors of a point
+# are found by scanning the points within its time window instead of the full trace.
+import logging
+import numpy as np
+
+from tripkit.utils import geo
+from .dbscan import grow_cluster, scale_factors
+from .models import Stop
+
+
+logger = logging.getLogger('itinerum-tripkit.process.clustering.stdbscan')
+
+EPS_M = 50  # spatial threshold distance, meters
+EPS_S = 300  # temporal threshold, seconds
+MIN_PTS = 10  # minimum number of points to consider as a cluster
+
+
+def _coordinate_columns(coordinates):
+    # returns the latitudes, longitudes and epoch timestamps of coordinate records or column arrays
+    if isinstance(coordinates, dict):
+        latitudes = np.asarray(coordinates['latitude'], dtype=np.float64)
+        longitudes = np.asarray(coordinates['longitude'], dtype=np.float64)
+        if 'timestamp_epoch' in coordinates:
+            timestamps = np.asarray(coordinates['timestamp_epoch'], dtype=np.int64)
+        else:
+            timestamps = np.asarray(coordinates['timestamp_UTC']).astype('datetime64[s]').astype(np.int64)
+    else:
+        latitudes = np.array([c.latitude for c in coordinates], dtype=np.float64)
+        longitudes = np.array([c.longitude for c in coordinates], dtype=np.float64)
+        timestamps = np.array([c.timestamp_epoch for c in coordinates], dtype=np.int64)
+    return latitudes, longitudes, timestamps
+
+
+class TimeWindowIndex(object):
+    '''
+    Index of time-ordered points by their projected UTM coordinates, where the neighbors of a point are
+    searched for only among the points within `eps_s` seconds of it.
+
+    :param coordinates: The timestamp-ordered coordinates with `latitude`, `longitude` and `timestamp_epoch`
+                        attributes or the column arrays returned by
+                        :py:meth:`tripkit.database.Database.load_coordinates_array`
+    :param eps_m:       The spatial neighborhood radius in meters
+    :param eps_s:       The temporal neighborhood radius in seconds
+
+    :type eps_m:        float, optional
+    :type eps_s:        int, optional
+    '''
+
+    def __init__(self, coordinates, eps_m=EPS_M, eps_s=EPS_S):
+        self.eps_m = eps_m
+        self.eps_s = eps_s
+        latitudes, longitudes, self.timestamps = _coordinate_columns(coordinates)
+        if np.any(np.diff(self.timestamps) < 0):
+            raise Exception("Coordinates must be ordered by timestamp for ST-DBSCAN clustering.")
+        self.eastings, self.northings, self.zone_num, self.zone_letter = geo.project_coordinates(coordinates)
+        self.scales = scale_factors(latitudes, longitudes, self.zone_num) if latitudes.size else np.empty(0)
+
+        # bounds of the points within the time window of each point
+        self.window_starts = np.searchsorted(self.timestamps, self.timestamps - eps_s, side='left')
+        self.window_ends = np.searchsorted(self.timestamps, self.timestamps + eps_s, side='right')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def region_query(self, p_idx):
+        '''
+        Returns the indexes of all points within distance `eps_m` and `eps_s` seconds of a point (including
+        itself) in ascending order.
+        '''
+        start, end = int(self.window_starts[p_idx]), int(self.window_ends[p_idx])
+        distances = np.hypot(
+            self.eastings[start:end] - self.eastings[p_idx], self.northings[start:end] - self.northings[p_idx]
+        )
+        distances /= self.scales[p_idx]
+        return np.flatnonzero(distances < self.eps_m) + start
+
+    def __repr__(self):
+        return (
+            f"<tripkit.process.clustering.stdbscan.TimeWindowIndex points={len(self)} "
+            f"eps_m={self.eps_m} eps_s={self.eps_s}>"
+        )
+
+
+def generate_clusters(index, labels, min_pts=MIN_PTS):
+    '''
+    Generator labeling the points of an index in time order, yielding the number and the member indexes
+    of each cluster as it is completed. Points that remain noise are labeled -1 once the generator is
+    exhausted.
+    '''
+    cluster_id = 0
+    for p_idx in range(len(index)):
+        # points already belonging to a cluster cannot be new seed points and are skipped
+        if labels[p_idx] != 0:
+            continue
+
+        neighbor_idxs = index.region_query(p_idx)
+        if len(neighbor_idxs) < min_pts:
+            labels[p_idx] = -1
+        else:
+            cluster_id += 1
+            member_idxs = grow_cluster(index, labels, p_idx, neighbor_idxs, cluster_id, min_pts)
+            yield cluster_id, member_idxs
+
+
+def detect_stops(coordinates, eps_m=EPS_M, eps_s=EPS_S, min_pts=MIN_PTS, min_stop_time_s=0):
+    '''
+    Generator of the stops detected within a user's coordinates by ST-DBSCAN, yielded as each cluster is
+    completed in time order of the cluster's first branch point.
+
+    :param coordinates:     The timestamp-ordered coordinates with `latitude`, `longitude` and
+                            `timestamp_epoch` attributes or the column arrays returned by
+                            :py:meth:`tripkit.database.Database.load_coordinates_array`
+    :param eps_m:           The spatial neighborhood radius in meters
+    :param eps_s:           The temporal neighborhood radius in seconds
+    :param min_pts:         The minimum number of neighbors (including the point itself) of a cluster's
+                            branch points
+    :param min_stop_time_s: The minimum duration in seconds of a stop
+
+    :type eps_m:            float, optional
+    :type eps_s:            int, optional
+    :type min_pts:          int, optional
+    :type min_stop_time_s:  int, optional
+
+    :rtype: generator of :py:class:`tripkit.process.clustering.models.Stop`
+    '''
+    if not isinstance(coordinates, dict):
+        coordinates = list(coordinates)
+    index = TimeWindowIndex(coordinates, eps_m=eps_m, eps_s=eps_s)
+    labels = np.zeros(len(index), dtype=np.int64)
+    for cluster_id, member_idxs in generate_clusters(index, labels, min_pts):
+        member_idxs = np.array(member_idxs, dtype=np.int64)
+        start_epoch = int(index.timestamps[member_idxs].min())
+        end_epoch = int(index.timestamps[member_idxs].max())
+        if end_epoch - start_epoch < min_stop_time_s:
+            continue
+        centroid = geo.Centroid(
+            float(index.eastings[member_idxs].mean()),
+            float(index.northings[member_idxs].mean()),
+            index.zone_num,
+            index.zone_letter,
+        )
+        yield Stop(
+            cluster_id=cluster_id,
+            start_epoch=start_epoch,
+            end_epoch=end_epoch,
+            centroid=centroid,
+            num_points=len(member_idxs),
+        )
+
+
+def run(coordinates, eps_m=EPS_M, eps_s=EPS_S, min_pts=MIN_PTS):
+    '''
+    Clusters coordinates with ST-DBSCAN, returning a label for each coordinate: -1 for noise or the
+    cluster number starting from 1. Each neighborhood query scans only the points within the time window,
+    so clustering runs in linear time with the length of the trace.
+
+    :param coordinates: The timestamp-ordered coordinates with `latitude`, `longitude` and `timestamp_epoch`
+                        attributes or the column arrays returned by
+                        :py:meth:`tripkit.database.Database.load_coordinates_array`
+    :param eps_m:       The spatial neighborhood radius in meters
+    :param eps_s:       The temporal neighborhood radius in seconds
+    :param min_pts:     The minimum number of neighbors (including the point itself) of a cluster's branch
+                        points
+
+    :type eps_m:        float, optional
+    :type eps_s:        int, optional
+    :type min_pts:      int, optional
+
+    :rtype: list of int
+    '''
+    if not isinstance(coordinates, dict):
+        coordinates = list(coordinates)
+    index = TimeWindowIndex(coordinates, eps_m=eps_m, eps_s=eps_s)
+    labels = np.zeros(len(index), dtype=np.int64)
+    num_clusters = sum(1 for _ in generate_clusters(index, labels, min_pts))
+    logger.info(f"ST-DBSCAN detected {num_clusters} clusters within {len(index)} points.")
+    return labels.tolist()
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 import pytz
 
 from .models import DailyGroups
+from tripkit import metrics
 from tripkit.models import DaySummary as LibraryDaySummary
 from tripkit.utils import geo
 
@@ -159,6 +160,7 @@ def wrap_for_tripkit(tz, complete_days):
     return tripkit_complete_days
 
 
+@metrics.PROCESS_SECONDS.time(algorithm='complete_days.canue.counter')
 def run(trips, timezone):
     if not trips:
         return None
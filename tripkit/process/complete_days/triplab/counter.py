@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from geopy import distance
 import pytz
 
+from tripkit import metrics
 from tripkit.models import DaySummary as LibraryDaySummary
 
 
@@ -195,6 +196,7 @@ def wrap_for_tripkit(tz, complete_days):
 
 
 # run above functions in sequence
+@metrics.PROCESS_SECONDS.time(algorithm='complete_days.triplab.counter')
 def run(trips, timezone):
     if not trips:
         return None
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # Kyle Fitzsimmons, 2019
 from .location_split import split_by_stop_locations
+from tripkit import metrics
 from tripkit.models import Trip as LibraryTrip, TripPoint as LibraryTripPoint
 from tripkit.utils import geo
 
@@ -82,7 +83,7 @@ def make_trips_diary(valid_segments, missing_segments):
     into continuous trip diary.
     '''
     if not missing_segments:
-        return valid_segments
+        return {'trips': valid_segments, 'missing': []}
 
     trips = []
     missing_iter = iter(missing_segments)
@@ -162,6 +163,7 @@ def wrap_for_tripkit(diary):
     return tripkit_trips
 
 
+@metrics.PROCESS_SECONDS.time(algorithm='trip_detection.canue.algorithm')
 def run(cfg, coordinates, locations):
     time_segments = split_by_time_gap(coordinates, period_s=cfg.TRIP_DETECTION_BREAK_INTERVAL_SECONDS)
     location_segments = split_by_stop_locations(
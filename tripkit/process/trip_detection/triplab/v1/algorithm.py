@@ -3,6 +3,8 @@
 import itertools
 import logging
 import utm
+
+from tripkit import metrics
 from .modules import labels, tools
 from .modules.trip_codes import trip_codes
 
@@ -479,6 +481,7 @@ def summarize(rows):
 
 
 # @tools.timeit
+@metrics.PROCESS_SECONDS.time(algorithm='trip_detection.triplab.v1.algorithm')
 def run(points, parameters):
     stations = metro_stations_utm(parameters['subway_stations'])
     points = tools.process_utm(points)
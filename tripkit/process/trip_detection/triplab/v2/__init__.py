@@ -1,2 +1,3 @@
 from . import algorithm
 from . import summarize
+from . import stats
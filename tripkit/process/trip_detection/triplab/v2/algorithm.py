@@ -1,66 +1,123 @@
 #!/usr/bin/env python
 # Kyle Fitzsimmons, 2015-2019
+from collections import namedtuple
 import copy
 import itertools
 import logging
 import math
+import numpy as np
 from shapely.geometry import Point, LineString
-import utm
 
-from tripkit.models import Trip as LibraryTrip, TripPoint as LibraryTripPoint
-from .models import GPSPoint, SubwayEntrance, SubwayRoute, MissingTrip, TripSegment, Trip
+from tripkit import cache, metrics
+from tripkit.models import Trip as LibraryTrip, TripArray, TripPoint as LibraryTripPoint
+from tripkit.utils import geo
+from .stats import StageRecorder, num_points
+from .models import GPSPoint, SubwayEntrance, SubwayEntranceIndex, SubwayRoute, MissingTrip, TripSegment, Trip
 from .trip_codes import TRIP_CODES
 
 
 logger = logging.getLogger('itinerum-tripkit.process.trip_detection.triplab.v2')
 
+# trips of the previous detection run used to resume detection: the first provides the context to re-detect
+# the second (the anchor trip) identically, which is followed by the last trip that may continue with new data
+INCREMENTAL_TRIPS = 3
+MISSING_TRIP_CODES = [code for label, code in TRIP_CODES.items() if label.startswith('missing trip')]
+
+
+def _routes_fingerprint(route_coordinates):
+    return cache.features_fingerprint([[r.route_id, list(r.coordinates)] for r in route_coordinates])
+
 
 # cast input data as objects
-def generate_subway_entrances(coordinates, feature_cache=None):
+def generate_subway_entrances(coordinates, feature_cache=None, zone=None):
     '''
-    Find UTM coordinates for subway stations entrances from lat/lon and yield objects.
+    Find UTM coordinates for subway stations entrances from lat/lon and yield objects. Entrances are projected
+    within the supplied UTM zone (e.g., a user's zone from :py:func:`tripkit.utils.geo.coordinates_zone`) so
+    distances to the user's points are measured in the same planar coordinate system.
     '''
-    if feature_cache:
-        entrances = feature_cache.get(['subway_entrances', 'algo.v2'])
-        if entrances:
+    # lists are fingerprinted once by the feature cache, other iterables (e.g., queries) on every call
+    if not isinstance(coordinates, list):
+        coordinates = list(coordinates)
+    zone_num, zone_letter = zone or (None, None)
+    if feature_cache is not None:
+        fingerprint = feature_cache.fingerprint(coordinates)
+        cache_key = ['subway_entrances', 'algo.v2', *fingerprint, zone_num, zone_letter]
+        entrances = feature_cache.get(cache_key)
+        if entrances is not None:
             return entrances
+    eastings, northings, _, _ = geo.project_utm(
+        [c.latitude for c in coordinates], [c.longitude for c in coordinates], zone_num, zone_letter
+    )
     entrances = []
-    for c in coordinates:
-        easting, northing, _, _ = utm.from_latlon(c.latitude, c.longitude)
+    for c, easting, northing in zip(coordinates, eastings.tolist(), northings.tolist()):
         entrances.append(SubwayEntrance(latitude=c.latitude, longitude=c.longitude, northing=northing, easting=easting))
-    feature_cache.set(['subway_entrances', 'algo.v2'], entrances)
+    if feature_cache is not None:
+        feature_cache.set(cache_key, entrances)
     return entrances
 
 
-def generate_subway_routes(route_coordinates, feature_cache=None):
+def generate_subway_entrances_index(entrances, buffer_m, feature_cache=None, zone=None):
+    '''
+    Build a grid index of the projected subway entrances with cells the size of the subway buffer distance.
+    The UTM zone the entrances were projected within is supplied to cache the index separately for each zone.
+    '''
+    zone_num, zone_letter = zone or (None, None)
+    if feature_cache is not None:
+        fingerprint = feature_cache.fingerprint(entrances)
+        cache_key = ['subway_entrances_index', 'algo.v2', *fingerprint, zone_num, zone_letter, buffer_m]
+        index = feature_cache.get(cache_key)
+        if index is not None:
+            return index
+    index = SubwayEntranceIndex(entrances, cell_size=buffer_m)
+    if feature_cache is not None:
+        feature_cache.set(cache_key, index)
+    return index
+
+
+def generate_subway_routes(route_coordinates, feature_cache=None, zone=None):
     ''' 
-    Find UTM coordinates for subway routes from lat/lon and yield LineString shape objects.
+    Find UTM coordinates for subway routes from lat/lon and yield LineString shape objects. Routes are
+    projected within the supplied UTM zone as for :py:func:`generate_subway_entrances`.
     '''
-    if feature_cache:
-        routes = feature_cache.get(['subway_routes', 'algo.v2'])
-        if routes:
+    if not isinstance(route_coordinates, list):
+        route_coordinates = list(route_coordinates)
+    zone_num, zone_letter = zone or (None, None)
+    if feature_cache is not None:
+        fingerprint = feature_cache.fingerprint(route_coordinates, _routes_fingerprint)
+        cache_key = ['subway_routes', 'algo.v2', *fingerprint, zone_num, zone_letter]
+        routes = feature_cache.get(cache_key)
+        if routes is not None:
             return routes
     routes = []
     for r in route_coordinates:
-        coordinates_utm = []
-        for c in r.coordinates:
-            easting, northing, _, _ = utm.from_latlon(c.latitude, c.longitude)
-            coordinates_utm.append((easting, northing))
+        eastings, northings, _, _ = geo.project_utm(
+            [c.latitude for c in r.coordinates], [c.longitude for c in r.coordinates], zone_num, zone_letter
+        )
+        coordinates_utm = list(zip(eastings.tolist(), northings.tolist()))
         routes.append(
             SubwayRoute(route_id=r.route_id,
                         coordinates=r.coordinates,
                         coordinates_utm=coordinates_utm,
                         linestring_utm=LineString(coordinates_utm)))
-    feature_cache.set(['subway_routes', 'algo.v2'], routes)
+    if feature_cache is not None:
+        feature_cache.set(cache_key, routes)
     return routes
 
 
 def generate_gps_points(coordinates):
     '''
-    Find UTM coordinates for user GPS points from lat/lon and yield objects.
+    Find UTM coordinates for user GPS points from lat/lon (or the projection stored in the cache database)
+    and yield objects. Coordinates can be supplied as database records or as the column arrays returned
+    by `Database.load_coordinates_array`.
     '''
-    for c in coordinates:
-        easting, northing, _, _ = utm.from_latlon(c.latitude, c.longitude)
+    if isinstance(coordinates, dict):
+        eastings, northings, _, _ = geo.project_coordinates(coordinates)
+        coordinates = iter_coordinate_arrays(coordinates)
+    else:
+        coordinates = list(coordinates)
+        eastings, northings, _, _ = geo.project_coordinates(coordinates)
+
+    for c, easting, northing in zip(coordinates, eastings.tolist(), northings.tolist()):
         yield GPSPoint(
             database_id=c.id,
             latitude=c.latitude,
@@ -159,6 +216,133 @@ def break_points_by_collection_pause(points, max_break_period=360):
         return []
 
 
+# vectorized cleaning and segmentation of points
+def preprocess_points(coordinates, cutoff=30, check_speed_kph=100, max_break_period=360):
+    '''
+    Vectorized equivalent of `generate_gps_points`, `filter_by_accuracy`, `filter_erroneous_distance` and
+    `break_points_by_collection_pause` over the coordinates as NumPy column arrays. GPS point objects are
+    only created for the points kept by the filters and are grouped into identical trip segments.
+    '''
+    if isinstance(coordinates, dict):
+        records = None
+        h_accuracies = coordinates['h_accuracy']
+        timestamps = coordinates['timestamp_UTC']
+    else:
+        records = list(coordinates)
+        coordinates = records
+        h_accuracies = np.array([c.h_accuracy for c in records], dtype=np.float64)
+        timestamps = np.array([c.timestamp_UTC for c in records], dtype='datetime64[us]')
+    eastings, northings, _, _ = geo.project_coordinates(coordinates)
+
+    # filter by accuracy then by erroneous distance with microsecond integer timestamps
+    indexes = np.flatnonzero(h_accuracies <= cutoff)
+    eastings, northings = eastings[indexes], northings[indexes]
+    timestamps_us = timestamps[indexes].astype('datetime64[us]').astype(np.int64)
+    kept = erroneous_distance_mask(eastings, northings, timestamps_us, check_speed_kph=check_speed_kph)
+    indexes, eastings, northings, timestamps_us = indexes[kept], eastings[kept], northings[kept], timestamps_us[kept]
+    if not len(indexes):
+        return []
+
+    # break into segments where the time between points is greater than the break period
+    periods = np.diff(timestamps_us) / 1e6
+    distances = _distances_m(np.diff(eastings), np.diff(northings))
+    breaks = [True] + (periods > max_break_period).tolist()
+    periods_before = [0] + periods.tolist()
+    distances_before = [0.0] + distances.tolist()
+
+    if records is None:
+        rows = iter_coordinate_arrays({key: coordinates[key][indexes] for key in CoordinateRow._fields})
+    else:
+        rows = (records[idx] for idx in indexes.tolist())
+    segments = []
+    group = -1
+    columns = zip(rows, eastings.tolist(), northings.tolist(), periods_before, distances_before, breaks)
+    for c, easting, northing, period_before, distance_before, is_break in columns:
+        p = GPSPoint(
+            database_id=c.id,
+            latitude=c.latitude,
+            longitude=c.longitude,
+            northing=northing,
+            easting=easting,
+            speed=c.speed,
+            h_accuracy=c.h_accuracy,
+            timestamp_UTC=c.timestamp_UTC,
+            period_before_seconds=period_before,
+            distance_before_meters=distance_before,
+        )
+        if is_break:
+            group += 1
+            segments.append(TripSegment(group=group, period_before_seconds=period_before, points=[p]))
+        else:
+            segments[-1].points.append(p)
+    return segments
+
+
+def _distances_m(delta_eastings, delta_northings):
+    # `float_power` squares with the C library's `pow` as for `distance_m` so distances are identical to the
+    # last bit, which numpy's `** 2` (a multiplication) does not guarantee
+    return np.sqrt(np.float_power(delta_eastings, 2) + np.float_power(delta_northings, 2))
+
+
+def erroneous_distance_mask(eastings, northings, timestamps_us, check_speed_kph=60, max_iterations=10):
+    '''
+    Returns the boolean mask of points kept by `filter_erroneous_distance`. Since each point is tested
+    against the last kept point, the mask is found by fixed-point iteration over all points at once: each
+    pass settles at least the points up to its first change and the result is identical to the sequential
+    filter. Points that have not settled within `max_iterations` passes are resolved sequentially.
+    '''
+    num_points = len(eastings)
+    kept = np.ones(num_points, dtype=bool)
+    if num_points < 3:
+        return kept
+
+    positions = np.arange(num_points)
+    middle = positions[1:-1]
+    settled = 0
+    for _ in range(max_iterations):
+        # index of the last kept point before each of the middle points (the first point is always kept)
+        last = np.maximum.accumulate(np.where(kept, positions, 0))[:-2]
+        distances_from_last = _distances_m(eastings[middle] - eastings[last], northings[middle] - northings[last])
+        seconds_since_last = (timestamps_us[middle] - timestamps_us[last]) / 1e6
+        distances_between_neighbors = _distances_m(
+            eastings[middle + 1] - eastings[last], northings[middle + 1] - northings[last]
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kph_since_last = (distances_from_last / seconds_since_last) * 3.6
+        dropped = (
+            (distances_from_last != 0)
+            & (seconds_since_last != 0)
+            & (kph_since_last >= check_speed_kph)
+            & (distances_between_neighbors < distances_from_last)
+        )
+
+        updated = np.ones(num_points, dtype=bool)
+        updated[1:-1] = ~dropped
+        changed = np.flatnonzero(updated != kept)
+        if not len(changed):
+            return kept
+        kept = updated
+        settled = changed[0]
+
+    # resolve the remaining points sequentially after the last settled point
+    eastings, northings, timestamps_us = eastings.tolist(), northings.tolist(), timestamps_us.tolist()
+    last = int(np.flatnonzero(kept[: settled + 1])[-1])
+    for idx in range(settled + 1, num_points - 1):
+        distance_from_last = math.sqrt((eastings[idx] - eastings[last]) ** 2 + (northings[idx] - northings[last]) ** 2)
+        seconds_since_last = (timestamps_us[idx] - timestamps_us[last]) / 1e6
+        kept[idx] = True
+        if distance_from_last and seconds_since_last:
+            kph_since_last = (distance_from_last / seconds_since_last) * 3.6
+            distance_between_neighbors = math.sqrt(
+                (eastings[idx + 1] - eastings[last]) ** 2 + (northings[idx + 1] - northings[last]) ** 2
+            )
+            if kph_since_last >= check_speed_kph and distance_between_neighbors < distance_from_last:
+                kept[idx] = False
+        if kept[idx]:
+            last = idx
+    return kept
+
+
 def initialize_trips(segments):
     '''
     Begin trip contruction by creating a new trip for each segment.
@@ -508,6 +692,34 @@ def annotate_trips(trips):
 
 
 # helper functions
+CoordinateRow = namedtuple('CoordinateRow', ['id', 'latitude', 'longitude', 'speed', 'h_accuracy', 'timestamp_UTC'])
+
+
+def iter_coordinate_arrays(arrays):
+    '''
+    Yield rows with coordinate record attributes from a dictionary of coordinate column arrays.
+    '''
+    columns = zip(
+        arrays['id'].tolist(),
+        arrays['latitude'].tolist(),
+        arrays['longitude'].tolist(),
+        arrays['speed'].tolist(),
+        arrays['h_accuracy'].tolist(),
+        arrays['timestamp_UTC'].tolist(),
+    )
+    for row in columns:
+        yield CoordinateRow(*row)
+
+
+def num_coordinates(coordinates):
+    '''
+    Returns the number of coordinates supplied as database records or as column arrays.
+    '''
+    if isinstance(coordinates, dict):
+        return len(coordinates['latitude'])
+    return len(coordinates)
+
+
 def distance_m(point1, point2):
     '''
     Returns the distance between two points in meters.
@@ -519,13 +731,34 @@ def distance_m(point1, point2):
 
 def points_intersect(points, test_point, buffer_m=200):
     '''
-    Returns the first point that intersects with buffer (m) of a test point.
+    Returns the first point that intersects with buffer (m) of a test point. Points can be supplied as
+    a list or as a `SubwayEntranceIndex` to only test the points in nearby grid cells.
     '''
+    if isinstance(points, SubwayEntranceIndex):
+        return points.first_within(test_point, buffer_m)
     for point in points:
         if distance_m(point, test_point) <= buffer_m:
             return point
 
 
+def detected_trips(trips):
+    '''
+    Returns the trips detected from GPS points (i.e., not missing trips) from a list of TripKit trips.
+    '''
+    return [t for t in trips if t.trip_code not in MISSING_TRIP_CODES and t.points]
+
+
+def is_same_point(point1, point2):
+    '''
+    Returns whether two points have the same position and timestamp.
+    '''
+    return (point1.timestamp_UTC, point1.latitude, point1.longitude) == (
+        point2.timestamp_UTC,
+        point2.latitude,
+        point2.longitude,
+    )
+
+
 def wrap_for_tripkit(detected_trips, include_segments=False):
     '''
     Return result as the same type of object (list of TripPoints) as returned by `tripkit.database`.
@@ -533,22 +766,19 @@ def wrap_for_tripkit(detected_trips, include_segments=False):
     tripkit_trips = []
     for trip_num, detected_trip in enumerate(detected_trips, start=1):
         if isinstance(detected_trip, Trip):
-            trip = LibraryTrip(num=trip_num, trip_code=detected_trip.code)
-            trip_distance = 0.0
-            for segment in detected_trip.segments:
-                for point in segment.points:
-                    trip_distance += point.distance_before_meters
-                    p = LibraryTripPoint(
-                        database_id=point.database_id,
-                        latitude=point.latitude,
-                        longitude=point.longitude,
-                        h_accuracy=point.h_accuracy,
-                        distance_before=point.distance_before_meters,
-                        trip_distance=trip_distance,
-                        period_before=point.period_before_seconds,
-                        timestamp_UTC=point.timestamp_UTC,
-                    )
-                    trip.points.append(p)
+            points = [point for segment in detected_trip.segments for point in segment.points]
+            distances_before = [point.distance_before_meters for point in points]
+            array = TripArray(
+                database_id=[point.database_id for point in points],
+                latitude=[point.latitude for point in points],
+                longitude=[point.longitude for point in points],
+                h_accuracy=[point.h_accuracy for point in points],
+                distance_before=distances_before,
+                trip_distance=list(itertools.accumulate(distances_before)),
+                period_before=[point.period_before_seconds for point in points],
+                timestamp_UTC=[point.timestamp_UTC for point in points],
+            )
+            trip = LibraryTrip.from_array(trip_num, detected_trip.code, array)
             if include_segments:
                 trip.segments = detected_trip.segments
             tripkit_trips.append(trip)
@@ -583,43 +813,103 @@ def wrap_for_tripkit(detected_trips, include_segments=False):
 
 # main
 # @profile
-def run(coordinates, parameters, user_locations=None, include_segments=False, feature_cache=None):
-    if not coordinates or len(coordinates) < 2:
+@metrics.PROCESS_SECONDS.time(algorithm='trip_detection.triplab.v2.algorithm')
+def run(coordinates, parameters, user_locations=None, include_segments=False, feature_cache=None, stats=None):
+    '''
+    Detects a user's trips from their timestamp-ordered coordinates.
+
+    :param coordinates:      The user's coordinates as database records or as the column arrays returned by
+                             :py:meth:`tripkit.database.Database.load_coordinates_array`
+    :param parameters:       The trip detection parameters
+    :param user_locations:   The user's activity locations for filtering single points
+    :param include_segments: Supply `True` to attach the detected segments to each trip as `segments`
+    :param feature_cache:    Cache of the survey-wide subway features, defaults to the process-wide cache
+    :param stats:            Opt-in stats object with a `record` method (e.g.,
+                             :py:class:`tripkit.process.trip_detection.triplab.v2.stats.DetectionStats`) or a
+                             callback with the same arguments to receive the wall time, points in and out and net
+                             allocated memory blocks of each stage. Generators of points are consumed within
+                             each stage so stages are timed separately.
+
+    :type stats:             :py:class:`tripkit.process.trip_detection.triplab.v2.stats.DetectionStats`, optional
+
+    :rtype: list of :py:class:`tripkit.models.Trip`
+    '''
+    if not coordinates or num_coordinates(coordinates) < 2:
         return []
+    if feature_cache is None:
+        feature_cache = cache.get_default()
+
+    # process points as structs and cast position from lat/lng to UTM, with the subway features projected
+    # within the UTM zone of the user's coordinates
+    zone = geo.coordinates_zone(coordinates)
+    subway_entrances = generate_subway_entrances(parameters['subway_entrances'], feature_cache, zone=zone)
+    subway_entrances_index = generate_subway_entrances_index(
+        subway_entrances, parameters['subway_buffer_meters'], feature_cache, zone=zone
+    )
+    subway_routes = generate_subway_routes(parameters.get('subway_routes', []), feature_cache, zone=zone)
+    if feature_cache is not None:
+        feature_cache.save()
+
+    # clean noisy and duplicate points and break trips into atomic trip segments, by default as a chain of
+    # point generators or over column arrays when opted in
+    recorder = StageRecorder(stats)
+    if parameters.get('vectorized_preprocessing', False):
+        with recorder.stage('preprocess_points', num_coordinates(coordinates)) as stage:
+            segments = preprocess_points(
+                coordinates,
+                cutoff=parameters['accuracy_cutoff_meters'],
+                check_speed_kph=100,
+                max_break_period=parameters['break_interval_seconds'],
+            )
+            stage.count(segments)
+    else:
+        with recorder.stage('generate_gps_points', num_coordinates(coordinates)) as stage:
+            gps_points = stage.collect(generate_gps_points(coordinates))
+        with recorder.stage('filter_by_accuracy', stage.points_out) as stage:
+            high_accuracy_points = stage.collect(
+                filter_by_accuracy(gps_points, cutoff=parameters['accuracy_cutoff_meters'])
+            )
+        with recorder.stage('filter_erroneous_distance', stage.points_out) as stage:
+            cleaned_points = stage.collect(filter_erroneous_distance(high_accuracy_points, check_speed_kph=100))
+        with recorder.stage('break_points_by_collection_pause', stage.points_out) as stage:
+            segments = break_points_by_collection_pause(
+                cleaned_points, max_break_period=parameters['break_interval_seconds']
+            )
+            stage.count(segments)
 
-    # process points as structs and cast position from lat/lng to UTM
-    subway_entrances = generate_subway_entrances(parameters['subway_entrances'], feature_cache)
-    subway_routes = generate_subway_routes(parameters['subway_routes'], feature_cache)
-    gps_points = generate_gps_points(coordinates)
-
-    # clean noisy and duplicate points
-    high_accuracy_points = filter_by_accuracy(gps_points, cutoff=parameters['accuracy_cutoff_meters'])
-    cleaned_points = filter_erroneous_distance(high_accuracy_points, check_speed_kph=100)
-
-    # break trips into atomic trip segments
-    segments = break_points_by_collection_pause(cleaned_points, max_break_period=parameters['break_interval_seconds'])
-
-    # start by considering every segment a trip
-    initial_trips = initialize_trips(segments)
+    with recorder.stage('stitching', stage.points_out) as stage:
+        # start by considering every segment a trip
+        initial_trips = initialize_trips(segments)
 
-    # apply rules to reconstitute full trips from segments when possible ('stitching')
-    subway_linked_trips = find_subway_connections(
-        initial_trips, subway_entrances, subway_routes, buffer_m=parameters['subway_buffer_meters']
-    )
-    velocity_linked_trips = find_velocity_connections(subway_linked_trips)
-    full_length_trips = filter_single_points(velocity_linked_trips, user_locations=user_locations)
+        # apply rules to reconstitute full trips from segments when possible ('stitching')
+        subway_linked_trips = find_subway_connections(
+            initial_trips, subway_entrances_index, subway_routes, buffer_m=parameters['subway_buffer_meters']
+        )
+        velocity_linked_trips = find_velocity_connections(subway_linked_trips)
+        full_length_trips = filter_single_points(velocity_linked_trips, user_locations=user_locations)
+        stage.count(full_length_trips)
 
     # find incidents where data about trips is missing
-    missing_trips = infer_missing_trips(
-        full_length_trips,
-        subway_entrances,
-        min_trip_m=250,
-        subway_buffer_m=parameters['subway_buffer_meters'],
-        cold_start_m=parameters['cold_start_distance']
-    )
-
-    trips = merge_trips(full_length_trips, missing_trips)
-    tripkit_trips = wrap_for_tripkit(annotate_trips(trips), include_segments)
+    with recorder.stage('infer_missing_trips', stage.points_out) as stage:
+        missing_trips = infer_missing_trips(
+            full_length_trips,
+            subway_entrances_index,
+            min_trip_m=250,
+            subway_buffer_m=parameters['subway_buffer_meters'],
+            cold_start_m=parameters['cold_start_distance']
+        )
+        stage.count(missing_trips)
+
+    merge_points_in = num_points(full_length_trips) + stage.points_out if recorder.enabled else None
+    with recorder.stage('merge_trips', merge_points_in) as stage:
+        trips = merge_trips(full_length_trips, missing_trips)
+        stage.count(trips)
+    with recorder.stage('annotate_trips', stage.points_out) as stage:
+        trips = stage.collect(annotate_trips(trips))
+        stage.count(trips)
+    with recorder.stage('wrap_for_tripkit', stage.points_out) as stage:
+        tripkit_trips = wrap_for_tripkit(trips, include_segments)
+        stage.count(tripkit_trips)
 
     logger.info("-------------------------------")
     logger.info("Num. segments: %d", len(segments))
@@ -627,5 +917,52 @@ def run(coordinates, parameters, user_locations=None, include_segments=False, fe
     logger.info("Num. trips (w/ velocity links): %d", len(velocity_linked_trips))
     logger.info("Num. full-length trips: %d", len(full_length_trips))
     logger.info("Num. missing trips: %d", len(missing_trips))
-    logger.info("Num. point rows: %d", sum([len(t.points) for t in tripkit_trips]))
+    logger.info("Num. point rows: %d", sum([t.num_points for t in tripkit_trips]))
     return tripkit_trips
+
+
+def resume_timestamp(previous_trips):
+    '''
+    Returns the timestamp of the first coordinate required by :py:func:`run_incremental` to resume trip
+    detection from a user's previously saved trips, or `None` when too few trips have been detected and
+    the full coordinates history should be processed.
+
+    :param previous_trips: The user's last saved trips, at least from the `INCREMENTAL_TRIPS`-last detected
+                           trip onward (see :py:meth:`tripkit.database.Database.tail_trip_num`)
+    '''
+    previous_detected_trips = detected_trips(previous_trips)
+    if len(previous_detected_trips) < INCREMENTAL_TRIPS:
+        return None
+    return previous_detected_trips[-INCREMENTAL_TRIPS].start_UTC
+
+
+def run_incremental(coordinates, parameters, previous_trips, user_locations=None, feature_cache=None, stats=None):
+    '''
+    Resumes trip detection for a user with new coordinates from the trips saved by a previous run. Trip
+    detection is run on the coordinates from :py:func:`resume_timestamp` onward, which begin at a trip
+    boundary (a collection pause longer than the break interval) with one trip of context before the anchor
+    trip. The anchor trip must be re-detected unchanged for the previous trips before it to remain valid,
+    otherwise the full coordinates history must be processed with :py:func:`run`.
+
+    :param coordinates:    The user's coordinates from :py:func:`resume_timestamp` onward
+    :param parameters:     The trip detection parameters as for :py:func:`run`
+    :param previous_trips: The user's last saved trips as supplied to :py:func:`resume_timestamp`
+    :param stats:          Opt-in stats object or callback as for :py:func:`run`
+
+    :rtype: tuple of the trips replacing the previous trips (numbered from the anchor trip) and the number of
+            the first replaced trip, or `None` when the full coordinates history must be processed
+    '''
+    previous_detected_trips = detected_trips(previous_trips)
+    if len(previous_detected_trips) < INCREMENTAL_TRIPS:
+        return None
+    anchor_trip = previous_detected_trips[-INCREMENTAL_TRIPS + 1]
+
+    trips = run(coordinates, parameters, user_locations=user_locations, feature_cache=feature_cache, stats=stats)
+    for idx, trip in enumerate(trips):
+        if trip.trip_code == anchor_trip.trip_code and is_same_point(trip.start, anchor_trip.start):
+            tail_trips = trips[idx:]
+            for trip_num, tail_trip in enumerate(tail_trips, start=anchor_trip.num):
+                tail_trip.num = trip_num
+            return tail_trips, anchor_trip.num
+    logger.info("Anchor trip not re-detected from previous trips, full trip detection required.")
+    return None
@@ -66,6 +66,49 @@ class SubwayEntrance:
         return f"<tripkit.process.trip_detection.triplab.v2.models.SubwayEntrance>"
 
 
+class SubwayEntranceIndex:
+    '''
+    Uniform grid of subway entrances by their UTM coordinates for finding entrances near a point
+    without testing every entrance. Entrances keep their original order so the first matching
+    entrance is the same as for a linear search.
+    '''
+
+    __slots__ = ['cell_size', 'cells']
+
+    def __init__(self, entrances, cell_size):
+        self.cell_size = max(float(cell_size), 1.0)
+        self.cells = {}
+        for idx, entrance in enumerate(entrances):
+            self.cells.setdefault(self._cell(entrance), []).append((idx, entrance))
+
+    def _cell(self, point):
+        return int(point.easting // self.cell_size), int(point.northing // self.cell_size)
+
+    def first_within(self, point, buffer_m):
+        '''
+        Returns the first entrance by original order within the buffer distance (m) of a point.
+        '''
+        cell_x, cell_y = self._cell(point)
+        span = math.ceil(buffer_m / self.cell_size)
+        first_idx, first_entrance = None, None
+        for x in range(cell_x - span, cell_x + span + 1):
+            for y in range(cell_y - span, cell_y + span + 1):
+                for idx, entrance in self.cells.get((x, y), []):
+                    if first_idx is not None and idx > first_idx:
+                        continue
+                    a = point.easting - entrance.easting
+                    b = point.northing - entrance.northing
+                    if math.sqrt(a ** 2 + b ** 2) <= buffer_m:
+                        first_idx, first_entrance = idx, entrance
+        return first_entrance
+
+    def __len__(self):
+        return sum(len(entrances) for entrances in self.cells.values())
+
+    def __repr__(self):
+        return f"<tripkit.process.trip_detection.triplab.v2.models.SubwayEntranceIndex cell_size={self.cell_size}>"
+
+
 class SubwayRoute:
     __slots__ = ['route_id', 'coordinates', 'coordinates_utm', 'linestring_utm']
 
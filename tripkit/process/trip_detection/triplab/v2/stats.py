@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# Kyle Fitzsimmons, 2019
+#
+# Opt-in instrumentation of the TRIP Lab v2 trip detection stages. Each stage reports its wall time,
+# the number of GPS points in and out and the net number of memory blocks allocated by the interpreter
+# (`sys.getallocatedblocks`) to a stats object or callback supplied to `algorithm.run`.
+from collections import OrderedDict
+import sys
+import time
+
+
+class DetectionStats(object):
+    '''
+    Aggregates the per-stage profiles of trip detection runs, such as for all users of a survey. Supply
+    the same object as the `stats` argument of :py:func:`tripkit.process.trip_detection.triplab.v2.algorithm.run`
+    for each user and read the totals from ``stages`` or :py:meth:`as_dict`.
+
+    :ivar stages: Totals of the number of calls, wall time (seconds), points in, points out and net allocated
+                  memory blocks for each stage in the order first run.
+    :vartype stages: OrderedDict
+    '''
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def record(self, stage, wall_s, points_in, points_out, allocated_blocks):
+        '''
+        Adds the profile of a single run of a stage to its totals.
+
+        :param stage:            The name of the detection stage.
+        :param wall_s:           The stage's wall time in seconds.
+        :param points_in:        The number of GPS points input to the stage.
+        :param points_out:       The number of GPS points output by the stage.
+        :param allocated_blocks: The net number of memory blocks allocated during the stage.
+        '''
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = {'calls': 0, 'wall_s': 0.0, 'points_in': 0, 'points_out': 0, 'allocated_blocks': 0}
+            self.stages[stage] = totals
+        totals['calls'] += 1
+        totals['wall_s'] += wall_s
+        totals['points_in'] += points_in
+        totals['points_out'] += points_out
+        totals['allocated_blocks'] += allocated_blocks
+
+    @property
+    def wall_s(self):
+        return sum(totals['wall_s'] for totals in self.stages.values())
+
+    def as_dict(self):
+        '''
+        Returns the stage totals with each stage's share of the total wall time.
+        '''
+        total_wall_s = self.wall_s
+        stages = OrderedDict()
+        for stage, totals in self.stages.items():
+            stages[stage] = dict(totals, wall_pct=100 * totals['wall_s'] / total_wall_s if total_wall_s else 0.0)
+        return stages
+
+    def clear(self):
+        self.stages.clear()
+
+    def __repr__(self):
+        return f"<tripkit.process.trip_detection.triplab.v2.stats.DetectionStats stages={len(self.stages)}>"
+
+
+def num_points(items):
+    '''
+    Returns the number of GPS points within a list of segments, v2 trips, missing trips (as their start and
+    end points) or TripKit trips.
+    '''
+    total = 0
+    for item in items:
+        if hasattr(item, 'trip_code'):
+            total += item.num_points
+        elif hasattr(item, 'segments'):
+            total += sum(len(segment.points) for segment in item.segments)
+        elif hasattr(item, 'next_trip_start'):
+            total += 2
+        else:
+            total += len(item.points)
+    return total
+
+
+class _Stage(object):
+    __slots__ = ['recorder', 'name', 'points_in', 'points_out', 'started', 'started_blocks']
+
+    def __init__(self, recorder, name, points_in):
+        self.recorder = recorder
+        self.name = name
+        self.points_in = points_in
+        self.points_out = None
+
+    def __enter__(self):
+        self.started_blocks = sys.getallocatedblocks()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_s = time.perf_counter() - self.started
+        if exc_type is None:
+            allocated_blocks = sys.getallocatedblocks() - self.started_blocks
+            self.recorder.report(self.name, wall_s, self.points_in, self.points_out, allocated_blocks)
+
+    def collect(self, points):
+        '''
+        Consumes a generator of points (or trips) within the stage so it is timed separately from the stages
+        after it.
+        '''
+        try:
+            points = list(points)
+        except RuntimeError as e:
+            # the erroneous distance filter raises StopIteration (converted to a RuntimeError by PEP 479) when
+            # all points have been filtered (see `break_points_by_collection_pause`), other errors are raised
+            if not isinstance(e.__cause__, StopIteration):
+                raise
+            points = []
+        self.points_out = len(points)
+        return points
+
+    def count(self, items):
+        self.points_out = num_points(items)
+
+
+class _NullStage(object):
+    __slots__ = []
+    points_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def collect(self, points):
+        return points
+
+    def count(self, items):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageRecorder(object):
+    '''
+    Times the stages of a single detection run and reports them to a stats object with a `record` method
+    (such as :py:class:`DetectionStats`) or to a callback with the same arguments. Without stats, stages
+    are not timed and generators of points are left unconsumed.
+    '''
+
+    def __init__(self, stats=None):
+        self.stats = stats
+        self.enabled = stats is not None
+
+    def stage(self, name, points_in=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, points_in)
+
+    def report(self, stage, wall_s, points_in, points_out, allocated_blocks):
+        record = getattr(self.stats, 'record', self.stats)
+        record(stage, wall_s, points_in or 0, points_out or 0, allocated_blocks)
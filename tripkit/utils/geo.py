@@ -2,6 +2,7 @@
 # Based upon GERT 1.2 (2016-06-03): GIS-based Episode Reconstruction Toolkit
 # Ported to itinerum-tripkit by Kyle Fitzsimmons, 2019
 import math
+import numpy as np
 import utm
 
 
@@ -29,6 +30,91 @@ class Centroid(object):
         return self._latlon[1]
 
 
+def project_utm(latitudes, longitudes, zone_num=None, zone_letter=None):
+    '''
+    Return the UTM eastings and northings for arrays of latitudes and longitudes projected in a single batch.
+    Unless supplied, the UTM zone is selected once from the first coordinate so that all points (e.g., a
+    user's full trace) share the same planar coordinate system.
+
+    :returns: Tuple of (eastings array, northings array, zone number, zone letter)
+    '''
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    if not latitudes.size:
+        return np.empty(0), np.empty(0), zone_num, zone_letter
+    if zone_num is None:
+        zone_num = utm.latlon_to_zone_number(latitudes[0], longitudes[0])
+    if zone_letter is None:
+        zone_letter = utm.latitude_to_zone_letter(latitudes[0])
+    eastings, northings, _, _ = utm.from_latlon(
+        latitudes, longitudes, force_zone_number=zone_num, force_zone_letter=zone_letter
+    )
+    return eastings, northings, zone_num, zone_letter
+
+
+def _coordinate_columns(coordinates):
+    # returns the latitudes, longitudes and any stored projection of coordinate records or column arrays
+    if isinstance(coordinates, dict):
+        latitudes, longitudes = coordinates['latitude'], coordinates['longitude']
+        eastings, northings = coordinates.get('easting'), coordinates.get('northing')
+        zone_nums, zone_letters = coordinates.get('zone_num'), coordinates.get('zone_letter')
+    else:
+        latitudes = [c.latitude for c in coordinates]
+        longitudes = [c.longitude for c in coordinates]
+        eastings = [getattr(c, 'easting', None) for c in coordinates]
+        northings = [getattr(c, 'northing', None) for c in coordinates]
+        zone_nums = [getattr(c, 'zone_num', None) for c in coordinates]
+        zone_letters = [getattr(c, 'zone_letter', None) for c in coordinates]
+    return latitudes, longitudes, eastings, northings, zone_nums, zone_letters
+
+
+def _stored_zone(zone_nums, zone_letters):
+    # returns the UTM zone stored in the cache database when shared by every coordinate
+    if zone_nums is None or zone_letters is None:
+        return None, None
+    zones = set(zip(zone_nums, zone_letters))
+    if len(zones) == 1:
+        zone_num, zone_letter = zones.pop()
+        if zone_num is not None and zone_letter is not None:
+            return int(zone_num), zone_letter
+    return None, None
+
+
+def coordinates_zone(coordinates):
+    '''
+    Return the UTM zone that :py:func:`project_coordinates` projects a sequence of coordinate records or
+    a dictionary of coordinate column arrays within, so other features (e.g., subway entrances) can be
+    projected into the same planar coordinate system.
+
+    :returns: Tuple of (zone number, zone letter), or (None, None) without coordinates
+    '''
+    latitudes, longitudes, _, _, zone_nums, zone_letters = _coordinate_columns(coordinates)
+    zone_num, zone_letter = _stored_zone(zone_nums, zone_letters)
+    if zone_num is None and len(latitudes):
+        zone_num = utm.latlon_to_zone_number(latitudes[0], longitudes[0])
+        zone_letter = utm.latitude_to_zone_letter(latitudes[0])
+    return zone_num, zone_letter
+
+
+def project_coordinates(coordinates):
+    '''
+    Return the UTM eastings and northings for a sequence of coordinate records or a dictionary of coordinate
+    column arrays. Projected values stored in the cache database are used when available for every coordinate
+    within a single zone, otherwise the coordinates are projected in a batch within the stored zone or the
+    zone of the first coordinate.
+
+    :returns: Tuple of (eastings array, northings array, zone number, zone letter)
+    '''
+    latitudes, longitudes, eastings, northings, zone_nums, zone_letters = _coordinate_columns(coordinates)
+    zone_num, zone_letter = _stored_zone(zone_nums, zone_letters)
+    if zone_num is not None and eastings is not None and northings is not None:
+        eastings = np.asarray(eastings, dtype=np.float64)
+        northings = np.asarray(northings, dtype=np.float64)
+        if not (np.isnan(eastings).any() or np.isnan(northings).any()):
+            return eastings, northings, zone_num, zone_letter
+    return project_utm(latitudes, longitudes, zone_num, zone_letter)
+
+
 def duration_s(coordinate1, coordinate2):
     '''
     Return the duration in seconds between two coordinate records.
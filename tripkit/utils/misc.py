@@ -2,9 +2,12 @@
 # Kyle Fitzsimmons, 2018-2019
 from datetime import date, datetime
 import functools
+import hashlib
 import importlib
+import json
 import logging
 import os
+from peewee import BaseQuery
 import platform
 import uuid
 import time
@@ -28,6 +31,22 @@ def json_serialize(obj):
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
 
+# hash algorithm parameters to detect when they change between processing runs; locations such as
+# subway entrances are hashed by their coordinates
+def parameters_hash(parameters):
+    def _hashable(value):
+        if isinstance(value, dict):
+            return {str(k): _hashable(v) for k, v in value.items()}
+        if hasattr(value, 'latitude') and hasattr(value, 'longitude'):
+            return [value.latitude, value.longitude]
+        if isinstance(value, (list, tuple, BaseQuery)):
+            return [_hashable(v) for v in value]
+        return value
+
+    encoded = json.dumps(_hashable(parameters or {}), sort_keys=True, default=json_serialize)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
 def os_is_windows():
     return platform.system() == 'Windows'
 
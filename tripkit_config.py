@@ -4,6 +4,11 @@
 
 # filename for the itinerum-cli database
 DATABASE_FN = 'itinerum.sqlite'
+# optional SQLite performance profile: "bulk_load", "analysis" or "auto" to switch from
+# bulk loading during setup to analysis afterwards. Profiles permanently switch the
+# cache database to write-ahead logging and "bulk_load" disables synchronous writes
+# while loading, so SQLite's defaults are kept unless enabled
+# DATABASE_PROFILE = 'auto'
 
 # path of raw data directory exported from Itinerum platform or Qstarz
 INPUT_DATA_DIR = './input/itinerum-csv'